@@ -0,0 +1,396 @@
+"""
+This is responsible for choosing a move for the side to move of a GameState:
+	- negamax search with alpha-beta pruning and iterative deepening
+	- quiescence search at the leaves: captures only, with stand-pat, delta pruning and static exchange evaluation
+	  (GameState.staticExchange) to skip losing captures and order the rest
+	- a fixed size transposition table (bounded memory, depth-preferred replacement)
+	- move ordering: transposition table move, captures by MVV-LVA, killer moves, history heuristic; without a
+	  transposition table move the quiet moves are only generated if no capture cuts the node off; captures that
+	  lose material by static exchange are tried after the killer moves
+	- stops on a wall clock deadline and reports nodes, nodes/sec, depth reached and principal variation
+"""
+
+import time
+
+import ChessEngine
+import ChessEvaluation
+
+CHECKMATE = 100000 # score of being checkmated at the root, mates further away score closer to 0
+STALEMATE = 0
+MATE_BOUND = CHECKMATE - 1000 # any |score| above this is a mate score
+INFINITY = CHECKMATE + 1
+MAX_DEPTH = 64
+
+#piece values for move ordering (MVV-LVA), the evaluation itself is in ChessEvaluation
+PIECE_VALUES = {'K': 0, 'Q': 900, 'R': 500, 'B': 330, 'N': 320, 'P': 100, '-': 0}
+
+#move ordering keys of the quiet moves and the captures losing material (between the killers and history)
+KILLER_ORDER = (90000, 80000)
+LOSING_CAPTURE_ORDER = 75000
+CAPTURE_ORDER = 100000
+
+#a capture is skipped by the quiescence search when even winning the captured piece plus this margin can't
+#bring the score up to alpha
+DELTA_MARGIN = 200
+#plies the quiescence search goes below the leaves of the main search, past that it stands pat even in check ->
+#a run of checks and evasions can't keep a search without a time limit going
+MAX_QUIESCENCE_PLY = 16
+
+#bound stored with a transposition table score
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class TranspositionTable():
+	'''
+	size is the number of entries (rounded down to a power of two). The table is preallocated so its memory
+	never grows: an entry is a slot in each of the parallel lists below, picked by the low bits of the key.
+	A slot is replaced when it is empty, left over from an earlier search, or searched less deep than the new entry.
+	'''
+	def __init__(self, size=1 << 16):
+		size = 1 << max(size.bit_length() - 1, 0)
+		self.mask = size - 1
+		self.keys = [None] * size
+		self.depths = [0] * size
+		self.scores = [0] * size
+		self.bounds = [EXACT] * size
+		self.moveIds = [None] * size
+		self.ages = [0] * size
+		self.age = 0
+
+	def __len__(self):
+		return self.mask + 1
+
+	def clear(self):
+		self.__init__(len(self))
+
+	'''
+	Called at the start of every search so that entries of earlier searches get replaced first.
+	'''
+	def newSearch(self):
+		self.age += 1
+
+	def probe(self, key):
+		i = key & self.mask
+		if self.keys[i] != key:
+			return None
+		return self.depths[i], self.scores[i], self.bounds[i], self.moveIds[i]
+
+	def store(self, key, depth, score, bound, moveId):
+		i = key & self.mask
+		if self.keys[i] is not None and self.keys[i] != key and self.ages[i] == self.age and self.depths[i] > depth:
+			return # keep the deeper entry of this search
+		if self.keys[i] == key and moveId is None:
+			moveId = self.moveIds[i] # don't forget the best move of a shallower search of the same position
+		self.keys[i] = key
+		self.depths[i] = depth
+		self.scores[i] = score
+		self.bounds[i] = bound
+		self.moveIds[i] = moveId
+		self.ages[i] = self.age
+
+
+class SearchTimeout(Exception):
+	pass
+
+
+class SearchResult():
+	def __init__(self, bestMove, score, depth, nodes, seconds, pv):
+		self.bestMove = bestMove
+		self.score = score # centipawns from the point of view of the side to move
+		self.depth = depth
+		self.nodes = nodes
+		self.seconds = seconds
+		self.nps = nodes / seconds if seconds > 0 else 0.0
+		self.pv = pv # principal variation: list of moves starting with bestMove
+
+	def __repr__(self):
+		return 'SearchResult(depth=%d, score=%d, nodes=%d, nps=%.0f, pv=%s)' % (
+			self.depth, self.score, self.nodes, self.nps, ' '.join(move.getChessNotation() for move in self.pv))
+
+
+class Searcher():
+	def __init__(self, ttSize=1 << 16, stagedMoves=True, quiescence=True, seePruning=True):
+		self.tt = TranspositionTable(ttSize)
+		self.stagedMoves = stagedMoves # nodes without a transposition table move use GameState.generateStagedMoves
+		self.quiescence = quiescence # resolve the captures at the leaves instead of evaluating them as they stand
+		self.seePruning = seePruning # quiescence skips captures losing material by static exchange
+		self.nodes = 0
+		self.deadline = None
+		self.stopRequested = False
+
+	'''
+	Ask a running search (e.g. on another thread) to stop as soon as possible. The last completed depth is returned.
+	'''
+	def stop(self):
+		self.stopRequested = True
+
+	'''
+	Search the position with iterative deepening until maxDepth is done or timeLimit seconds have passed.
+	onIteration(result) is called after every completed depth. Returns the SearchResult of the deepest
+	completed iteration (None if the side to move has no moves).
+	'''
+	def search(self, gs, maxDepth=MAX_DEPTH, timeLimit=None, onIteration=None):
+		start = time.perf_counter()
+		self.deadline = start + timeLimit if timeLimit is not None else None
+		self.stopRequested = False
+		self.nodes = 0
+		self.killers = [[None, None] for _ in range(MAX_DEPTH + 1)]
+		self.history = {}
+		self.tt.newSearch()
+		checkMate, staleMate = gs.checkMate, gs.staleMate # the search shouldn't change the game's result flags
+		rootMoves = gs.getValidMoves()
+		result = None
+		if rootMoves:
+			stackLength = len(gs.undoStack)
+			for depth in range(1, maxDepth + 1):
+				try:
+					score = self.negamax(gs, depth, -INFINITY, INFINITY, 0)
+				except SearchTimeout:
+					while len(gs.undoStack) > stackLength: # unwind the moves of the interrupted search
+						gs.popMove()
+					break
+				pv = self.principalVariation(gs, depth)
+				if not pv: # can only happen if the root entry was overwritten
+					pv = [rootMoves[0]]
+				result = SearchResult(pv[0], score, depth, self.nodes, time.perf_counter() - start, pv)
+				if onIteration is not None:
+					onIteration(result)
+				if abs(score) > MATE_BOUND: # found a forced mate, deeper searches won't change it
+					break
+			if result is None: # not even depth 1 finished in time
+				result = SearchResult(rootMoves[0], 0, 0, self.nodes, time.perf_counter() - start, [rootMoves[0]])
+		gs.checkMate, gs.staleMate = checkMate, staleMate
+		return result
+
+	def negamax(self, gs, depth, alpha, beta, ply):
+		self.nodes += 1
+		if self.nodes & 1023 == 0 and (self.stopRequested or
+									   (self.deadline is not None and time.perf_counter() > self.deadline)):
+			raise SearchTimeout()
+
+		key = gs.zobristKey
+		entry = self.tt.probe(key)
+		ttMoveId = None
+		if entry is not None:
+			ttDepth, ttScore, ttBound, ttMoveId = entry
+			if ttDepth >= depth and ply > 0:
+				ttScore = scoreFromTable(ttScore, ply)
+				if ttBound == EXACT:
+					return ttScore
+				if ttBound == LOWER and ttScore >= beta:
+					return ttScore
+				if ttBound == UPPER and ttScore <= alpha:
+					return ttScore
+
+		if depth == 0:
+			if self.quiescence:
+				return self.quiescenceSearch(gs, alpha, beta, ply)
+			return ChessEvaluation.evaluate(gs)
+
+		alphaOriginal = alpha
+		bestScore = -INFINITY
+		bestMove = None
+		for move in self.orderedMoves(gs, ttMoveId, ply):
+			gs.pushMove(move)
+			score = -self.negamax(gs, depth - 1, -beta, -alpha, ply + 1)
+			gs.popMove()
+			if score > bestScore:
+				bestScore = score
+				bestMove = move
+				if score > alpha:
+					alpha = score
+					if alpha >= beta:
+						if move.pieceCaptured == '--' and move.promotion is None: # quiet move that refuted this line
+							self.rememberCutoff(move, depth, ply)
+						break
+
+		if bestMove is None: # no legal move
+			return -CHECKMATE + ply if gs.inCheck() else STALEMATE
+
+		if bestScore <= alphaOriginal:
+			bound = UPPER
+		elif bestScore >= beta:
+			bound = LOWER
+		else:
+			bound = EXACT
+		self.tt.store(key, depth, scoreToTable(bestScore, ply), bound, bestMove.moveId)
+		return bestScore
+
+	'''
+	Search only the captures and promotions until the position is quiet, so the leaves aren't evaluated in the
+	middle of an exchange. The side to move may stand pat on the static evaluation (unless in check, then every
+	evasion is searched, up to MAX_QUIESCENCE_PLY). Captures that can't reach alpha even winning the piece (delta
+	pruning) and, with seePruning, captures losing material by static exchange are skipped; the rest are searched
+	best exchange first. quiescencePly counts the plies below the main search.
+	'''
+	def quiescenceSearch(self, gs, alpha, beta, ply, quiescencePly=0):
+		self.nodes += 1
+		if self.nodes & 1023 == 0 and (self.stopRequested or
+									   (self.deadline is not None and time.perf_counter() > self.deadline)):
+			raise SearchTimeout()
+
+		if quiescencePly >= MAX_QUIESCENCE_PLY:
+			return ChessEvaluation.evaluate(gs)
+		if gs.inCheck():
+			bestScore = -INFINITY
+			for move in self.orderedMoves(gs, None, ply):
+				gs.pushMove(move)
+				score = -self.quiescenceSearch(gs, -beta, -alpha, ply + 1, quiescencePly + 1)
+				gs.popMove()
+				if score > bestScore:
+					bestScore = score
+					if score > alpha:
+						alpha = score
+						if alpha >= beta:
+							break
+			return bestScore if bestScore > -INFINITY else -CHECKMATE + ply
+
+		standPat = ChessEvaluation.evaluate(gs)
+		if standPat >= beta:
+			return standPat
+		if standPat > alpha:
+			alpha = standPat
+		captures = []
+		for move in gs.generateStagedMoves(quiets=False):
+			if move.promotion is None and standPat + ChessEngine.SEE_VALUES[move.pieceCaptured[1]] + DELTA_MARGIN <= alpha:
+				continue
+			exchange = gs.staticExchange(move)
+			if exchange < 0 and self.seePruning:
+				continue
+			captures.append((exchange, move))
+		captures.sort(key=lambda capture: capture[0], reverse=True)
+
+		bestScore = standPat
+		for _, move in captures:
+			gs.pushMove(move)
+			score = -self.quiescenceSearch(gs, -beta, -alpha, ply + 1, quiescencePly + 1)
+			gs.popMove()
+			if score > bestScore:
+				bestScore = score
+				if score > alpha:
+					alpha = score
+					if alpha >= beta:
+						break
+		return bestScore
+
+	'''
+	The moves of a node best-first, as an iterator the search can stop at a cutoff. With a transposition table
+	move every move is generated and sorted. Without one the captures and promotions of the staged generator are
+	sorted and searched before a single quiet move is generated, so when one of them refutes the line the quiet
+	moves are never made.
+	'''
+	def orderedMoves(self, gs, ttMoveId, ply):
+		if ttMoveId is not None or not self.stagedMoves:
+			return iter(self.orderMoves(gs, gs.getValidMoves(), ttMoveId, ply))
+		return self.stagedOrder(gs, ply)
+
+	def stagedOrder(self, gs, ply):
+		staged = gs.generateStagedMoves()
+		tactical = []
+		firstQuiet = None
+		for move in staged:
+			if move.pieceCaptured == '--' and move.promotion is None:
+				firstQuiet = move
+				break
+			tactical.append(move)
+		moveOrder = self.moveOrder(gs, None, ply)
+		keys = [moveOrder(move) for move in tactical]
+		later = [] # captures losing material go after the killers, so with the quiet moves
+		for i in sorted(range(len(tactical)), key=keys.__getitem__, reverse=True):
+			if keys[i] >= CAPTURE_ORDER:
+				yield tactical[i]
+			else:
+				later.append(tactical[i])
+		if firstQuiet is not None: # resumed only after the captures were searched (and taken back)
+			later.append(firstQuiet)
+			later.extend(staged)
+		yield from sorted(later, key=moveOrder, reverse=True)
+
+	'''
+	Sort moves best-first: transposition table move, captures and promotions (most valuable victim, least valuable attacker),
+	killer moves of this ply, captures losing material by static exchange, then the other quiet moves by history score.
+	'''
+	def orderMoves(self, gs, moves, ttMoveId, ply):
+		return sorted(moves, key=self.moveOrder(gs, ttMoveId, ply), reverse=True)
+
+	'''
+	The sort key function of orderMoves. Only a capture by a piece worth more than its victim can lose material,
+	so the exchange is only evaluated for those.
+	'''
+	def moveOrder(self, gs, ttMoveId, ply):
+		killers = self.killers[ply] if ply <= MAX_DEPTH else (None, None)
+		history = self.history
+		def moveOrder(move):
+			if move.moveId == ttMoveId:
+				return 1000000
+			if move.pieceCaptured != '--' or move.promotion is not None: # a promotion wins the new piece
+				victim = PIECE_VALUES[move.pieceCaptured[1]]
+				if move.promotion is not None:
+					victim += PIECE_VALUES[move.promotion[1]]
+				attacker = PIECE_VALUES[move.pieceMoved[1]]
+				if attacker > victim:
+					exchange = gs.staticExchange(move)
+					if exchange < 0:
+						return LOSING_CAPTURE_ORDER + exchange // 10
+				return CAPTURE_ORDER + 10 * victim - attacker // 10
+			if move.moveId == killers[0]:
+				return KILLER_ORDER[0]
+			if move.moveId == killers[1]:
+				return KILLER_ORDER[1]
+			return history.get((move.pieceMoved, move.endRow, move.endCol), 0)
+		return moveOrder
+
+	def rememberCutoff(self, move, depth, ply):
+		if ply <= MAX_DEPTH and self.killers[ply][0] != move.moveId:
+			self.killers[ply][1] = self.killers[ply][0]
+			self.killers[ply][0] = move.moveId
+		historyKey = (move.pieceMoved, move.endRow, move.endCol)
+		self.history[historyKey] = min(self.history.get(historyKey, 0) + depth * depth, 70000)
+
+	'''
+	Follow the best moves stored in the transposition table from the current position.
+	'''
+	def principalVariation(self, gs, maxLength):
+		pv = []
+		seen = set()
+		while len(pv) < maxLength and gs.zobristKey not in seen:
+			seen.add(gs.zobristKey)
+			entry = self.tt.probe(gs.zobristKey)
+			if entry is None or entry[3] is None:
+				break
+			move = next((m for m in gs.getValidMoves() if m.moveId == entry[3]), None)
+			if move is None:
+				break
+			pv.append(move)
+			gs.pushMove(move)
+		for _ in pv:
+			gs.popMove()
+		return pv
+
+
+'''
+Mate scores are stored relative to the position (distance to mate from here) instead of the root.
+'''
+def scoreToTable(score, ply):
+	if score > MATE_BOUND:
+		return score + ply
+	if score < -MATE_BOUND:
+		return score - ply
+	return score
+
+
+def scoreFromTable(score, ply):
+	if score > MATE_BOUND:
+		return score - ply
+	if score < -MATE_BOUND:
+		return score + ply
+	return score
+
+
+'''
+Convenience wrapper for the game loop: best move for the side to move within timeLimit seconds.
+'''
+def findBestMove(gs, timeLimit=1.0, searcher=None):
+	searcher = searcher or Searcher()
+	result = searcher.search(gs, timeLimit=timeLimit)
+	return result.bestMove if result is not None else None
@@ -0,0 +1,793 @@
+"""
+Benchmarks for the chess engines. Run from the repository root, e.g.
+
+    python ChessBenchmark.py perft                          # time every engine on the position suite
+    python ChessBenchmark.py perft --save baseline.json     # record a throughput baseline
+    python ChessBenchmark.py perft --baseline baseline.json --threshold 0.2
+    python ChessBenchmark.py perft --engine ChessEngine ChessEngine-bitboard --position kiwipete cpw-3 cpw-4 --depth 4
+    python ChessBenchmark.py moves                          # memory and allocation cost of Move objects
+    python ChessBenchmark.py eval                           # incremental evaluation against a full recompute
+    python ChessBenchmark.py pieces                         # pseudo-legal move generator of every piece type
+    python ChessBenchmark.py staged                         # hasLegalMove and staged search against full lists
+    python ChessBenchmark.py tactics --movetime 1000        # quiescence search and SEE: nodes and tactics solved
+    python ChessBenchmark.py parallel --depth 5             # multi-process perft scaling for 1..N workers
+    python ChessBenchmark.py io                             # loading positions from FEN and binary files
+    python ChessBenchmark.py tensor                         # NumPy plane/move mask encoding for batch sizes 1..4096
+    python ChessBenchmark.py uci --processes 1 4 16         # startup time and movetime accuracy of ChessUCI processes
+    python ChessBenchmark.py server --clients 1 8 64        # analysis server latency and requests/sec under load
+
+Node counts are always checked against the reference values below so that a change in the move
+generator is caught even when nobody looks at the timings. The process exits with 1 if a node count
+is wrong or throughput dropped more than the threshold below the baseline.
+"""
+
+import argparse
+import contextlib
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+#benchmark name -> (engine module, GameState backend). ChessEngine2 predates backends.
+ENGINES = {
+    'ChessEngine': ('ChessEngine', 'list'),
+    'ChessEngine-bitboard': ('ChessEngine', 'bitboard'),
+    'ChessEngine2': ('ChessEngine2', None),
+}
+#engines without castling, en-passant and promotion -> checked against PARTIAL_RULES_NODES, no FEN positions
+PARTIAL_RULES_ENGINES = ('ChessEngine2',)
+
+"""
+The positions are reached by playing moves (in the notation of Move.getChessNotation) from the start
+position, so they can be set up on every engine without relying on special moves.
+"""
+POSITIONS = {
+    'start': [],
+    'italian': ['e2e4', 'e7e5', 'g1f3', 'b8c6', 'f1c4', 'f8c5', 'c2c3', 'g8f6', 'd2d4', 'e5d4',
+                'c3d4', 'c5b4', 'b1c3', 'f6e4'],
+    'sicilian': ['e2e4', 'c7c5', 'g1f3', 'd7d6', 'd2d4', 'c5d4', 'f3d4', 'g8f6', 'b1c3', 'a7a6',
+                 'c1g5', 'e7e6', 'f2f4', 'f8e7', 'd1f3', 'd8c7'],
+    'kings-gambit': ['e2e4', 'e7e5', 'f2f4', 'e5f4', 'g1f3', 'g7g5', 'f1c4', 'g5g4', 'e1f1', 'g4f3',
+                     'd1f3', 'd8f6'],
+    'queens-gambit': ['d2d4', 'd7d5', 'c2c4', 'e7e6', 'b1c3', 'g8f6', 'c1g5', 'f8b4', 'e2e3', 'h7h6',
+                      'g5f6', 'd8f6', 'c4d5', 'e6d5', 'd1b3'],
+}
+
+"""
+Standard perft test positions (published node counts, see chessprogramming.org "Perft Results"). They are set up
+from FEN and exercise castling, en-passant, promotion and discovered checks.
+"""
+FEN_POSITIONS = {
+    'kiwipete': 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'cpw-3': '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    'cpw-4': 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+    'cpw-5': 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+    'cpw-6': 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+}
+
+#reference node counts for depth 1, 2, 3, ... of every position under the full rules
+REFERENCE_NODES = {
+    'start': [20, 400, 8902, 197281],
+    'italian': [39, 1583, 62929, 2484233],
+    'sicilian': [48, 1608, 73813, 2496407],
+    'kings-gambit': [40, 1565, 59456, 2198074],
+    'queens-gambit': [48, 1471, 63493, 2087427],
+    'kiwipete': [48, 2039, 97862, 4085603],
+    'cpw-3': [14, 191, 2812, 43238, 674624],
+    'cpw-4': [6, 264, 9467, 422333],
+    'cpw-5': [44, 1486, 62379, 2103487],
+    'cpw-6': [46, 2079, 89890, 3894594],
+}
+#the same for PARTIAL_RULES_ENGINES (castling, en-passant and promotion left out)
+PARTIAL_RULES_NODES = {
+    'start': [20, 400, 8902, 197281],
+    'italian': [38, 1504, 58533, 2266569],
+    'sicilian': [47, 1529, 68920, 2287403],
+    'kings-gambit': [40, 1564, 59425, 2195457],
+    'queens-gambit': [47, 1398, 59204, 1904707],
+}
+
+"""
+Tactical test positions (the first problems of the "Win at Chess" suite) with their solution in the notation of
+Move.getChessNotation.
+"""
+TACTICS = {
+    'wac-001': ('2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - - 0 1', 'g3g6'),
+    'wac-002': ('8/7p/5k2/5p2/p1p2P2/Pr1pPK2/1P1R3P/8 b - - 0 1', 'b3b2'),
+    'wac-003': ('5rk1/1ppb3p/p1pb4/6q1/3P1p1r/2P1R2P/PP1BQ1P1/5RKN w - - 0 1', 'e3g3'),
+    'wac-004': ('r1bq2rk/pp3pbp/2p1p1pQ/7P/3P4/2PB1N2/PP3PPR/2KR4 w - - 0 1', 'h6h7'),
+    'wac-005': ('5k2/6pp/p1qN4/1p1p4/3P4/2PKP2Q/PP3r2/3R4 b - - 0 1', 'c6c4'),
+    'wac-006': ('7k/p7/1R5K/6r1/6p1/6P1/8/8 w - - 0 1', 'b6b7'),
+    'wac-007': ('rnbqkb1r/pppp1ppp/8/4P3/6n1/7P/PPPNPPP1/R1BQKBNR b KQkq - 0 1', 'g4e3'),
+    'wac-008': ('r4q1k/p2bR1rp/2p2Q1N/5p2/5p2/2P5/PP3PPP/R5K1 w - - 0 1', 'e7f7'),
+    'wac-009': ('3q1rk1/p4pp1/2pb3p/3p4/6Pr/1PNQ4/P1PB1PP1/4RRK1 b - - 0 1', 'd6h2'),
+    'wac-010': ('2br2k1/2q3rn/p2NppQ1/2p1P3/Pp5R/4P3/1P3PPP/3R2K1 w - - 0 1', 'h4h7'),
+    'wac-011': ('r1b1kb1r/3q1ppp/pBp1pn2/8/Np3P2/5B2/PPP3PP/R2Q1RK1 w kq - 0 1', 'f3c6'),
+    'wac-012': ('4k1r1/2p3r1/1pR1p3/3pP2p/3P2qP/P4N2/1PQ4P/5R1K b - - 0 1', 'g4f3'),
+    'wac-013': ('5rk1/pp4p1/2n1p2p/2Npq3/2p5/6P1/P3P1BP/R4Q1K w - - 0 1', 'f1f8'),
+    'wac-014': ('r2rb1k1/pp1q1p1p/2n1p1p1/2bp4/5P2/PP1BPR1Q/1BPN2PP/R5K1 w - - 0 1', 'h3h7'),
+    'wac-015': ('1R6/1brk2p1/4p2p/p1P1Pp2/P7/6P1/1P4P1/2R3K1 w - - 0 1', 'b8b7'),
+    'wac-016': ('r4rk1/ppp2ppp/2n5/2bqp3/8/P2PB3/1PP1NPPP/R2QK2R b KQ - 0 1', 'c6d4'),
+    'wac-017': ('1k5r/pppbn1pp/4q1r1/1P3p2/2NPp3/1QP5/1P2P1PP/R3KB1R w KQ - 0 1', 'c4d6'),
+    'wac-018': ('R7/P4k2/8/8/8/8/r7/6K1 w - - 0 1', 'a8h8'),
+    'wac-019': ('r1b2rk1/ppbn1ppp/4p3/1QP4q/3P4/N4N2/5PPP/R1B2RK1 w - - 0 1', 'c5c6'),
+}
+
+"""
+Captures with their exact static exchange value (SEE_VALUES), checked on both backends before the tactics are timed.
+"""
+SEE_POSITIONS = (
+    ('1k1r3q/1ppn3p/p4b2/4p3/8/P2N2P1/1PP1R1BP/2K1Q3 w - - 0 1', 'd3e5', -220),
+    ('1k1r4/1pp4p/p7/4p3/8/P5P1/1PP4P/2K1R3 w - - 0 1', 'e1e5', 100),
+    ('4k3/8/2p5/3p4/4Q3/8/8/4K3 w - - 0 1', 'e4d5', -800),
+    ('4k3/8/2p5/3p4/4P3/5B2/8/4K3 w - - 0 1', 'e4d5', 100),
+    ('3rk3/3r4/8/3p4/8/8/3R4/3RK3 w - - 0 1', 'd2d5', -400),
+)
+
+
+def newGameState(engineName):
+    moduleName, backend = ENGINES[engineName]
+    engine = importlib.import_module(moduleName)
+    return engine.GameState() if backend is None else engine.GameState(backend=backend)
+
+
+def setupPosition(engineName, name):
+    if name in FEN_POSITIONS:
+        moduleName, backend = ENGINES[engineName]
+        return importlib.import_module(moduleName).GameState.fromFen(FEN_POSITIONS[name], backend)
+    gs = newGameState(engineName)
+    for notation in POSITIONS[name]:
+        for move in gs.getValidMoves():
+            if move.getChessNotation() == notation:
+                gs.makeMove(move)
+                break
+        else:
+            raise ValueError("illegal move %s while setting up position '%s'" % (notation, name))
+    return gs
+
+
+def runPerft(engineNames, positionNames, depth, repeat, moveCacheSize=None):
+    results = {}
+    for engineName in engineNames:
+        results[engineName] = {}
+        for name in positionNames:
+            if name in FEN_POSITIONS and engineName in PARTIAL_RULES_ENGINES:
+                continue # no FEN support and the node counts need the full rules
+            gs = setupPosition(engineName, name)
+            best = None
+            for _ in range(repeat):
+                if moveCacheSize and engineName not in PARTIAL_RULES_ENGINES:
+                    gs.moveCache = importlib.import_module(ENGINES[engineName][0]).MoveCache(moveCacheSize)
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull): #getValidMoves announces mates
+                    start = time.perf_counter()
+                    nodes = gs.perft(depth)
+                    seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            results[engineName][name] = {'depth': depth, 'nodes': nodes, 'seconds': best,
+                                         'nps': nodes / best if best > 0 else 0.0}
+            if getattr(gs, 'moveCache', None) is not None:
+                results[engineName][name]['moveCache'] = gs.moveCache.stats()
+    return results
+
+
+"""
+Compare one run against the reference node counts and (optionally) a saved baseline.
+Returns a list of human readable failures, empty if everything passed.
+"""
+
+def checkResults(results, baseline, threshold):
+    failures = []
+    for engineName, positions in results.items():
+        for name, result in positions.items():
+            reference = (PARTIAL_RULES_NODES if engineName in PARTIAL_RULES_ENGINES else REFERENCE_NODES).get(name, [])
+            depth = result['depth']
+            if depth <= len(reference) and result['nodes'] != reference[depth - 1]:
+                failures.append('%s %s: perft(%d) = %d, expected %d' % (engineName, name, depth,
+                                result['nodes'], reference[depth - 1]))
+            old = (baseline or {}).get('results', {}).get(engineName, {}).get(name)
+            if old is not None and old['depth'] == depth and old['nps'] > 0:
+                drop = 1.0 - result['nps'] / old['nps']
+                if drop > threshold:
+                    failures.append('%s %s: %.0f nodes/sec is %.1f%% below the baseline (%.0f nodes/sec)' % (
+                                    engineName, name, result['nps'], drop * 100, old['nps']))
+    return failures
+
+
+def printResults(results):
+    print('%-22s %-15s %5s %10s %9s %12s' % ('engine', 'position', 'depth', 'nodes', 'seconds', 'nodes/sec'))
+    for engineName, positions in results.items():
+        for name, result in positions.items():
+            print('%-22s %-15s %5d %10d %9.3f %12.0f' % (engineName, name, result['depth'], result['nodes'],
+                                                        result['seconds'], result['nps']))
+            if 'moveCache' in result:
+                cache = result['moveCache']
+                print('    move cache: %d hits, %d misses (%.1f%%), %d evictions, %d positions kept' % (
+                    cache['hits'], cache['misses'], cache['hitRate'] * 100, cache['evictions'], cache['positions']))
+    totals = {engineName: sum(r['nodes'] for r in positions.values()) / sum(r['seconds'] for r in positions.values())
+              for engineName, positions in results.items()}
+    #speedups are against the list backend (the one the bitboard backend is meant to beat), not against ChessEngine2
+    reference = 'ChessEngine' if 'ChessEngine' in totals else min(totals, key=totals.get)
+    for engineName, nps in totals.items():
+        print('%-22s %12.0f nodes/sec overall, %6.2fx vs %s' % (engineName, nps, nps / totals[reference], reference))
+
+
+def perftCommand(args):
+    results = runPerft(args.engine, args.position, args.depth, args.repeat, args.move_cache)
+    printResults(results)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    failures = checkResults(results, baseline, args.threshold)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'results': results}, f, indent=2, sort_keys=True)
+    for failure in failures:
+        print('FAIL: ' + failure)
+    return 1 if failures else 0
+
+
+"""
+Memory used by generated moves: every pseudo-legal move of every position in the suite is generated
+`repeat` times and kept alive while tracemalloc measures the allocated bytes.
+"""
+
+def measureMoveMemory(engineName, positionNames, repeat):
+    states = [setupPosition(engineName, name) for name in positionNames]
+    kept = []
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for gs in states:
+            kept.extend(gs.getAllPossibleMoves())
+    seconds = time.perf_counter() - start
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(kept)
+    return {'moves': count, 'bytes': after - before, 'bytesPerMove': (after - before) / count,
+            'movesPerSecond': count / seconds}
+
+
+def movesCommand(args):
+    results = {engineName: measureMoveMemory(engineName, args.position, args.repeat) for engineName in args.engine}
+    print('%-22s %10s %14s %16s' % ('engine', 'moves', 'bytes/move', 'moves/sec'))
+    for engineName, result in results.items():
+        print('%-22s %10d %14.1f %16.0f' % (engineName, result['moves'], result['bytesPerMove'],
+                                            result['movesPerSecond']))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+"""
+Per piece type: calls/sec and moves/sec of the pseudo-legal generator (gs.moveFunctions) for every piece of the
+side to move in the positions, without the legality filter of getValidMoves around it.
+"""
+def measurePieceGenerators(states, repeat):
+    results = {}
+    for pieceType in 'PNBRQK':
+        calls = []
+        for gs in states:
+            color = 'w' if gs.whiteToMove else 'b'
+            generate = gs.moveFunctions[pieceType]
+            calls.extend((generate, r, c) for r in range(8) for c in range(8) if gs.board[r][c] == color + pieceType)
+        moves = []
+        for generate, r, c in calls:
+            generate(r, c, moves)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(100):
+                for generate, r, c in calls:
+                    generate(r, c, [])
+            seconds = (time.perf_counter() - start) / 100
+            best = seconds if best is None else min(best, seconds)
+        results[pieceType] = {'calls': len(calls), 'moves': len(moves), 'seconds': best,
+                              'callsPerSecond': len(calls) / best, 'movesPerSecond': len(moves) / best}
+    return results
+
+
+def piecesCommand(args):
+    results = {}
+    for engineName in args.engine:
+        states = [setupPosition(engineName, name) for name in args.position]
+        results[engineName] = measurePieceGenerators(states, args.repeat)
+    print('%-22s %5s %8s %14s %14s %12s' % ('engine', 'piece', 'calls', 'calls/sec', 'moves/sec', 'us/call'))
+    for engineName, pieces in results.items():
+        for pieceType, result in pieces.items():
+            print('%-22s %5s %8d %14.0f %14.0f %12.2f' % (engineName, pieceType, result['calls'],
+                                                         result['callsPerSecond'], result['movesPerSecond'],
+                                                         result['seconds'] / result['calls'] * 1e6))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+"""
+What the staged move generator saves:
+    - terminal checks: hasLegalMove() against bool(getValidMoves()) on random positions (plus mates/stalemates)
+    - alpha-beta: fixed depth searches of the FEN suite with Searcher(stagedMoves=True) against stagedMoves=False
+"""
+def stagedCommand(args):
+    import ChessAI
+    import ChessEngine
+    fens = randomPositions(args.count) + [
+        '6k1/5ppp/8/8/8/8/8/R5K1 b - - 0 1', '7k/5Q2/6K1/8/8/8/8/8 b - - 0 1',
+        'rnb1kbnr/pppp1ppp/8/4p3/6Pq/5P2/PPPPP2P/RNBQKBNR w KQkq - 1 3']
+    results = {}
+    for backend in args.backend:
+        states = [ChessEngine.GameState.fromFen(fen, backend) for fen in fens]
+        timings = {}
+        for label, hasMove in (('getValidMoves', lambda gs: bool(gs.getValidMoves())),
+                               ('hasLegalMove', lambda gs: gs.hasLegalMove())):
+            best = None
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                answers = [hasMove(gs) for gs in states]
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            timings[label] = (best, answers)
+        if timings['getValidMoves'][1] != timings['hasLegalMove'][1]:
+            print('FAIL: hasLegalMove disagrees with getValidMoves (%s backend)' % backend)
+            return 1
+        searches = {}
+        for staged in (False, True):
+            best = None
+            for _ in range(args.repeat):
+                nodes = 0
+                start = time.perf_counter()
+                for fen in [ChessEngine.START_FEN] + list(FEN_POSITIONS.values()):
+                    searcher = ChessAI.Searcher(stagedMoves=staged)
+                    nodes += searcher.search(ChessEngine.GameState.fromFen(fen, backend), args.depth).nodes
+                seconds = time.perf_counter() - start
+                best = seconds if best is None else min(best, seconds)
+            searches[staged] = (best, nodes)
+        results[backend] = {
+            'positions': len(states),
+            'terminalFull': len(states) / timings['getValidMoves'][0],
+            'terminalStaged': len(states) / timings['hasLegalMove'][0],
+            'searchDepth': args.depth,
+            'searchFullSeconds': searches[False][0], 'searchFullNodes': searches[False][1],
+            'searchStagedSeconds': searches[True][0], 'searchStagedNodes': searches[True][1],
+        }
+    print('%-9s %18s %18s %8s %14s %14s %8s' % ('backend', 'getValidMoves/s', 'hasLegalMove/s', 'speedup',
+                                               'search full', 'search staged', 'speedup'))
+    for backend, result in results.items():
+        print('%-9s %18.0f %18.0f %7.2fx %13.2fs %13.2fs %7.2fx' % (
+            backend, result['terminalFull'], result['terminalStaged'],
+            result['terminalStaged'] / result['terminalFull'], result['searchFullSeconds'],
+            result['searchStagedSeconds'], result['searchFullSeconds'] / result['searchStagedSeconds']))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+"""
+What the quiescence search and the static exchange evaluation buy, for searches without quiescence, with
+quiescence searching every capture, and with quiescence skipping the captures SEE says lose material:
+    - nodes and seconds of fixed depth searches of the TACTICS positions
+    - TACTICS positions solved (best move found) with a fixed time per position
+The static exchange values of SEE_POSITIONS are checked first, the process exits with 1 if one is wrong.
+"""
+def tacticsCommand(args):
+    import ChessAI
+    import ChessEngine
+    for fen, notation, expected in SEE_POSITIONS:
+        for backend in ('list', 'bitboard'):
+            gs = ChessEngine.GameState.fromFen(fen, backend)
+            move = next(move for move in gs.getValidMoves() if move.getChessNotation() == notation)
+            if gs.staticExchange(move) != expected:
+                print('FAIL: staticExchange of %s in %s is %d on the %s backend, expected %d' % (
+                    notation, fen, gs.staticExchange(move), backend, expected))
+                return 1
+    configurations = (('no quiescence', {'quiescence': False}),
+                      ('quiescence', {'seePruning': False}),
+                      ('quiescence+SEE', {}))
+    results = {}
+    for label, options in configurations:
+        nodes = 0
+        start = time.perf_counter()
+        for fen, _ in TACTICS.values():
+            nodes += ChessAI.Searcher(**options).search(ChessEngine.GameState.fromFen(fen, args.backend), args.depth).nodes
+        seconds = time.perf_counter() - start
+        solved = []
+        for name, (fen, solution) in TACTICS.items():
+            result = ChessAI.Searcher(**options).search(ChessEngine.GameState.fromFen(fen, args.backend),
+                                                       timeLimit=args.movetime / 1000)
+            if result is not None and result.bestMove.getChessNotation() == solution:
+                solved.append(name)
+        results[label] = {'depth': args.depth, 'nodes': nodes, 'seconds': seconds,
+                          'movetime': args.movetime, 'solved': solved}
+    print('%-16s %12s %9s %8s' % ('search', 'nodes@d%d' % args.depth, 'seconds', 'solved'))
+    for label, result in results.items():
+        print('%-16s %12d %8.2fs %5d/%d' % (label, result['nodes'], result['seconds'], len(result['solved']),
+                                           len(TACTICS)))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+"""
+Evaluations/sec of the incremental evaluation (kept up to date by makeMove) against a full recompute,
+on the positions met while walking the perft tree of every position in the suite.
+"""
+def evalCommand(args):
+    import ChessEvaluation
+    results = {}
+    for engineName in args.engine:
+        leaves = []
+        for name in args.position:
+            gs = setupPosition(engineName, name)
+            gs.debugIncremental = args.check
+            for move in gs.getValidMoves():
+                leaves.append((gs, move))
+        for label, evaluate in (('incremental', ChessEvaluation.evaluate),
+                                ('from scratch', ChessEvaluation.evaluateFromScratch)):
+            count = 0
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                for gs, move in leaves:
+                    gs.pushMove(move)
+                    evaluate(gs)
+                    gs.popMove()
+                    count += 1
+            seconds = time.perf_counter() - start
+            results.setdefault(engineName, {})[label] = {'evaluations': count, 'seconds': seconds,
+                                                          'evalsPerSecond': count / seconds}
+    print('%-22s %-14s %12s %16s' % ('engine', 'evaluation', 'evaluations', 'make+eval+undo/s'))
+    for engineName, labels in results.items():
+        for label, result in labels.items():
+            print('%-22s %-14s %12d %16.0f' % (engineName, label, result['evaluations'], result['evalsPerSecond']))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+"""
+Speedup of the multi-process perft (root moves split over a process pool) for 1..N workers.
+"""
+
+def parallelCommand(args):
+    import concurrent.futures
+    import ChessParallel
+    gs = setupPosition(args.engine, args.position)
+    results = []
+    for workers in range(1, args.workers + 1):
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            ChessParallel.parallelPerft(gs, 1, executor=executor) #start the worker processes before timing
+            start = time.perf_counter()
+            nodes = ChessParallel.parallelPerft(gs, args.depth, executor=executor)
+            seconds = time.perf_counter() - start
+        results.append({'workers': workers, 'nodes': nodes, 'seconds': seconds, 'nps': nodes / seconds})
+    print('%-8s %10s %9s %12s %8s' % ('workers', 'nodes', 'seconds', 'nodes/sec', 'speedup'))
+    for result in results:
+        print('%-8d %10d %9.3f %12.0f %7.2fx' % (result['workers'], result['nodes'], result['seconds'],
+                                                 result['nps'], results[0]['seconds'] / result['seconds']))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'cpus': os.cpu_count(), 'engine': args.engine,
+                       'position': args.position, 'depth': args.depth, 'results': results}, f, indent=2)
+    return 0
+
+
+"""
+Positions/sec loaded from a FEN text file and from the memory-mapped binary format (ChessPositions).
+The positions come from random games played from the start position (fixed seed).
+"""
+
+def randomPositions(count, seed=1):
+    import random
+    import ChessEngine
+    rng = random.Random(seed)
+    positions = []
+    gs = ChessEngine.GameState()
+    while len(positions) < count:
+        moves = gs.getValidMoves()
+        if not moves or len(gs.undoStack) >= 120:
+            gs = ChessEngine.GameState()
+            continue
+        gs.makeMove(rng.choice(moves))
+        positions.append(gs.toFen())
+    return positions
+
+
+def ioCommand(args):
+    import tempfile
+    import ChessEngine
+    import ChessPositions
+    fens = randomPositions(args.count)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        fenPath = os.path.join(directory, 'positions.fen')
+        binPath = os.path.join(directory, 'positions.bin')
+        with open(fenPath, 'w') as f:
+            f.write('\n'.join(fens) + '\n')
+        ChessPositions.writePositions(binPath, (ChessEngine.GameState.fromFen(fen) for fen in fens))
+
+        def timeLoad(label, path, load):
+            start = time.perf_counter()
+            count = sum(1 for _ in load())
+            seconds = time.perf_counter() - start
+            results[label] = {'positions': count, 'seconds': seconds, 'positionsPerSecond': count / seconds,
+                              'bytesPerPosition': os.path.getsize(path) / count}
+
+        timeLoad('fen -> GameState', fenPath, lambda: ChessPositions.readFenFile(fenPath))
+        with ChessPositions.PositionFile(binPath) as positions:
+            timeLoad('binary -> GameState', binPath, lambda: iter(positions))
+            timeLoad('binary -> board', binPath, positions.boards)
+    print('%-22s %10s %16s %14s' % ('format', 'positions', 'positions/sec', 'bytes/position'))
+    for label, result in results.items():
+        print('%-22s %10d %16.0f %14.1f' % (label, result['positions'], result['positionsPerSecond'],
+                                            result['bytesPerPosition']))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+"""
+Every batch size encodes the same positions: piece planes from GameStates, planes plus legal move masks,
+and planes read directly from the binary records.
+"""
+def tensorCommand(args):
+    import tempfile
+    import ChessEngine
+    import ChessPositions
+    import ChessTensor
+    states = [ChessEngine.GameState.fromFen(fen) for fen in randomPositions(args.count)]
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        binPath = os.path.join(directory, 'positions.bin')
+        ChessPositions.writePositions(binPath, states)
+        with ChessPositions.PositionFile(binPath) as positions:
+            encoders = {
+                'planes': lambda start, size: ChessTensor.encodeBoards(states[start:start + size]),
+                'planes+masks': lambda start, size: ChessTensor.encodePositions(states[start:start + size]),
+                'records': lambda start, size: ChessTensor.encodeRecords(positions.data, start, size),
+            }
+            for batchSize in args.batch:
+                for label, encode in encoders.items():
+                    best = None
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        for first in range(0, len(states), batchSize):
+                            encode(first, batchSize)
+                        seconds = time.perf_counter() - start
+                        best = seconds if best is None else min(best, seconds)
+                    results['%s/%d' % (label, batchSize)] = {'encoder': label, 'batchSize': batchSize,
+                                                            'positions': len(states), 'seconds': best,
+                                                            'positionsPerSecond': len(states) / best}
+    print('%-14s %10s %16s' % ('encoder', 'batch', 'positions/sec'))
+    for result in results.values():
+        print('%-14s %10d %16.0f' % (result['encoder'], result['batchSize'], result['positionsPerSecond']))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'results': results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+"""
+Start N ChessUCI processes at once and time each one until it answers readyok, then let all of them search
+with the same movetime and measure how late their bestmove arrives (the time control has to hold even when
+the processes compete for the CPUs).
+"""
+def uciCommand(args):
+    import subprocess
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ChessUCI.py')
+    results = {}
+    for count in args.processes:
+        processes = []
+        start = time.perf_counter()
+        for _ in range(count):
+            process = subprocess.Popen([sys.executable, script], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                       universal_newlines=True, bufsize=1)
+            process.stdin.write('uci\nisready\n')
+            process.stdin.flush()
+            processes.append(process)
+
+        def waitFor(process, prefix):
+            while True:
+                line = process.stdout.readline()
+                if not line or line.startswith(prefix):
+                    return time.perf_counter()
+
+        startups = [waitFor(process, 'readyok') - start for process in processes]
+        start = time.perf_counter()
+        for process in processes:
+            process.stdin.write('position startpos\ngo movetime %d\n' % args.movetime)
+            process.stdin.flush()
+        latencies = [waitFor(process, 'bestmove') - start - args.movetime / 1000 for process in processes]
+        for process in processes:
+            process.stdin.write('quit\n')
+            process.stdin.flush()
+            process.wait()
+        results[count] = {'processes': count, 'startupMedian': sorted(startups)[count // 2],
+                          'startupMax': max(startups), 'movetime': args.movetime / 1000,
+                          'lateMax': max(latencies)}
+    print('%-10s %16s %14s %22s' % ('processes', 'startup median', 'startup max', 'bestmove late (max)'))
+    for result in results.values():
+        print('%-10d %14.0fms %12.0fms %20.0fms' % (result['processes'], result['startupMedian'] * 1000,
+                                                  result['startupMax'] * 1000, result['lateMax'] * 1000))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'cpus': os.cpu_count(), 'results': results}, f,
+                      indent=2, sort_keys=True)
+    return 0
+
+
+"""
+Load generator for ChessServer: for every concurrency level a fresh server (empty cache) gets args.requests
+requests from that many clients, each with one request in flight. The FENs are drawn from a pool of
+args.positions random positions, so a smaller pool means more cache hits and coalesced requests.
+"""
+def serverCommand(args):
+    import asyncio
+    import concurrent.futures
+    import random
+    import ChessServer
+
+    fens = randomPositions(args.positions)
+
+    async def client(host, port, requests, latencies, rng):
+        reader, writer = await asyncio.open_connection(host, port)
+        for i in range(requests):
+            request = {'id': i, 'op': args.op, 'fen': rng.choice(fens), 'depth': args.depth}
+            start = time.perf_counter()
+            writer.write((json.dumps(request) + '\n').encode())
+            await writer.drain()
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - start)
+            if 'error' in response:
+                raise RuntimeError(response['error'])
+        writer.close()
+
+    async def run(clients, executor):
+        server = ChessServer.AnalysisServer(cacheSize=args.cache, executor=executor)
+        listener = await server.start(port=0)
+        host, port = listener.sockets[0].getsockname()[:2]
+        latencies = []
+        rng = random.Random(clients)
+        perClient = [args.requests // clients + (1 if i < args.requests % clients else 0) for i in range(clients)]
+        start = time.perf_counter()
+        await asyncio.gather(*(client(host, port, count, latencies, rng) for count in perClient if count))
+        seconds = time.perf_counter() - start
+        listener.close()
+        await listener.wait_closed()
+        latencies.sort()
+        stats = server.stats
+        return {'clients': clients, 'requests': len(latencies), 'seconds': seconds,
+                'requestsPerSecond': len(latencies) / seconds, 'p50': latencies[len(latencies) // 2],
+                'p99': latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)],
+                'hitRate': (stats['hits'] + stats['coalesced']) / stats['requests']}
+
+    results = {}
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers) as executor:
+        list(executor.map(ChessServer.analyze, ['moves'] * 8, fens[:8], [0] * 8, [0] * 8)) # start the workers
+        for clients in args.clients:
+            results[clients] = asyncio.run(run(clients, executor))
+    print('%-8s %10s %12s %10s %10s %10s' % ('clients', 'requests', 'requests/sec', 'p50', 'p99', 'cached'))
+    for result in results.values():
+        print('%-8d %10d %12.0f %8.1fms %8.1fms %9.0f%%' % (
+            result['clients'], result['requests'], result['requestsPerSecond'], result['p50'] * 1000,
+            result['p99'] * 1000, result['hitRate'] * 100))
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'python': platform.python_version(), 'cpus': os.cpu_count(), 'op': args.op,
+                       'results': results}, f, indent=2, sort_keys=True)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Chess engine benchmarks')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    perft = commands.add_parser('perft', help='nodes/sec of the move generator over a fixed position suite')
+    perft.add_argument('--engine', nargs='+', default=list(ENGINES), choices=list(ENGINES),
+                       help='engines to run (default: all)')
+    perft.add_argument('--position', nargs='+', default=list(POSITIONS), choices=list(POSITIONS) + list(FEN_POSITIONS),
+                       help='positions to run (default: the move sequences every engine can set up)')
+    perft.add_argument('--depth', type=int, default=3)
+    perft.add_argument('--repeat', type=int, default=1, help='runs per position, the fastest one is kept')
+    perft.add_argument('--move-cache', type=int, default=None, metavar='POSITIONS',
+                       help='give every run a fresh MoveCache of this size (hit rates are printed)')
+    perft.add_argument('--save', help='write the results to this JSON file')
+    perft.add_argument('--baseline', help='JSON file written by --save to compare throughput against')
+    perft.add_argument('--threshold', type=float, default=0.2,
+                       help='allowed throughput drop against the baseline (0.2 = 20%%)')
+    perft.set_defaults(run=perftCommand)
+
+    moves = commands.add_parser('moves', help='bytes allocated per generated move (tracemalloc)')
+    moves.add_argument('--engine', nargs='+', default=list(ENGINES), choices=list(ENGINES))
+    moves.add_argument('--position', nargs='+', default=list(POSITIONS), choices=list(POSITIONS))
+    moves.add_argument('--repeat', type=int, default=200, help='times the moves of every position are generated')
+    moves.add_argument('--save', help='write the results to this JSON file')
+    moves.set_defaults(run=movesCommand)
+
+    evaluation = commands.add_parser('eval', help='evaluations/sec, incremental against full recompute')
+    evaluation.add_argument('--engine', nargs='+', default=['ChessEngine', 'ChessEngine-bitboard'],
+                            choices=[name for name in ENGINES if name != 'ChessEngine2'])
+    evaluation.add_argument('--position', nargs='+', default=list(POSITIONS),
+                            choices=list(POSITIONS) + list(FEN_POSITIONS))
+    evaluation.add_argument('--repeat', type=int, default=200)
+    evaluation.add_argument('--check', action='store_true',
+                            help='also verify the incremental scores against a recompute after every move')
+    evaluation.add_argument('--save', help='write the results to this JSON file')
+    evaluation.set_defaults(run=evalCommand)
+
+    pieces = commands.add_parser('pieces', help='calls/sec and moves/sec of the generator of every piece type')
+    pieces.add_argument('--engine', nargs='+', default=['ChessEngine', 'ChessEngine2'],
+                        choices=[name for name in ENGINES if name != 'ChessEngine-bitboard'])
+    pieces.add_argument('--position', nargs='+', default=list(POSITIONS), choices=list(POSITIONS))
+    pieces.add_argument('--repeat', type=int, default=20, help='runs per piece type, the fastest one is kept')
+    pieces.add_argument('--save', help='write the results to this JSON file')
+    pieces.set_defaults(run=piecesCommand)
+
+    staged = commands.add_parser('staged', help='terminal checks and alpha-beta with the staged move generator')
+    staged.add_argument('--backend', nargs='+', default=['list', 'bitboard'], choices=['list', 'bitboard'])
+    staged.add_argument('--count', type=int, default=2000, help='random positions for the terminal checks')
+    staged.add_argument('--depth', type=int, default=4, help='depth of the searches')
+    staged.add_argument('--repeat', type=int, default=3, help='runs of each measurement, the fastest one is kept')
+    staged.add_argument('--save', help='write the results to this JSON file')
+    staged.set_defaults(run=stagedCommand)
+
+    tactics = commands.add_parser('tactics', help='nodes and tactics solved with quiescence search and SEE pruning')
+    tactics.add_argument('--backend', default='bitboard', choices=['list', 'bitboard'])
+    tactics.add_argument('--depth', type=int, default=3, help='depth of the node count searches')
+    tactics.add_argument('--movetime', type=int, default=1000, help='ms per position for the solve rate')
+    tactics.add_argument('--save', help='write the results to this JSON file')
+    tactics.set_defaults(run=tacticsCommand)
+
+    parallel = commands.add_parser('parallel', help='multi-process perft speedup for 1..N workers')
+    parallel.add_argument('--engine', default='ChessEngine-bitboard',
+                          choices=[name for name in ENGINES if name != 'ChessEngine2'])
+    parallel.add_argument('--position', default='start', choices=list(POSITIONS) + list(FEN_POSITIONS))
+    parallel.add_argument('--depth', type=int, default=4)
+    parallel.add_argument('--workers', type=int, default=os.cpu_count(), help='largest number of workers to try')
+    parallel.add_argument('--save', help='write the results to this JSON file')
+    parallel.set_defaults(run=parallelCommand)
+
+    io = commands.add_parser('io', help='positions/sec loaded from FEN text and from the binary format')
+    io.add_argument('--count', type=int, default=20000, help='number of positions')
+    io.add_argument('--save', help='write the results to this JSON file')
+    io.set_defaults(run=ioCommand)
+
+    tensor = commands.add_parser('tensor', help='positions/sec encoded into NumPy arrays per batch size')
+    tensor.add_argument('--count', type=int, default=4096, help='number of positions')
+    tensor.add_argument('--batch', type=int, nargs='+', default=[1, 4, 16, 64, 256, 1024, 4096])
+    tensor.add_argument('--repeat', type=int, default=3, help='runs per batch size, the fastest one is kept')
+    tensor.add_argument('--save', help='write the results to this JSON file')
+    tensor.set_defaults(run=tensorCommand)
+
+    uci = commands.add_parser('uci', help='startup time and movetime accuracy of concurrent ChessUCI processes')
+    uci.add_argument('--processes', type=int, nargs='+', default=[1, 4, 16], help='engines started at the same time')
+    uci.add_argument('--movetime', type=int, default=500, help='ms per search')
+    uci.add_argument('--save', help='write the results to this JSON file')
+    uci.set_defaults(run=uciCommand)
+
+    server = commands.add_parser('server', help='latency percentiles and requests/sec of the analysis server')
+    server.add_argument('--clients', type=int, nargs='+', default=[1, 8, 64], help='concurrent clients')
+    server.add_argument('--requests', type=int, default=2000, help='requests per concurrency level')
+    server.add_argument('--positions', type=int, default=500, help='distinct positions the requests draw from')
+    server.add_argument('--op', default='moves', choices=('moves', 'eval', 'bestmove'))
+    server.add_argument('--depth', type=int, default=2, help='search depth of bestmove requests')
+    server.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes of the server')
+    server.add_argument('--cache', type=int, default=4096, help='LRU cache size of the server')
+    server.add_argument('--save', help='write the results to this JSON file')
+    server.set_defaults(run=serverCommand)
+
+    args = parser.parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,747 @@
+"""
+Bitboard backend for GameState. Select it with ChessEngine.GameState(backend='bitboard').
+	- every piece type of every color is kept as a 64 bit integer, bit (row*8 + col) set when the piece is on (row, col)
+	- knight/king/pawn attacks come from tables built once at import
+	- sliding attacks are looked up per line (rank, file, diagonal, anti-diagonal) by the occupancy of that line
+The list of lists in self.board is still kept up to date (by ChessEngine.GameState.pushMove/popMove) for the
+renderer in ChessMain and for Move objects.
+"""
+
+import ChessEngine
+
+PIECES = ('wP', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bP', 'bR', 'bN', 'bB', 'bQ', 'bK')
+SEE_ORDER = ('P', 'N', 'B', 'R', 'Q', 'K') # least valuable attacker first
+
+#(row, col) of every square index and the single bit of every square index
+SQUARES = tuple((sq // 8, sq % 8) for sq in range(64))
+BITS = tuple(1 << sq for sq in range(64))
+
+
+def bitsFromOffsets(sq, offsets):
+	r, c = SQUARES[sq]
+	bits = 0
+	for d in offsets:
+		endRow, endCol = r + d[0], c + d[1]
+		if 0 <= endRow < 8 and 0 <= endCol < 8:
+			bits |= BITS[endRow * 8 + endCol]
+	return bits
+
+
+def rayFrom(sq, d):
+	r, c = SQUARES[sq]
+	ray = []
+	for i in range(1, 8):
+		endRow, endCol = r + d[0] * i, c + d[1] * i
+		if not (0 <= endRow < 8 and 0 <= endCol < 8):
+			break
+		ray.append(endRow * 8 + endCol)
+	return ray
+
+
+KNIGHT_ATTACKS = tuple(bitsFromOffsets(sq, ChessEngine.KNIGHT_DIRECTIONS) for sq in range(64))
+KING_ATTACKS = tuple(bitsFromOffsets(sq, ChessEngine.LINE_DIRECTIONS) for sq in range(64))
+#squares a pawn of the given color on sq attacks (white pawns move up the board -> towards row 0)
+PAWN_ATTACKS = {'w': tuple(bitsFromOffsets(sq, ((-1, -1), (-1, 1))) for sq in range(64)),
+				'b': tuple(bitsFromOffsets(sq, ((1, -1), (1, 1))) for sq in range(64))}
+
+"""
+Sliding attack lookup. For every square and every line through it (pair of opposite directions) we store
+	- the mask of squares on the line whose occupancy can change the attack (the board edge never can)
+	- a dict mapping every possible (occupancy & mask) to the attacked squares
+so a rook or bishop needs two dict lookups instead of walking rays.
+"""
+LINES = (((-1, 0), (1, 0)), ((0, -1), (0, 1)), ((-1, -1), (1, 1)), ((-1, 1), (1, -1)))
+
+
+def buildLineTables(sq, directions):
+	rays = [rayFrom(sq, d) for d in directions]
+	mask = 0
+	for ray in rays:
+		for s in ray[:-1]:
+			mask |= BITS[s]
+	table = {}
+	subset = 0
+	while True: # enumerate every subset of the mask (carry-rippler)
+		attacks = 0
+		for ray in rays:
+			for s in ray:
+				attacks |= BITS[s]
+				if subset & BITS[s]:
+					break
+		table[subset] = attacks
+		subset = (subset - mask) & mask
+		if subset == 0:
+			break
+	return mask, table
+
+
+LINE_MASKS = []
+LINE_ATTACKS = []
+for _line in LINES:
+	_masks, _tables = [], []
+	for _sq in range(64):
+		_mask, _table = buildLineTables(_sq, _line)
+		_masks.append(_mask)
+		_tables.append(_table)
+	LINE_MASKS.append(tuple(_masks))
+	LINE_ATTACKS.append(tuple(_tables))
+FILE_MASK, RANK_MASK, DIAG_MASK, ANTI_MASK = LINE_MASKS
+FILE_ATTACKS, RANK_ATTACKS, DIAG_ATTACKS, ANTI_ATTACKS = LINE_ATTACKS
+
+
+def rookAttacks(sq, occupied):
+	return FILE_ATTACKS[sq][occupied & FILE_MASK[sq]] | RANK_ATTACKS[sq][occupied & RANK_MASK[sq]]
+
+
+def bishopAttacks(sq, occupied):
+	return DIAG_ATTACKS[sq][occupied & DIAG_MASK[sq]] | ANTI_ATTACKS[sq][occupied & ANTI_MASK[sq]]
+
+
+#squares strictly between two squares on a common line (0 when they don't share a line)
+BETWEEN = []
+for _sq in range(64):
+	_row = [0] * 64
+	for _d in ChessEngine.LINE_DIRECTIONS:
+		_bits = 0
+		for _s in rayFrom(_sq, _d):
+			_row[_s] = _bits
+			_bits |= BITS[_s]
+	BETWEEN.append(tuple(_row))
+BETWEEN = tuple(BETWEEN)
+
+#rows and columns as bitboards and all 64 squares, for moving every pawn of a side with one shift
+ROW_BITS = tuple(sum(BITS[r * 8 + c] for c in range(8)) for r in range(8))
+COL_BITS = tuple(sum(BITS[r * 8 + c] for r in range(8)) for c in range(8))
+ALL_SQUARES = 0xFFFFFFFFFFFFFFFF
+
+#pieces of a color, most common first, and the pieces a pawn of that color promotes to (in move generation order)
+COLOR_PIECES = {color: tuple(color + pieceType for pieceType in 'PNBRQK') for color in 'wb'}
+PROMOTIONS = {color: tuple(color + pieceType for pieceType in 'QRBN') for color in 'wb'}
+
+#castling flag -> (squares that must be empty, the two squares the king crosses and lands on)
+CASTLING_PATHS = {}
+for _flag, (_, _kingSq, _, _between) in ChessEngine.CASTLING.items():
+	CASTLING_PATHS[_flag] = (sum(BITS[r * 8 + c] for r, c in _between), tuple(r * 8 + c for r, c in _between[:2]))
+
+
+#number of set bits (int.bit_count is Python 3.10+)
+popCount = int.bit_count if hasattr(int, 'bit_count') else lambda bits: bin(bits).count('1')
+
+#kind of the (start square, targets) entries of BitboardGameState.legalTargets
+MOVE_NORMAL, MOVE_PROMOTION, MOVE_ENPASSANT, MOVE_CASTLE = range(4)
+
+"""
+Target bitboards repeat all the time during a search, so the (row, col) squares of a bitboard are remembered
+instead of peeling the bits off one by one for every generated move. Cleared when it grows past SQUARE_LISTS_SIZE.
+"""
+SQUARE_LISTS = {0: ()}
+SQUARE_LISTS_SIZE = 1 << 16
+
+
+def squaresOf(bits):
+	squares = []
+	key = bits
+	while bits:
+		bit = bits & -bits
+		bits ^= bit
+		squares.append(SQUARES[bit.bit_length() - 1])
+	if len(SQUARE_LISTS) >= SQUARE_LISTS_SIZE:
+		SQUARE_LISTS.clear()
+		SQUARE_LISTS[0] = ()
+	squares = SQUARE_LISTS[key] = tuple(squares)
+	return squares
+
+
+def cachedSquares(bits):
+	squares = SQUARE_LISTS.get(bits)
+	return squares if squares is not None else squaresOf(bits)
+
+
+class BitboardGameState(ChessEngine.GameState):
+	def __init__(self, backend='bitboard'):
+		super().__init__(backend)
+		self.loadBitboards()
+
+	def loadBoard(self, board, whiteToMove, fullMoveNumber=1, castleRights=0, enpassantPossible=None):
+		super().loadBoard(board, whiteToMove, fullMoveNumber, castleRights, enpassantPossible)
+		self.loadBitboards()
+
+	'''
+	Rebuild all the bitboards from self.board
+	'''
+	def loadBitboards(self):
+		self.bitboards = {piece: 0 for piece in PIECES}
+		self.occupied = {'w': 0, 'b': 0}
+		for sq in range(64):
+			r, c = SQUARES[sq]
+			piece = self.board[r][c]
+			if piece != '--':
+				self.bitboards[piece] |= BITS[sq]
+				self.occupied[piece[0]] |= BITS[sq]
+
+	def pushMove(self, move):
+		super().pushMove(move)
+		self.moveBits(move)
+
+	def popMove(self):
+		move = super().popMove()
+		if move is not None:
+			self.moveBits(move) # moving the bits is its own inverse
+		return move
+
+	def moveBits(self, move):
+		fromBit = BITS[move.startRow * 8 + move.startCol]
+		toBit = BITS[move.endRow * 8 + move.endCol]
+		color = move.pieceMoved[0]
+		self.occupied[color] ^= fromBit | toBit
+		if move.promotion is None:
+			self.bitboards[move.pieceMoved] ^= fromBit | toBit
+		else:
+			self.bitboards[move.pieceMoved] ^= fromBit
+			self.bitboards[move.promotion] ^= toBit
+		if move.pieceCaptured != '--':
+			if move.isEnpassantMove:
+				toBit = BITS[move.startRow * 8 + move.endCol]
+			self.bitboards[move.pieceCaptured] ^= toBit
+			self.occupied[move.pieceCaptured[0]] ^= toBit
+		if move.isCastleMove:
+			rookStart, rookEnd = ChessEngine.CASTLING_ROOK_COLS[move.endCol]
+			rookBits = BITS[move.endRow * 8 + rookStart] | BITS[move.endRow * 8 + rookEnd]
+			self.bitboards[color + 'R'] ^= rookBits
+			self.occupied[color] ^= rookBits
+
+	'''
+	Bitboard of the pieces of color `by` attacking sq, given the occupancy `occupied`.
+	'''
+	def attackersOf(self, sq, by, occupied):
+		bb = self.bitboards
+		return ((KNIGHT_ATTACKS[sq] & bb[by + 'N'])
+				| (KING_ATTACKS[sq] & bb[by + 'K'])
+				| (PAWN_ATTACKS['b' if by == 'w' else 'w'][sq] & bb[by + 'P'])
+				| (rookAttacks(sq, occupied) & (bb[by + 'R'] | bb[by + 'Q']))
+				| (bishopAttacks(sq, occupied) & (bb[by + 'B'] | bb[by + 'Q'])))
+
+	def leastValuableAttacker(self, sq, color, removed):
+		occupied = (self.occupied['w'] | self.occupied['b']) & ~removed
+		attackers = self.attackersOf(sq, color, occupied) & occupied # x-ray attackers show up once removed is empty
+		if not attackers:
+			return None
+		for pieceType in SEE_ORDER:
+			bits = attackers & self.bitboards[color + pieceType]
+			if bits:
+				return pieceType, bits & -bits
+
+	def computeAttackMaps(self):
+		maps = {'w': [0] * 64, 'b': [0] * 64}
+		occupied = self.occupied['w'] | self.occupied['b']
+		for piece in PIECES:
+			attacks = maps[piece[0]]
+			pieces = self.bitboards[piece]
+			while pieces:
+				bit = pieces & -pieces
+				pieces ^= bit
+				sq = bit.bit_length() - 1
+				pieceType = piece[1]
+				if pieceType == 'P':
+					targets = PAWN_ATTACKS[piece[0]][sq]
+				elif pieceType == 'N':
+					targets = KNIGHT_ATTACKS[sq]
+				elif pieceType == 'K':
+					targets = KING_ATTACKS[sq]
+				elif pieceType == 'B':
+					targets = bishopAttacks(sq, occupied)
+				elif pieceType == 'R':
+					targets = rookAttacks(sq, occupied)
+				else:
+					targets = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+				while targets:
+					target = targets & -targets
+					targets ^= target
+					attacks[target.bit_length() - 1] |= bit
+		return maps
+
+	def isUnderAttack(self, r, c):
+		enemyColor = 'b' if self.whiteToMove else 'w'
+		return self.attackersOf(r * 8 + c, enemyColor, self.occupied['w'] | self.occupied['b']) != 0
+
+	def inCheck(self):
+		kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+		return self.isUnderAttack(kingRow, kingCol)
+
+	'''
+	Legal moves straight from the bitboards: checkers and pinned pieces are found from the king's square,
+	every piece is only offered the target squares that keep its king safe.
+	Returns ([(start square, bitboard of its targets, kind)], in check) with kind one of the MOVE_* constants,
+	generateValidMoves turns them into Move objects and countValidMoves only counts them.
+	'''
+	def legalTargets(self):
+		if self.whiteToMove:
+			us, them = 'w', 'b'
+			kingRow, kingCol = self.whiteKingLocation
+		else:
+			us, them = 'b', 'w'
+			kingRow, kingCol = self.blackKingLocation
+		bb = self.bitboards
+		own = self.occupied[us]
+		enemy = self.occupied[them]
+		occupied = own | enemy
+		kingSq = kingRow * 8 + kingCol
+
+		# 1) King moves -> the king is taken off the board so sliders see through it
+		withoutKing = occupied ^ BITS[kingSq]
+		targets = KING_ATTACKS[kingSq] & ~own
+		safe = 0 # squares the king may step to, also tells castling whether the square it crosses is attacked
+		while targets:
+			bit = targets & -targets
+			targets ^= bit
+			if not self.attackersOf(bit.bit_length() - 1, them, withoutKing):
+				safe |= bit
+		targetLists = [(kingSq, safe, MOVE_NORMAL)]
+
+		checkers = self.attackersOf(kingSq, them, occupied)
+		if checkers & (checkers - 1): # double check -> only the king can move
+			return targetLists, True
+		if checkers:
+			checker = checkers.bit_length() - 1
+			allowed = BETWEEN[kingSq][checker] | checkers # block or capture the checking piece
+		else:
+			allowed = ~own & 0xFFFFFFFFFFFFFFFF
+
+		# 2) Pinned pieces may only move on the line between the king and the pinning piece
+		pinned = self.pinnedPieces(kingSq, them, own, occupied)
+
+		# 3) Other pieces
+		promotionRow = 1 if us == 'w' else 6
+		for piece in ('P', 'N', 'B', 'R', 'Q'):
+			pieces = bb[us + piece]
+			while pieces:
+				bit = pieces & -pieces
+				pieces ^= bit
+				sq = bit.bit_length() - 1
+				kind = MOVE_NORMAL
+				if piece == 'P':
+					targets = PAWN_ATTACKS[us][sq] & enemy
+					step = -8 if us == 'w' else 8
+					push = sq + step
+					if 0 <= push < 64 and not BITS[push] & occupied:
+						targets |= BITS[push]
+						if sq // 8 == (6 if us == 'w' else 1) and not BITS[push + step] & occupied:
+							targets |= BITS[push + step]
+					if sq // 8 == promotionRow:
+						kind = MOVE_PROMOTION
+				elif piece == 'N':
+					targets = KNIGHT_ATTACKS[sq] & ~own
+				elif piece == 'B':
+					targets = bishopAttacks(sq, occupied) & ~own
+				elif piece == 'R':
+					targets = rookAttacks(sq, occupied) & ~own
+				else:
+					targets = (rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)) & ~own
+				targets &= allowed
+				if sq in pinned:
+					targets &= pinned[sq]
+				if targets:
+					targetLists.append((sq, targets, kind))
+
+		# 4) En-passant -> played on the occupancy and tested, the two pawns leaving one rank can uncover a check
+		if self.enpassantPossible is not None:
+			to = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+			captured = to + 8 if us == 'w' else to - 8
+			pawns = PAWN_ATTACKS[them][to] & bb[us + 'P']
+			while pawns:
+				bit = pawns & -pawns
+				pawns ^= bit
+				after = (occupied ^ bit ^ BITS[captured]) | BITS[to]
+				if not self.attackersOf(kingSq, them, after) & ~BITS[captured]:
+					targetLists.append((bit.bit_length() - 1, BITS[to], MOVE_ENPASSANT))
+
+		# 5) Castling -> not out of check, through empty squares and not across an attacked one
+		#    (the square the king crosses is next to it, so step 1 already tested it)
+		if not checkers and self.castleRights:
+			for flag in ((ChessEngine.WHITE_KINGSIDE, ChessEngine.WHITE_QUEENSIDE) if us == 'w' else
+						 (ChessEngine.BLACK_KINGSIDE, ChessEngine.BLACK_QUEENSIDE)):
+				if not self.castleRights & flag:
+					continue
+				empty, kingPath = CASTLING_PATHS[flag]
+				if empty & occupied or not safe & BITS[kingPath[0]] or self.attackersOf(kingPath[1], them, occupied):
+					continue
+				targetLists.append((kingSq, BITS[kingPath[1]], MOVE_CASTLE))
+		return targetLists, checkers != 0
+
+	def generateValidMoves(self):
+		targetLists, inCheck = self.legalTargets()
+		board = self.board
+		us = 'w' if self.whiteToMove else 'b'
+		Move = ChessEngine.Move
+		squareLists = SQUARE_LISTS
+		moves = []
+		for sq, targets, kind in targetLists:
+			startSq = SQUARES[sq]
+			squares = squareLists.get(targets)
+			if squares is None:
+				squares = squaresOf(targets)
+			if kind == MOVE_NORMAL:
+				for to in squares:
+					moves.append(Move(startSq, to, board))
+			elif kind == MOVE_PROMOTION:
+				for to in squares:
+					for pieceType in 'QRBN':
+						moves.append(Move(startSq, to, board, promotion=us + pieceType))
+			else:
+				moves.append(Move(startSq, squares[0], board, isEnpassantMove=kind == MOVE_ENPASSANT,
+								  isCastleMove=kind == MOVE_CASTLE))
+		return self.setGameOver(moves, inCheck)
+
+	'''
+	Bitboard of the squares the pieces of `color` attack, given the occupancy `occupied` (pawns all at once).
+	'''
+	def attackedSquares(self, color, occupied):
+		bb = self.bitboards
+		pawns = bb[color + 'P']
+		if color == 'w':
+			attacked = ((pawns & ~COL_BITS[0]) >> 9) | ((pawns & ~COL_BITS[7]) >> 7)
+		else:
+			attacked = ((pawns & ~COL_BITS[0]) << 7) | ((pawns & ~COL_BITS[7]) << 9)
+		attacked |= KING_ATTACKS[bb[color + 'K'].bit_length() - 1] if bb[color + 'K'] else 0
+		pieces = bb[color + 'N']
+		while pieces:
+			bit = pieces & -pieces
+			pieces ^= bit
+			attacked |= KNIGHT_ATTACKS[bit.bit_length() - 1]
+		pieces = bb[color + 'B'] | bb[color + 'Q']
+		while pieces: # bishopAttacks/rookAttacks inlined, this runs for every node of a perft
+			bit = pieces & -pieces
+			pieces ^= bit
+			sq = bit.bit_length() - 1
+			attacked |= DIAG_ATTACKS[sq][occupied & DIAG_MASK[sq]] | ANTI_ATTACKS[sq][occupied & ANTI_MASK[sq]]
+		pieces = bb[color + 'R'] | bb[color + 'Q']
+		while pieces:
+			bit = pieces & -pieces
+			pieces ^= bit
+			sq = bit.bit_length() - 1
+			attacked |= FILE_ATTACKS[sq][occupied & FILE_MASK[sq]] | RANK_ATTACKS[sq][occupied & RANK_MASK[sq]]
+		return attacked & ALL_SQUARES
+
+	'''
+	Number of legal moves without creating them (the checkMate/staleMate flags are left alone). Same rules as
+	legalTargets, but the squares the other side attacks are found once for all king moves and the pawns that
+	aren't pinned are moved with one shift per kind of pawn move.
+	'''
+	def countValidMoves(self):
+		if self.whiteToMove:
+			us, them = 'w', 'b'
+			kingRow, kingCol = self.whiteKingLocation
+		else:
+			us, them = 'b', 'w'
+			kingRow, kingCol = self.blackKingLocation
+		bb = self.bitboards
+		own = self.occupied[us]
+		enemy = self.occupied[them]
+		occupied = own | enemy
+		kingSq = kingRow * 8 + kingCol
+		kingBit = BITS[kingSq]
+
+		# 1) King moves -> attacked squares with the king taken off the board, so sliders see through it
+		attacked = self.attackedSquares(them, occupied ^ kingBit)
+		count = popCount(KING_ATTACKS[kingSq] & ~own & ~attacked)
+		checkers = self.attackersOf(kingSq, them, occupied) if attacked & kingBit else 0
+		if checkers & (checkers - 1): # double check -> only the king can move
+			return count
+		if checkers:
+			allowed = BETWEEN[kingSq][checkers.bit_length() - 1] | checkers
+		else:
+			allowed = ~own & ALL_SQUARES
+		pinned = self.pinnedPieces(kingSq, them, own, occupied)
+		pinnedBits = 0
+		for sq in pinned:
+			pinnedBits |= BITS[sq]
+
+		# 2) Pawns that aren't pinned, all at once; the pushes and captures landing on the last row promote
+		pawns = bb[us + 'P']
+		free = pawns & ~pinnedBits
+		empty = ~occupied & ALL_SQUARES
+		if us == 'w':
+			single = (free >> 8) & empty
+			double = ((single & ROW_BITS[5]) >> 8) & empty
+			left = ((free & ~COL_BITS[0]) >> 9) & enemy
+			right = ((free & ~COL_BITS[7]) >> 7) & enemy
+			lastRow = ROW_BITS[0]
+		else:
+			single = (free << 8) & empty
+			double = ((single & ROW_BITS[2]) << 8) & empty
+			left = ((free & ~COL_BITS[0]) << 7) & enemy
+			right = ((free & ~COL_BITS[7]) << 9) & enemy
+			lastRow = ROW_BITS[7]
+		count += popCount(double & allowed)
+		for targets in (single & allowed, left & allowed, right & allowed):
+			count += popCount(targets) + 3 * popCount(targets & lastRow)
+
+		# 3) Pinned pawns one by one (a pinned knight can't move at all), then knights and sliders
+		step = -8 if us == 'w' else 8
+		for sq, line in pinned.items():
+			if not pawns & BITS[sq]:
+				continue
+			targets = PAWN_ATTACKS[us][sq] & enemy
+			push = sq + step
+			if 0 <= push < 64 and not BITS[push] & occupied:
+				targets |= BITS[push]
+				if sq // 8 == (6 if us == 'w' else 1) and not BITS[push + step] & occupied:
+					targets |= BITS[push + step]
+			targets &= allowed & line
+			count += popCount(targets) + 3 * popCount(targets & lastRow)
+		pieces = bb[us + 'N'] & ~pinnedBits
+		while pieces:
+			bit = pieces & -pieces
+			pieces ^= bit
+			count += popCount(KNIGHT_ATTACKS[bit.bit_length() - 1] & allowed)
+		pieces = bb[us + 'B'] | bb[us + 'Q'] # a queen is counted as a bishop and as a rook
+		while pieces:
+			bit = pieces & -pieces
+			pieces ^= bit
+			sq = bit.bit_length() - 1
+			targets = allowed & (DIAG_ATTACKS[sq][occupied & DIAG_MASK[sq]]
+							   | ANTI_ATTACKS[sq][occupied & ANTI_MASK[sq]])
+			count += popCount(targets & pinned[sq] if bit & pinnedBits else targets)
+		pieces = bb[us + 'R'] | bb[us + 'Q']
+		while pieces:
+			bit = pieces & -pieces
+			pieces ^= bit
+			sq = bit.bit_length() - 1
+			targets = allowed & (FILE_ATTACKS[sq][occupied & FILE_MASK[sq]]
+							   | RANK_ATTACKS[sq][occupied & RANK_MASK[sq]])
+			count += popCount(targets & pinned[sq] if bit & pinnedBits else targets)
+
+		# 4) En-passant and castling as in legalTargets
+		if self.enpassantPossible is not None:
+			to = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+			captured = to + 8 if us == 'w' else to - 8
+			pawns = PAWN_ATTACKS[them][to] & bb[us + 'P']
+			while pawns:
+				bit = pawns & -pawns
+				pawns ^= bit
+				after = (occupied ^ bit ^ BITS[captured]) | BITS[to]
+				if not self.attackersOf(kingSq, them, after) & ~BITS[captured]:
+					count += 1
+		if not checkers and self.castleRights:
+			for flag in ((ChessEngine.WHITE_KINGSIDE, ChessEngine.WHITE_QUEENSIDE) if us == 'w' else
+						 (ChessEngine.BLACK_KINGSIDE, ChessEngine.BLACK_QUEENSIDE)):
+				if not self.castleRights & flag:
+					continue
+				empty, kingPath = CASTLING_PATHS[flag]
+				if not empty & occupied and not attacked & (BITS[kingPath[0]] | BITS[kingPath[1]]):
+					count += 1
+		return count
+
+	'''
+	perft with bulk counting, on the bitboards alone: the moves of the last ply are only counted, the others are
+	played with playBits/takeBackBits, so no Move object is made and self.board, the Zobrist key and the evaluation
+	are left as they are (they are the same again once perft returns).
+	'''
+	def perft(self, depth):
+		if depth <= 1:
+			return self.countValidMoves() if depth == 1 else 1
+		promotions = PROMOTIONS['w' if self.whiteToMove else 'b']
+		nodes = 0
+		for sq, targets, kind in self.legalTargets()[0]:
+			while targets:
+				bit = targets & -targets
+				targets ^= bit
+				to = bit.bit_length() - 1
+				for promotion in (promotions if kind == MOVE_PROMOTION else (None,)):
+					undo = self.playBits(sq, to, kind, promotion)
+					nodes += self.perft(depth - 1)
+					self.takeBackBits(undo)
+		return nodes
+
+	'''
+	Play a move given as (start square, end square, MOVE_* kind, promoted piece) on the bitboards and the state
+	legalTargets reads (side to move, king squares, castling rights, en-passant square). Returns what takeBackBits
+	needs to undo it.
+	'''
+	def playBits(self, start, to, kind, promotion):
+		if self.whiteToMove:
+			us, them = 'w', 'b'
+		else:
+			us, them = 'b', 'w'
+		bb = self.bitboards
+		occupied = self.occupied
+		fromBit = BITS[start]
+		toBit = BITS[to]
+		for moved in COLOR_PIECES[us]:
+			if bb[moved] & fromBit:
+				break
+		changes = [] # (piece, bits to XOR in and out)
+		if kind == MOVE_ENPASSANT:
+			changes.append((them + 'P', BITS[to + 8 if us == 'w' else to - 8]))
+		elif occupied[them] & toBit:
+			for captured in COLOR_PIECES[them]:
+				if bb[captured] & toBit:
+					changes.append((captured, toBit))
+					break
+		if promotion is None:
+			changes.append((moved, fromBit | toBit))
+		else:
+			changes.append((moved, fromBit))
+			changes.append((promotion, toBit))
+		if kind == MOVE_CASTLE:
+			rookStart, rookEnd = ChessEngine.CASTLING_ROOK_COLS[to % 8]
+			row = to - to % 8
+			changes.append((us + 'R', BITS[row + rookStart] | BITS[row + rookEnd]))
+		for piece, bits in changes:
+			bb[piece] ^= bits
+			occupied[piece[0]] ^= bits
+		undo = (changes, self.whiteKingLocation, self.blackKingLocation, self.castleRights, self.enpassantPossible)
+		if moved[1] == 'K':
+			if us == 'w':
+				self.whiteKingLocation = SQUARES[to]
+			else:
+				self.blackKingLocation = SQUARES[to]
+		self.castleRights &= ChessEngine.CASTLING_MASK[start] & ChessEngine.CASTLING_MASK[to]
+		self.enpassantPossible = SQUARES[(start + to) // 2] if moved[1] == 'P' and abs(to - start) == 16 else None
+		self.whiteToMove = not self.whiteToMove
+		return undo
+
+	def takeBackBits(self, undo):
+		changes, self.whiteKingLocation, self.blackKingLocation, self.castleRights, self.enpassantPossible = undo
+		bb = self.bitboards
+		occupied = self.occupied
+		for piece, bits in changes:
+			bb[piece] ^= bits
+			occupied[piece[0]] ^= bits
+		self.whiteToMove = not self.whiteToMove
+
+	'''
+	{square of a pinned piece of ours: bitboard of the line between the king and the pinning piece (including it)}
+	'''
+	def pinnedPieces(self, kingSq, them, own, occupied):
+		bb = self.bitboards
+		pinned = {}
+		snipers = (rookAttacks(kingSq, 0) & (bb[them + 'R'] | bb[them + 'Q'])) | \
+				  (bishopAttacks(kingSq, 0) & (bb[them + 'B'] | bb[them + 'Q']))
+		while snipers:
+			bit = snipers & -snipers
+			snipers ^= bit
+			sniper = bit.bit_length() - 1
+			blockers = BETWEEN[kingSq][sniper] & occupied
+			if blockers and not (blockers & (blockers - 1)) and blockers & own:
+				pinned[blockers.bit_length() - 1] = BETWEEN[kingSq][sniper] | bit
+		return pinned
+
+	'''
+	Same stages and contract as ChessEngine.GameState.generateStagedMoves, from the bitboards: every piece's
+	legal targets are split into captures (first stage, with all promotions and en-passant) and empty squares.
+	'''
+	def generateStagedMoves(self, quiets=True):
+		if self.whiteToMove:
+			us, them = 'w', 'b'
+			kingRow, kingCol = self.whiteKingLocation
+		else:
+			us, them = 'b', 'w'
+			kingRow, kingCol = self.blackKingLocation
+		bb = self.bitboards
+		board = self.board
+		own = self.occupied[us]
+		enemy = self.occupied[them]
+		occupied = own | enemy
+		kingSq = kingRow * 8 + kingCol
+		kingStart = (kingRow, kingCol)
+		withoutKing = occupied ^ BITS[kingSq]
+		Move = ChessEngine.Move
+		checkers = self.attackersOf(kingSq, them, occupied)
+		if checkers & (checkers - 1): # double check -> only the king can move
+			allowed = 0
+		elif checkers:
+			allowed = BETWEEN[kingSq][checkers.bit_length() - 1] | checkers
+		else:
+			allowed = ~own & 0xFFFFFFFFFFFFFFFF
+		pinned = self.pinnedPieces(kingSq, them, own, occupied) if allowed else {}
+		promotionRow = 1 if us == 'w' else 6
+		step = -8 if us == 'w' else 8
+		pieceSquares = []
+		for piece in ('P', 'N', 'B', 'R', 'Q'):
+			pieces = bb[us + piece] if allowed else 0
+			while pieces:
+				bit = pieces & -pieces
+				pieces ^= bit
+				pieceSquares.append((piece, bit.bit_length() - 1))
+
+		def targetsOf(piece, sq):
+			if piece == 'P':
+				targets = PAWN_ATTACKS[us][sq] & enemy
+				push = sq + step
+				if not BITS[push] & occupied:
+					targets |= BITS[push]
+					if sq // 8 == (6 if us == 'w' else 1) and not BITS[push + step] & occupied:
+						targets |= BITS[push + step]
+			elif piece == 'N':
+				targets = KNIGHT_ATTACKS[sq] & ~own
+			elif piece == 'B':
+				targets = bishopAttacks(sq, occupied) & ~own
+			elif piece == 'R':
+				targets = rookAttacks(sq, occupied) & ~own
+			else:
+				targets = (rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)) & ~own
+			targets &= allowed
+			if sq in pinned:
+				targets &= pinned[sq]
+			return targets
+
+		# 1) Captures and promotions
+		for to in cachedSquares(KING_ATTACKS[kingSq] & enemy):
+			if not self.attackersOf(to[0] * 8 + to[1], them, withoutKing):
+				yield Move(kingStart, to, board)
+		for piece, sq in pieceSquares:
+			startSq = SQUARES[sq]
+			if piece == 'P' and startSq[0] == promotionRow:
+				for to in cachedSquares(targetsOf(piece, sq)):
+					for pieceType in 'QRBN':
+						yield Move(startSq, to, board, promotion=us + pieceType)
+				continue
+			for to in cachedSquares(targetsOf(piece, sq) & enemy):
+				yield Move(startSq, to, board)
+		if self.enpassantPossible is not None:
+			to = self.enpassantPossible[0] * 8 + self.enpassantPossible[1]
+			captured = to + 8 if us == 'w' else to - 8
+			for start in cachedSquares(PAWN_ATTACKS[them][to] & bb[us + 'P']):
+				after = (occupied ^ BITS[start[0] * 8 + start[1]] ^ BITS[captured]) | BITS[to]
+				if not self.attackersOf(kingSq, them, after) & ~BITS[captured]:
+					yield Move(start, SQUARES[to], board, isEnpassantMove=True)
+		if not quiets:
+			return
+
+		# 2) Quiet moves, then castling
+		safe = 0
+		for to in cachedSquares(KING_ATTACKS[kingSq] & ~occupied):
+			sq = to[0] * 8 + to[1]
+			if not self.attackersOf(sq, them, withoutKing):
+				safe |= BITS[sq]
+				yield Move(kingStart, to, board)
+		for piece, sq in pieceSquares:
+			startSq = SQUARES[sq]
+			if piece == 'P' and startSq[0] == promotionRow:
+				continue
+			for to in cachedSquares(targetsOf(piece, sq) & ~enemy):
+				yield Move(startSq, to, board)
+		if not checkers and self.castleRights:
+			for flag in ((ChessEngine.WHITE_KINGSIDE, ChessEngine.WHITE_QUEENSIDE) if us == 'w' else
+						 (ChessEngine.BLACK_KINGSIDE, ChessEngine.BLACK_QUEENSIDE)):
+				if not self.castleRights & flag:
+					continue
+				empty, kingPath = CASTLING_PATHS[flag]
+				if empty & occupied or not safe & BITS[kingPath[0]] or self.attackersOf(kingPath[1], them, occupied):
+					continue
+				yield Move(kingStart, SQUARES[kingPath[1]], board, isCastleMove=True)
+
+	'''
+	Update checkMate/staleMate for a finished list of valid moves (same as ChessEngine.GameState.getValidMoves)
+	'''
+	def setGameOver(self, moves, inCheck):
+		if len(moves) == 0:
+			if inCheck:
+				self.checkMate = True
+			else:
+				self.staleMate = True
+		else:
+			self.checkMate = False
+			self.staleMate = False
+		return moves
@@ -0,0 +1,438 @@
+"""
+Lookup layer consulted before searching: an opening book and endgame tables, both read through mmap so opening
+them costs nothing and a lookup only touches the pages it needs.
+	- opening book: Polyglot style 16 byte records (key, move, weight, learn), sorted by key and found by binary
+	  search. The key is the engine's Zobrist key (not the Polyglot one), castling is stored as the king's move
+	  (e1g1, not e1h1). buildBook makes one from PGN games, weighting every move 2 for a win, 1 for a draw.
+	- endgame tables: king and queen or rook against a lone king (KQK, KRK), solved by retrograde analysis from
+	  the mates found by the engine's move generator. One byte per position (plies to mate + 1, 0 for draws and
+	  illegal positions) at index ((strong king * 64 + piece) * 64 + weak king) * 2 + (1 if the weak side is to
+	  move); positions where black has the piece are looked up with the board mirrored.
+Lookup(book, tables).probe(gs) gives (move, score) or None. Build and try them from the command line:
+	python ChessBook.py book games.pgn --out book.bin --plies 20
+	python ChessBook.py tables --out tables KQK KRK
+	python ChessBook.py probe --fen "<fen>" --book book.bin --tables tables
+"""
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+import ChessAI
+import ChessEngine
+import ChessPGN
+
+ENTRY = struct.Struct('>QHHI') # key, move, weight, learn
+ENTRY_SIZE = ENTRY.size
+KEY = struct.Struct('>Q')
+MAX_WEIGHT = 0xffff
+PROMOTION_CODES = {'N': 1, 'B': 2, 'R': 3, 'Q': 4}
+#points of a book move for the side that played it, by game result
+RESULT_WEIGHTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1), '*': (1, 1)} # (white, black)
+
+TABLE_MATERIALS = ('KQK', 'KRK')
+TABLE_SIZE = 64 * 64 * 64 * 2
+#squares next to every square (row*8 + col)
+KING_SQUARES = tuple(frozenset(r * 8 + c for r, c in targets) for targets in ChessEngine.KING_TARGETS)
+
+
+'''
+Polyglot move encoding: to file, to rank, from file, from rank (3 bits each, rank 0 is the first rank) and the
+promotion piece in bits 12-14.
+'''
+def encodeMove(move):
+	promotion = PROMOTION_CODES[move.promotion[1]] if move.promotion is not None else 0
+	return (promotion << 12) | ((7 - move.startRow) << 9) | (move.startCol << 6) | ((7 - move.endRow) << 3) | move.endCol
+
+
+'''
+Write a book of the first `plies` moves of an iterable of PgnGames to path. Returns the number of entries.
+'''
+def buildBook(games, path, plies=20):
+	weights = {}
+	for game in games:
+		if game.headers.get('SetUp') == '1':
+			continue # only games from the start position share their keys
+		points = RESULT_WEIGHTS.get(game.result, RESULT_WEIGHTS['*'])
+		gs = ChessEngine.GameState()
+		for san in game.moves[:plies]:
+			move = ChessPGN.parseSan(gs, san)
+			if move is None:
+				break
+			entry = (gs.zobristKey, encodeMove(move))
+			weights[entry] = weights.get(entry, 0) + points[0 if gs.whiteToMove else 1]
+			gs.pushMove(move)
+	entries = sorted(((key, move, weight) for (key, move), weight in weights.items() if weight > 0),
+					 key=lambda entry: (entry[0], -entry[2]))
+	scale = max([weight for _, _, weight in entries] + [MAX_WEIGHT]) / MAX_WEIGHT
+	with open(path, 'wb') as f:
+		for key, move, weight in entries:
+			f.write(ENTRY.pack(key, move, max(1, int(weight / scale)), 0))
+	return len(entries)
+
+
+class OpeningBook():
+	'''
+	Read-only, memory-mapped book file written by buildBook. entries(key) does a binary search over the records,
+	so a lookup reads O(log n) of them and nothing is loaded when the book is opened.
+	'''
+	def __init__(self, path):
+		self.file = open(path, 'rb')
+		self.file.seek(0, 2)
+		size = self.file.tell()
+		if size % ENTRY_SIZE:
+			self.file.close()
+			raise ValueError('%s is not a book file (size %d is not a multiple of %d)' % (path, size, ENTRY_SIZE))
+		self.count = size // ENTRY_SIZE
+		self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+	def __len__(self):
+		return self.count
+
+	'''
+	(move, weight, learn) of every record with this key, in file order (highest weight first).
+	'''
+	def entries(self, key):
+		low, high = 0, self.count
+		while low < high: # first record with a key >= key
+			middle = (low + high) // 2
+			if KEY.unpack_from(self.data, middle * ENTRY_SIZE)[0] < key:
+				low = middle + 1
+			else:
+				high = middle
+		entries = []
+		while low < self.count:
+			entryKey, move, weight, learn = ENTRY.unpack_from(self.data, low * ENTRY_SIZE)
+			if entryKey != key:
+				break
+			entries.append((move, weight, learn))
+			low += 1
+		return entries
+
+	'''
+	[(move, weight)] of the book moves of the position that are legal in it, highest weight first.
+	'''
+	def probe(self, gs):
+		entries = self.entries(gs.zobristKey)
+		if not entries:
+			return []
+		moves = {encodeMove(move): move for move in gs.getValidMoves()}
+		return [(moves[code], weight) for code, weight, _ in entries if code in moves]
+
+	'''
+	A book move picked at random in proportion to its weight (the heaviest one with best=True), None if the
+	position isn't in the book.
+	'''
+	def choose(self, gs, best=False, rng=random):
+		moves = self.probe(gs)
+		if not moves:
+			return None
+		if best:
+			return moves[0][0]
+		pick = rng.randrange(sum(weight for _, weight in moves))
+		for move, weight in moves:
+			pick -= weight
+			if pick < 0:
+				return move
+
+	def close(self):
+		if isinstance(self.data, mmap.mmap):
+			self.data.close()
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+def tableIndex(strongKing, piece, weakKing, strongToMove):
+	return ((strongKing * 64 + piece) * 64 + weakKing) * 2 + (0 if strongToMove else 1)
+
+
+'''
+Does a slider on fromSq attack target, with the only other piece that could block it on blocker?
+'''
+def slides(rays, fromSq, target, blocker):
+	for ray in rays[fromSq]:
+		for sq in ray:
+			if sq == target:
+				return True
+			if sq == blocker:
+				break
+	return False
+
+
+'''
+Solve king and pieceType ('Q' or 'R') against king. The positions where the weak side is to move are set up on a
+GameState: its legal moves are counted and the ones without any that are in check are mates. From the mates the
+table is filled backwards one ply at a time by un-moving pieces: a strong side position with a move into a lost
+position is won, a weak side position is lost once every one of its moves leads to a won position.
+Returns the table as a bytearray of TABLE_SIZE bytes.
+'''
+def buildEndgameTable(pieceType):
+	rays = tuple(tuple(tuple(r * 8 + c for r, c in ray) for ray in squareRays)
+				 for squareRays in ChessEngine.SLIDER_RAYS[pieceType])
+	values = bytearray(TABLE_SIZE) # plies to mate + 1, 0 while unknown (and for draws and illegal positions)
+	remaining = bytearray(TABLE_SIZE) # weak side moves not known to lose yet
+	gs = ChessEngine.GameState()
+	board = [['--'] * 8 for _ in range(8)]
+	frontier = []
+	for strongKing in range(64):
+		for piece in range(64):
+			if piece == strongKing:
+				continue
+			for weakKing in range(64):
+				if weakKing == strongKing or weakKing == piece or weakKing in KING_SQUARES[strongKing]:
+					continue
+				for sq, name in ((strongKing, 'wK'), (piece, 'w' + pieceType), (weakKing, 'bK')):
+					board[sq // 8][sq % 8] = name
+				gs.loadBoard([row[:] for row in board], False)
+				moves = gs.generateValidMoves()
+				i = tableIndex(strongKing, piece, weakKing, False)
+				if moves:
+					remaining[i] = len(moves)
+				elif gs.inCheck():
+					values[i] = 1 # mated
+					frontier.append(i)
+				for sq in (strongKing, piece, weakKing):
+					board[sq // 8][sq % 8] = '--'
+
+	plies = 0
+	while frontier:
+		nextFrontier = []
+		for i in frontier:
+			strongToMove = not i & 1
+			weakKing = (i >> 1) & 63
+			piece = (i >> 7) & 63
+			strongKing = i >> 13
+			if not strongToMove: # lost for the weak side -> every strong move into it wins
+				for sq in KING_SQUARES[strongKing]:
+					if sq != piece and sq not in KING_SQUARES[weakKing] and not slides(rays, piece, weakKing, sq):
+						j = tableIndex(sq, piece, weakKing, True)
+						if not values[j]:
+							values[j] = plies + 2
+							nextFrontier.append(j)
+				for ray in rays[piece]:
+					for sq in ray:
+						if sq == strongKing or sq == weakKing:
+							break
+						if not slides(rays, sq, weakKing, strongKing): # else the weak king would be in check
+							j = tableIndex(strongKing, sq, weakKing, True)
+							if not values[j]:
+								values[j] = plies + 2
+								nextFrontier.append(j)
+			else: # won for the strong side -> one more losing move for every weak position leading to it
+				for sq in KING_SQUARES[weakKing]:
+					if sq != piece and sq != strongKing and sq not in KING_SQUARES[strongKing]:
+						j = tableIndex(strongKing, piece, sq, False)
+						if not values[j] and remaining[j]:
+							remaining[j] -= 1
+							if not remaining[j]:
+								values[j] = plies + 2
+								nextFrontier.append(j)
+		frontier = nextFrontier
+		plies += 1
+	return values
+
+
+'''
+Build the tables of materials and write them to directory as <material>.bin.
+'''
+def writeEndgameTables(directory, materials=TABLE_MATERIALS):
+	os.makedirs(directory, exist_ok=True)
+	for material in materials:
+		if material not in TABLE_MATERIALS:
+			raise ValueError('no table for %s (expected one of %s)' % (material, ', '.join(TABLE_MATERIALS)))
+		with open(os.path.join(directory, material + '.bin'), 'wb') as f:
+			f.write(buildEndgameTable(material[1]))
+
+
+class EndgameTables():
+	'''
+	The tables of TABLE_MATERIALS found in directory, memory-mapped. probe(gs) is one index computation and a
+	one byte read.
+	'''
+	def __init__(self, directory):
+		self.files = {}
+		self.tables = {}
+		for material in TABLE_MATERIALS:
+			path = os.path.join(directory, material + '.bin')
+			if not os.path.exists(path):
+				continue
+			f = open(path, 'rb')
+			if os.fstat(f.fileno()).st_size != TABLE_SIZE:
+				f.close()
+				self.close()
+				raise ValueError('%s is not an endgame table (size has to be %d)' % (path, TABLE_SIZE))
+			self.files[material] = f
+			self.tables[material[1]] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+	def __len__(self):
+		return len(self.tables)
+
+	'''
+	(table, index) of the position, None if no table covers its material.
+	'''
+	def locate(self, gs):
+		kings = {}
+		extra = None
+		for r in range(8):
+			for c in range(8):
+				piece = gs.board[r][c]
+				if piece == '--':
+					continue
+				if piece[1] == 'K':
+					kings[piece[0]] = r * 8 + c
+				elif extra is not None:
+					return None
+				else:
+					extra = (piece, r * 8 + c)
+		if extra is None or extra[0][1] not in self.tables or len(kings) != 2:
+			return None
+		strong = extra[0][0]
+		weak = 'b' if strong == 'w' else 'w'
+		flip = 0 if strong == 'w' else 56 # mirror the ranks so the strong side is white
+		index = tableIndex(kings[strong] ^ flip, extra[1] ^ flip, kings[weak] ^ flip, gs.whiteToMove == (strong == 'w'))
+		return self.tables[extra[0][1]], index
+
+	'''
+	Search score of the position for the side to move (ChessAI mate scores, 0 for a draw), None if no table
+	covers it.
+	'''
+	def probe(self, gs):
+		found = self.locate(gs)
+		if found is None:
+			return None
+		table, index = found
+		value = table[index]
+		if not value:
+			return ChessAI.STALEMATE
+		if index & 1: # the weak side is to move
+			return -ChessAI.CHECKMATE + value - 1
+		return ChessAI.CHECKMATE - value + 1
+
+	'''
+	(move, score) of the move keeping the best table score: the quickest mate, or the longest defence. None if
+	no table covers the position or it has no moves.
+	'''
+	def bestMove(self, gs):
+		score = self.probe(gs)
+		if score is None:
+			return None
+		best = None
+		bestScore = None
+		for move in gs.getValidMoves():
+			gs.pushMove(move)
+			childScore = self.probe(gs)
+			gs.popMove()
+			childScore = -childScore if childScore is not None else ChessAI.STALEMATE # the piece was taken
+			if best is None or childScore > bestScore:
+				best, bestScore = move, childScore
+		return (best, score) if best is not None else None
+
+	def close(self):
+		for table in self.tables.values():
+			table.close()
+		for f in self.files.values():
+			f.close()
+		self.tables = {}
+		self.files = {}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+class Lookup():
+	'''
+	Asked before a search: the endgame tables first, then the opening book. Either can be None.
+	'''
+	def __init__(self, book=None, tables=None, best=False):
+		self.book = book
+		self.tables = tables
+		self.best = best # always play the heaviest book move instead of a weighted random one
+
+	'''
+	(move, score) for the side to move, None when the search has to decide. Book moves score 0.
+	'''
+	def probe(self, gs):
+		if self.tables is not None:
+			found = self.tables.bestMove(gs)
+			if found is not None:
+				return found
+		if self.book is not None:
+			move = self.book.choose(gs, self.best)
+			if move is not None:
+				return move, 0
+		return None
+
+	def close(self):
+		if self.book is not None:
+			self.book.close()
+		if self.tables is not None:
+			self.tables.close()
+
+
+'''
+Lookup of the book file and tables directory that exist (either path can be None), None if there is neither.
+'''
+def openLookup(bookPath=None, tablesPath=None):
+	book = OpeningBook(bookPath) if bookPath and os.path.isfile(bookPath) else None
+	tables = EndgameTables(tablesPath) if tablesPath and os.path.isdir(tablesPath) else None
+	if tables is not None and not len(tables):
+		tables = None
+	if book is None and tables is None:
+		return None
+	return Lookup(book, tables)
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Build and probe the opening book and endgame tables')
+	commands = parser.add_subparsers(dest='command', required=True)
+	book = commands.add_parser('book', help='build an opening book from PGN files')
+	book.add_argument('pgn', nargs='+', help='PGN files')
+	book.add_argument('--out', default='book.bin')
+	book.add_argument('--plies', type=int, default=20, help='moves of every game to put in the book')
+	tables = commands.add_parser('tables', help='build endgame tables')
+	tables.add_argument('material', nargs='*', help='any of %s (default: all)' % ', '.join(TABLE_MATERIALS))
+	tables.add_argument('--out', default='tables', help='directory of the table files')
+	probe = commands.add_parser('probe', help='look up a position')
+	probe.add_argument('--fen', default=ChessEngine.START_FEN)
+	probe.add_argument('--book', default='book.bin')
+	probe.add_argument('--tables', default='tables')
+	args = parser.parse_args(argv)
+
+	if args.command == 'book':
+		def games():
+			for path in args.pgn:
+				with open(path, encoding='utf-8', errors='replace') as f:
+					yield from ChessPGN.readGames(f)
+		print('%d entries written to %s' % (buildBook(games(), args.out, args.plies), args.out))
+	elif args.command == 'tables':
+		for material in args.material or TABLE_MATERIALS:
+			writeEndgameTables(args.out, (material,))
+			print('%s written to %s' % (material, os.path.join(args.out, material + '.bin')))
+	else:
+		gs = ChessEngine.GameState.fromFen(args.fen)
+		lookup = openLookup(args.book, args.tables)
+		if lookup is None:
+			print('no book at %s and no tables in %s' % (args.book, args.tables))
+			return 1
+		if lookup.book is not None:
+			for move, weight in lookup.book.probe(gs):
+				print('book %s weight %d' % (move.getChessNotation(), weight))
+		found = lookup.probe(gs)
+		print('lookup: %s' % ('%s score %d' % (found[0].getChessNotation(), found[1]) if found else 'none'))
+		lookup.close()
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
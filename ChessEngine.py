@@ -5,8 +5,153 @@ This is responsible for:
 	- will keep a move log (for doing undo  and look back into current game)
 """
 
+import random
+
+import ChessEvaluation
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+#directions used to scan outwards from a square: 4 orthogonal followed by 4 diagonal
+LINE_DIRECTIONS = ((-1,0), (0,-1), (1,0), (0,1), (-1,-1), (-1,1), (1,-1), (1,1))
+KNIGHT_DIRECTIONS = ((-1,-2) , (-2,-1), (1,-2), (2,-1), (1,2), (2,1), (-1,2), (-2,1))
+#move generation order of the pieces (kept from the original generators so move lists don't change)
+ROOK_DIRECTIONS = ((-1,0), (1,0), (0,-1), (0,1)) # up down left right
+BISHOP_DIRECTIONS = ((-1,-1), (-1,1), (1,-1), (1,1))
+KING_DIRECTIONS = ((-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1))
+
+
+'''
+Per square (row*8 + col) the (row, col) squares along each direction, nearest first, up to the edge of the board.
+'''
+def buildRays(directions):
+	rays = []
+	for sq in range(64):
+		r, c = divmod(sq, 8)
+		squareRays = []
+		for d in directions:
+			ray = []
+			for i in range(1, 8):
+				endRow, endCol = r + d[0] * i, c + d[1] * i
+				if not (0 <= endRow < 8 and 0 <= endCol < 8):
+					break
+				ray.append((endRow, endCol))
+			squareRays.append(tuple(ray))
+		rays.append(tuple(squareRays))
+	return tuple(rays)
+
+
+#precomputed on-board targets, so the generators never do bounds arithmetic:
+#LINE_RAYS[sq][j] is the ray in LINE_DIRECTIONS[j] (possibly empty), the piece tables leave out empty rays
+LINE_RAYS = buildRays(LINE_DIRECTIONS)
+ROOK_RAYS = tuple(tuple(ray for ray in rays if ray) for rays in buildRays(ROOK_DIRECTIONS))
+BISHOP_RAYS = tuple(tuple(ray for ray in rays if ray) for rays in buildRays(BISHOP_DIRECTIONS))
+QUEEN_RAYS = tuple(ROOK_RAYS[sq] + BISHOP_RAYS[sq] for sq in range(64))
+KNIGHT_TARGETS = tuple(tuple(ray[0] for ray in rays if ray) for rays in buildRays(KNIGHT_DIRECTIONS))
+KING_TARGETS = tuple(tuple(ray[0] for ray in rays if ray) for rays in buildRays(KING_DIRECTIONS))
+SLIDER_RAYS = {'R': ROOK_RAYS, 'B': BISHOP_RAYS, 'Q': QUEEN_RAYS}
+JUMP_TARGETS = {'N': KNIGHT_TARGETS, 'K': KING_TARGETS}
+
+#piece values of the static exchange evaluation (the king can recapture, but is never worth losing)
+SEE_VALUES = {'P': 100, 'N': 320, 'B': 330, 'R': 500, 'Q': 900, 'K': 20000, '-': 0}
+
+#castling rights are kept as a bitmask of these flags
+WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+ALL_CASTLING = 15
+#flag -> (FEN letter, king square, rook square, (row, col) of the squares that must be empty)
+CASTLING = {WHITE_KINGSIDE: ('K', (7,4), (7,7), ((7,5), (7,6))),
+			WHITE_QUEENSIDE: ('Q', (7,4), (7,0), ((7,3), (7,2), (7,1))),
+			BLACK_KINGSIDE: ('k', (0,4), (0,7), ((0,5), (0,6))),
+			BLACK_QUEENSIDE: ('q', (0,4), (0,0), ((0,3), (0,2), (0,1)))}
+#rights kept by a move from or to each square (row*8 + col): a king or rook leaving its home square, or a rook
+#being captured on it, loses the rights of that king/rook -> pushMove only has to AND two masks
+CASTLING_MASK = [ALL_CASTLING] * 64
+for _flag, (_, (_kingRow, _kingCol), (_rookRow, _rookCol), _) in CASTLING.items():
+	CASTLING_MASK[_kingRow * 8 + _kingCol] &= ~_flag
+	CASTLING_MASK[_rookRow * 8 + _rookCol] &= ~_flag
+#end column of a castling king move -> (start column, end column) of its rook
+CASTLING_ROOK_COLS = {6: (7, 5), 2: (0, 3)}
+
+"""
+Zobrist keys: one random 64 bit number per (piece, square) and one for black to move. The key of a position is
+the XOR of the numbers of everything on it, so a move only has to XOR in/out the squares it changes.
+A fixed seed keeps keys identical between runs (they can be stored on disk).
+"""
+_zobristRandom = random.Random(20201010)
+ZOBRIST_PIECES = {piece: [_zobristRandom.getrandbits(64) for _ in range(64)]
+				  for piece in ('wP', 'wR', 'wN', 'wB', 'wQ', 'wK', 'bP', 'bR', 'bN', 'bB', 'bQ', 'bK')}
+ZOBRIST_PIECES['--'] = [0] * 64 # empty squares don't change the key
+ZOBRIST_BLACK_TO_MOVE = _zobristRandom.getrandbits(64)
+ZOBRIST_CASTLING = [0] + [_zobristRandom.getrandbits(64) for _ in range(1, 16)] # indexed by the rights bitmask
+ZOBRIST_EN_PASSANT = [_zobristRandom.getrandbits(64) for _ in range(8)] # by file of the en-passant square
+
+
+class MoveCache():
+	'''
+	Bounded LRU cache of getValidMoves results: Zobrist key -> (moves, checkMate, staleMate). The key covers the
+	pieces, side to move, castling rights and en-passant square, i.e. everything the legal moves depend on, so
+	entries never go stale and the same cache can be shared by several GameStates (give it to them with
+	gs.moveCache = cache). Entries are dropped least recently used first once there are more than maxPositions
+	positions or (if set) more than maxMoves moves in total.
+	'''
+	def __init__(self, maxPositions=1 << 14, maxMoves=None):
+		self.maxPositions = maxPositions
+		self.maxMoves = maxMoves
+		self.entries = {} # insertion ordered -> the first key is the least recently used one
+		self.moveCount = 0
+		self.hits = 0
+		self.misses = 0
+		self.evictions = 0
+
+	def __len__(self):
+		return len(self.entries)
+
+	def get(self, key):
+		entry = self.entries.pop(key, None)
+		if entry is None:
+			self.misses += 1
+			return None
+		self.entries[key] = entry # move to the most recently used end
+		self.hits += 1
+		return entry
+
+	def put(self, key, moves, checkMate, staleMate):
+		old = self.entries.pop(key, None)
+		if old is not None:
+			self.moveCount -= len(old[0])
+		self.entries[key] = (tuple(moves), checkMate, staleMate)
+		self.moveCount += len(moves)
+		while len(self.entries) > self.maxPositions or (self.maxMoves is not None and self.moveCount > self.maxMoves
+														 and len(self.entries) > 1):
+			oldest = next(iter(self.entries))
+			self.moveCount -= len(self.entries.pop(oldest)[0])
+			self.evictions += 1
+
+	def clear(self):
+		self.entries = {}
+		self.moveCount = 0
+
+	def stats(self):
+		lookups = self.hits + self.misses
+		return {'positions': len(self.entries), 'moves': self.moveCount, 'hits': self.hits, 'misses': self.misses,
+				'evictions': self.evictions, 'hitRate': self.hits / lookups if lookups else 0.0}
+
 class GameState():
-	def __init__(self):
+	startIncrementalState = None #(zobristKey, mgScore, egScore, phase) of the start position
+
+	'''
+	backend selects how the board is stored:
+		- 'list'     -> the 8x8 list of strings below (default)
+		- 'bitboard' -> ChessBitboard.BitboardGameState, integer bitboards kept next to the list (faster move generation)
+	'''
+	def __new__(cls, backend='list'):
+		if cls is GameState and backend == 'bitboard':
+			import ChessBitboard #imported here because ChessBitboard itself builds on this module
+			cls = ChessBitboard.BitboardGameState
+		elif backend not in ('list', 'bitboard'):
+			raise ValueError("unknown backend '%s'" % backend)
+		return super().__new__(cls)
+
+	def __init__(self, backend='list'):
 		# board is a 8*8 2D list
 		# each element is a 2 character long string consisting of
 			# - lower case (b/w) as color
@@ -25,27 +170,157 @@ class GameState():
 								'B' : self.getBishopMoves, 'Q' : self.getQueenMoves, 'K' : self.getKingMoves}
 		self.whiteToMove = True
 		self.moveLog = []
+		self.undoStack = [] #see pushMove/popMove
+		self.firstPly = 0 #plies played before the position the game started from (see loadBoard)
 		#Keeping track of kings to make valid move calculation and castling easier.
 		self.whiteKingLocation = (7,4)
 		self.blackKingLocation = (0,4)
+		self.castleRights = ALL_CASTLING #bitmask of WHITE_KINGSIDE, WHITE_QUEENSIDE, BLACK_KINGSIDE, BLACK_QUEENSIDE
+		self.enpassantPossible = None #(row, col) a pawn can capture en-passant to, set after every double pawn advance
 
 		#keep track of checkmate and stalemate
 		self.checkMate = False
 		self.staleMate = False
 
+		#Zobrist key and evaluation terms (see ChessEvaluation) of the current position, updated by pushMove/popMove.
+		#Set debugIncremental to True to compare them with a full recompute after every move (slow).
+		if GameState.startIncrementalState is None: # the same for every new game -> computed once
+			GameState.startIncrementalState = (self.computeZobristKey(),) + ChessEvaluation.computeScores(self.board)
+		self.zobristKey, self.mgScore, self.egScore, self.phase = GameState.startIncrementalState
+		self.debugIncremental = False
+
+		#per color attack maps of the position with key attackMapsKey (see getAttackMaps)
+		self.attackMaps = None
+		self.attackMapsKey = None
+		self.backend = backend
+		self.moveCache = None #optional MoveCache shared by getValidMoves
+
 	'''
-	A function to move pieces on the board and record them. (Won't work for castling, pawn-promotion and en-passant)
+	Set up an arbitrary position: board is 8 rows of 8 two character strings (same format as self.board).
+	The move log is cleared and everything derived from the board is recomputed. Castling rights whose king or
+	rook isn't on its home square are dropped.
+	'''
+	def loadBoard(self, board, whiteToMove, fullMoveNumber=1, castleRights=0, enpassantPossible=None):
+		self.board = [list(row) for row in board]
+		self.whiteToMove = whiteToMove
+		self.moveLog = []
+		self.undoStack = []
+		self.firstPly = 2 * (fullMoveNumber - 1) + (0 if whiteToMove else 1)
+		kings = {'wK': [], 'bK': []}
+		for r in range(8):
+			for c in range(8):
+				if self.board[r][c] in kings:
+					kings[self.board[r][c]].append((r, c))
+		if len(kings['wK']) != 1 or len(kings['bK']) != 1:
+			raise ValueError('a position needs exactly one king of each color')
+		self.whiteKingLocation = kings['wK'][0]
+		self.blackKingLocation = kings['bK'][0]
+		for flag, (_, (kingRow, kingCol), (rookRow, rookCol), _) in CASTLING.items():
+			color = 'w' if flag in (WHITE_KINGSIDE, WHITE_QUEENSIDE) else 'b'
+			if self.board[kingRow][kingCol] != color + 'K' or self.board[rookRow][rookCol] != color + 'R':
+				castleRights &= ~flag
+		self.castleRights = castleRights
+		self.enpassantPossible = enpassantPossible
+		self.checkMate = False
+		self.staleMate = False
+		self.zobristKey = self.computeZobristKey()
+		self.mgScore, self.egScore, self.phase = ChessEvaluation.computeScores(self.board)
+		self.attackMaps = None
+		self.attackMapsKey = None
+
+	'''
+	A small picklable copy of the position (no move log) -> cheap to send to another process.
+	'''
+	def snapshot(self):
+		return (''.join(''.join(row) for row in self.board), self.whiteToMove, self.backend, self.castleRights,
+				self.enpassantPossible)
+
+	@staticmethod
+	def fromSnapshot(snapshot):
+		squares, whiteToMove, backend, castleRights, enpassantPossible = snapshot
+		gs = GameState(backend=backend)
+		gs.loadBoard([[squares[i:i + 2] for i in range(r * 16, r * 16 + 16, 2)] for r in range(8)], whiteToMove,
+					 castleRights=castleRights, enpassantPossible=enpassantPossible)
+		return gs
+
+	'''
+	Position from a FEN string, e.g. GameState.fromFen(START_FEN, backend='bitboard').
+	The halfmove clock isn't tracked and is ignored.
+	'''
+	@staticmethod
+	def fromFen(fen, backend='list'):
+		fields = fen.split()
+		if len(fields) < 2:
+			raise ValueError("FEN needs at least the piece placement and side to move: '%s'" % fen)
+		rows = fields[0].split('/')
+		if len(rows) != 8:
+			raise ValueError("FEN piece placement needs 8 ranks: '%s'" % fen)
+		board = []
+		for rank in rows:
+			row = []
+			for char in rank:
+				if char.isdigit():
+					row.extend(['--'] * int(char))
+				elif char.upper() in 'PNBRQK':
+					row.append(('w' if char.isupper() else 'b') + char.upper())
+				else:
+					raise ValueError("unknown piece '%s' in FEN '%s'" % (char, fen))
+			if len(row) != 8:
+				raise ValueError("FEN rank '%s' doesn't have 8 squares" % rank)
+			board.append(row)
+		if fields[1] not in ('w', 'b'):
+			raise ValueError("FEN side to move must be 'w' or 'b': '%s'" % fen)
+		castleRights = 0
+		if len(fields) > 2 and fields[2] != '-':
+			letters = {letter: flag for flag, (letter, _, _, _) in CASTLING.items()}
+			for char in fields[2]:
+				if char not in letters:
+					raise ValueError("unknown castling right '%s' in FEN '%s'" % (char, fen))
+				castleRights |= letters[char]
+		enpassantPossible = None
+		if len(fields) > 3 and fields[3] != '-':
+			square = fields[3]
+			if len(square) != 2 or square[0] not in Move.filesToCols or square[1] not in ('3', '6'):
+				raise ValueError("bad en-passant square '%s' in FEN '%s'" % (square, fen))
+			enpassantPossible = (Move.ranksToRows[square[1]], Move.filesToCols[square[0]])
+		fullMoveNumber = int(fields[5]) if len(fields) > 5 else 1
+		gs = GameState(backend=backend)
+		gs.loadBoard(board, fields[1] == 'w', fullMoveNumber, castleRights, enpassantPossible)
+		return gs
+
+	def toFen(self):
+		ranks = []
+		for row in self.board:
+			rank = ''
+			empty = 0
+			for piece in row:
+				if piece == '--':
+					empty += 1
+					continue
+				if empty:
+					rank += str(empty)
+					empty = 0
+				rank += piece[1] if piece[0] == 'w' else piece[1].lower()
+			if empty:
+				rank += str(empty)
+			ranks.append(rank)
+		castling = ''.join(letter for flag, (letter, _, _, _) in CASTLING.items() if self.castleRights & flag) or '-'
+		if self.enpassantPossible is None:
+			enpassant = '-'
+		else:
+			enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]]
+		fullMoveNumber = (self.firstPly + len(self.undoStack)) // 2 + 1
+		return '%s %s %s %s 0 %d' % ('/'.join(ranks), 'w' if self.whiteToMove else 'b', castling, enpassant,
+									 fullMoveNumber)
+
+	'''
+	A function to move pieces on the board and record them.
+	moveLog is the game's history for the user -> engine code (search, perft) uses pushMove/popMove instead.
 	'''
 	def makeMove(self, move):
-		self.board[move.startRow][move.startCol] = '--'  # empty the start cell
-		self.board[move.endRow][move.endCol] = move.pieceMoved # keep the piece moved on the end cell
+		self.pushMove(move)
 		self.moveLog.append(move) # record the move
-		self.whiteToMove = not self.whiteToMove # swap the turn
-		#UPDATE KING'S POSITION
-		if move.pieceMoved == 'wK':
-			self.whiteKingLocation = (move.endRow, move.endCol)
-		if move.pieceMoved == 'bK':
-			self.blackKingLocation = (move.endRow, move.endCol)
+
 	'''
 	Undo a move.
 	'''
@@ -53,40 +328,191 @@ class GameState():
 		if len(self.moveLog) == 0:
 			print('No move done till now. Can\'t UNDO at the start of the game')
 			return
-		move = self.moveLog.pop()
-		self.board[move.startRow][move.startCol] = move.pieceMoved
-		self.board[move.endRow][move.endCol] = move.pieceCaptured
-		self.whiteToMove = not self.whiteToMove
+		self.moveLog.pop()
+		self.popMove()
+
+	'''
+	Play a move without recording it in moveLog. Everything popMove needs to restore the position is pushed on
+	undoStack as one small tuple: (move, zobristKey, mgScore, egScore, phase, whiteKingLocation, blackKingLocation,
+	castleRights, enpassantPossible)
+	'''
+	def pushMove(self, move):
+		self.undoStack.append((move, self.zobristKey, self.mgScore, self.egScore, self.phase,
+							   self.whiteKingLocation, self.blackKingLocation, self.castleRights, self.enpassantPossible))
+		placed = move.promotion or move.pieceMoved # a promoted pawn is replaced by the new piece
+		self.board[move.startRow][move.startCol] = '--'  # empty the start cell
+		self.board[move.endRow][move.endCol] = placed # keep the piece moved on the end cell
+		self.whiteToMove = not self.whiteToMove # swap the turn
 		#UPDATE KING'S POSITION
 		if move.pieceMoved == 'wK':
-			self.whiteKingLocation = (move.startRow, move.startCol)
+			self.whiteKingLocation = (move.endRow, move.endCol)
 		if move.pieceMoved == 'bK':
-			self.blackKingLocation = (move.startRow, move.startCol)
+			self.blackKingLocation = (move.endRow, move.endCol)
+		start = move.startRow * 8 + move.startCol
+		end = move.endRow * 8 + move.endCol
+		captured = end
+		if move.isEnpassantMove: # the captured pawn is beside the start square, not on the end square
+			captured = move.startRow * 8 + move.endCol
+			self.board[move.startRow][move.endCol] = '--'
+		#UPDATE ZOBRIST KEY -> only the squares of the move, the side to move and the special move state change
+		key = (self.zobristKey ^ ZOBRIST_PIECES[move.pieceMoved][start] ^ ZOBRIST_PIECES[placed][end]
+			   ^ ZOBRIST_PIECES[move.pieceCaptured][captured] ^ ZOBRIST_BLACK_TO_MOVE)
+		#UPDATE EVALUATION -> the moved piece changes square, the captured piece leaves the board
+		mgScores, egScores = ChessEvaluation.SQUARE_SCORES_MG, ChessEvaluation.SQUARE_SCORES_EG
+		self.mgScore += mgScores[placed][end] - mgScores[move.pieceMoved][start] - mgScores[move.pieceCaptured][captured]
+		self.egScore += egScores[placed][end] - egScores[move.pieceMoved][start] - egScores[move.pieceCaptured][captured]
+		self.phase -= ChessEvaluation.PIECE_PHASES[move.pieceCaptured]
+		if move.promotion is not None: # pawns don't count towards the phase, the new piece does
+			self.phase += ChessEvaluation.PIECE_PHASES[placed]
+		if move.isCastleMove: # the rook jumps over the king
+			rook = move.pieceMoved[0] + 'R'
+			rookStart, rookEnd = CASTLING_ROOK_COLS[move.endCol]
+			self.board[move.endRow][rookStart] = '--'
+			self.board[move.endRow][rookEnd] = rook
+			rookStart += move.endRow * 8
+			rookEnd += move.endRow * 8
+			key ^= ZOBRIST_PIECES[rook][rookStart] ^ ZOBRIST_PIECES[rook][rookEnd]
+			self.mgScore += mgScores[rook][rookEnd] - mgScores[rook][rookStart]
+			self.egScore += egScores[rook][rookEnd] - egScores[rook][rookStart]
+		#UPDATE CASTLING RIGHTS AND EN-PASSANT SQUARE
+		castleRights = self.castleRights & CASTLING_MASK[start] & CASTLING_MASK[end]
+		if castleRights != self.castleRights:
+			key ^= ZOBRIST_CASTLING[self.castleRights] ^ ZOBRIST_CASTLING[castleRights]
+			self.castleRights = castleRights
+		if self.enpassantPossible is not None:
+			key ^= ZOBRIST_EN_PASSANT[self.enpassantPossible[1]]
+			self.enpassantPossible = None
+		if move.pieceMoved[1] == 'P' and abs(move.endRow - move.startRow) == 2: # the square the pawn skipped
+			self.enpassantPossible = ((move.startRow + move.endRow) // 2, move.startCol)
+			key ^= ZOBRIST_EN_PASSANT[move.startCol]
+		self.zobristKey = key
+		if self.debugIncremental:
+			self.verifyIncrementalState()
+
+	'''
+	Take back the last pushMove (silently). Returns the move taken back, or None if there was nothing to undo.
+	The saved values are restored as they were instead of being recomputed.
+	'''
+	def popMove(self):
+		if not self.undoStack:
+			return None
+		(move, self.zobristKey, self.mgScore, self.egScore, self.phase, self.whiteKingLocation,
+		 self.blackKingLocation, self.castleRights, self.enpassantPossible) = self.undoStack.pop()
+		self.board[move.startRow][move.startCol] = move.pieceMoved
+		if move.isEnpassantMove:
+			self.board[move.endRow][move.endCol] = '--'
+			self.board[move.startRow][move.endCol] = move.pieceCaptured
+		else:
+			self.board[move.endRow][move.endCol] = move.pieceCaptured
+		if move.isCastleMove:
+			rookStart, rookEnd = CASTLING_ROOK_COLS[move.endCol]
+			self.board[move.endRow][rookStart] = self.board[move.endRow][rookEnd]
+			self.board[move.endRow][rookEnd] = '--'
+		self.whiteToMove = not self.whiteToMove
+		if self.debugIncremental:
+			self.verifyIncrementalState()
+		return move
+
+	'''
+	Zobrist key of the current position computed from scratch.
+	'''
+	def computeZobristKey(self):
+		key = 0 if self.whiteToMove else ZOBRIST_BLACK_TO_MOVE
+		key ^= ZOBRIST_CASTLING[self.castleRights]
+		if self.enpassantPossible is not None:
+			key ^= ZOBRIST_EN_PASSANT[self.enpassantPossible[1]]
+		for r in range(8):
+			for c in range(8):
+				if self.board[r][c] != '--':
+					key ^= ZOBRIST_PIECES[self.board[r][c]][r * 8 + c]
+		return key
+
+	'''
+	Debug check of the incrementally updated key and evaluation terms against a full recompute.
+	'''
+	def verifyIncrementalState(self):
+		expected = self.computeZobristKey()
+		if self.zobristKey != expected:
+			raise RuntimeError('Zobrist key %016x out of sync, full recompute gives %016x' % (self.zobristKey, expected))
+		expected = ChessEvaluation.computeScores(self.board)
+		if (self.mgScore, self.egScore, self.phase) != expected:
+			raise RuntimeError('evaluation terms %s out of sync, full recompute gives %s' % (
+				(self.mgScore, self.egScore, self.phase), expected))
 
-	''' 
-	Get a list of all the valis moves -> the moves that user can actually make. => Considering CHECKS.
+	'''
+	Get a list of all the valid moves -> the moves that user can actually make. => Considering CHECKS.
+	With a moveCache the moves (and checkMate/staleMate) of a position seen before are looked up instead of
+	generated; the list returned is always a new one, so callers can sort or change it.
 	'''
 	def getValidMoves(self):
-		# 1) Get a List of all possible Moves
-		moves = self.getAllPossibleMoves()
-		# 2) Make a move from the list of possible moves
-		for i in range(len(moves)-1, -1, -1): #travering in opposite direction cause we have to remove some elements from the middle.
-			self.makeMove(moves[i])
-			self.whiteToMove = not self.whiteToMove
-		# 3) Generate all of the opponents move after making the move in previous stel
-		# 4) Check if any of the opponents move leads to check -> if so remove the move from our list
-			if self.inCheck():
-				moves.remove(moves[i])
-			self.whiteToMove = not self.whiteToMove
-			self.undoMove()
-		# 5) Return the final list of moves
-		if len(moves) == 0:
-			if self.inCheck():
-				print("CHECK MATE! " + ('w' if not self.whiteToMove else 'b') + " wins")
+		cache = self.moveCache
+		if cache is None:
+			return self.generateValidMoves()
+		entry = cache.get(self.zobristKey)
+		if entry is not None:
+			moves, self.checkMate, self.staleMate = entry
+			return list(moves)
+		moves = self.generateValidMoves()
+		cache.put(self.zobristKey, moves, self.checkMate, self.staleMate)
+		return moves
 
+	''' 
+	Generate the valid moves of the position (getValidMoves without the cache).
+	Checks and pins are found once from the king's square, so no move has to be played to test it.
+	'''
+	def generateValidMoves(self):
+		# 1) Find the pieces giving check and our pieces pinned to the king
+		checks, pins = self.checkForPinsAndChecks()
+		if self.whiteToMove:
+			kingRow, kingCol = self.whiteKingLocation
+		else:
+			kingRow, kingCol = self.blackKingLocation
+		# 2) Squares a non-king move has to land on to get out of check (None -> not in check)
+		validSquares = self.checkEvasionSquares(checks, kingRow, kingCol)
+		# 3) The king can't move to an attacked square, nor away from a sliding piece along the line of its check.
+		#    If the attack maps of this position are already cached they answer that with a lookup, otherwise
+		#    scanning from the few squares the king can reach is cheaper than building the maps.
+		enemyAttacks = None
+		if self.attackMapsKey == self.zobristKey:
+			enemyAttacks = self.attackMaps['b' if self.whiteToMove else 'w']
+			kingForbidden = set()
+			for checkRow, checkCol, d0, d1 in checks:
+				if self.board[checkRow][checkCol][1] in 'RBQ':
+					kingForbidden.add((kingRow - d0, kingCol - d1))
+		# 4) Keep only the possible moves which don't leave the king in check
+		moves = []
+		kingSquares = [] # squares the king can step to -> castling needs the one it crosses to be among them
+		for move in self.getAllPossibleMoves():
+			if move.pieceMoved[1] == 'K':
+				if enemyAttacks is None:
+					safe = not self.isKingMoveIntoCheck(move)
+				else:
+					safe = enemyAttacks[move.endRow * 8 + move.endCol] == 0 and (move.endRow, move.endCol) not in kingForbidden
+				if safe:
+					moves.append(move)
+					kingSquares.append((move.endRow, move.endCol))
+				continue
+			if validSquares is not None and (move.endRow, move.endCol) not in validSquares:
+				continue
+			pin = pins.get((move.startRow, move.startCol))
+			if pin is not None and (move.endRow - move.startRow) * pin[1] != (move.endCol - move.startCol) * pin[0]:
+				continue # pinned piece leaving the line of the pin
+			moves.append(move)
+		# 5) Special moves. En-passant removes two pawns from one rank, which can uncover a check no pin covers,
+		#    so it is tested by playing it. Castling is only possible when not in check.
+		if self.enpassantPossible is not None:
+			enpassantMoves = []
+			self.getEnpassantMoves(enpassantMoves)
+			for move in enpassantMoves:
+				if not self.isEnpassantMoveIntoCheck(move):
+					moves.append(move)
+		if not checks and self.castleRights:
+			self.getCastleMoves(moves, kingSquares)
+		# 6) Return the final list of moves
+		if len(moves) == 0: # the game is over -> ChessMain announces the result
+			if len(checks) > 0:
 				self.checkMate = True
 			else:
-				print("DRAW DUE TO STALEMATE")
 				self.staleMate = True
 		else:
 			self.checkMate = False
@@ -94,28 +520,377 @@ class GameState():
 		return moves
 
 	'''
-	Checks if the current player is under check
+	Squares a move other than a king move has to land on to get out of the checks (as found by
+	checkForPinsAndChecks) of the king on (kingRow, kingCol): None when not in check, empty in double check.
+	'''
+	def checkEvasionSquares(self, checks, kingRow, kingCol):
+		if not checks:
+			return None
+		validSquares = set()
+		if len(checks) > 1: # double check -> only the king can move
+			return validSquares
+		checkRow, checkCol, d0, d1 = checks[0]
+		if self.board[checkRow][checkCol][1] == 'N': # a knight check can't be blocked, only captured
+			validSquares.add((checkRow, checkCol))
+		else:
+			for i in range(1, 8): # every square between the king and the checking piece (including it)
+				square = (kingRow + d0 * i, kingCol + d1 * i)
+				validSquares.add(square)
+				if square == (checkRow, checkCol):
+					break
+		return validSquares
+
+	'''
+	Legal moves one at a time, in two stages: captures and promotions (en-passant included) first, then quiet moves
+	and castling. A stage is only generated once the one before is used up, and every move is tested for legality
+	when it is reached, so a caller that stops early (a cutoff, hasLegalMove) never pays for the rest.
+	quiets=False ends after the first stage. The position has to be the same whenever the generator is resumed
+	(pushMove/popMove around every move is fine). Unlike getValidMoves, checkMate/staleMate are left alone.
+	'''
+	def generateStagedMoves(self, quiets=True):
+		checks, pins = self.checkForPinsAndChecks()
+		if self.whiteToMove:
+			allyColor = 'w'
+			kingRow, kingCol = self.whiteKingLocation
+		else:
+			allyColor = 'b'
+			kingRow, kingCol = self.blackKingLocation
+		validSquares = self.checkEvasionSquares(checks, kingRow, kingCol)
+		board = self.board
+		squares = [(r, c) for r in range(8) for c in range(8) if board[r][c][0] == allyColor]
+		for r, c in squares:
+			moves = []
+			self.getTacticalMoves(r, c, moves)
+			for move in moves:
+				if self.isLegalMove(move, pins, validSquares):
+					yield move
+		if self.enpassantPossible is not None:
+			moves = []
+			self.getEnpassantMoves(moves)
+			for move in moves:
+				if not self.isEnpassantMoveIntoCheck(move):
+					yield move
+		if not quiets:
+			return
+		kingSquares = [] # legal king steps -> castling needs the square it crosses to be among them
+		for r, c in squares:
+			moves = []
+			self.getQuietMoves(r, c, moves)
+			for move in moves:
+				if self.isLegalMove(move, pins, validSquares):
+					if move.pieceMoved[1] == 'K':
+						kingSquares.append((move.endRow, move.endCol))
+					yield move
+		if not checks and self.castleRights:
+			moves = []
+			self.getCastleMoves(moves, kingSquares)
+			for move in moves:
+				yield move
+
+	'''
+	Does the side to move have any legal move? Stops at the first one found (the position is over when it hasn't:
+	checkmate if in check, stalemate otherwise).
+	'''
+	def hasLegalMove(self):
+		for _ in self.generateStagedMoves():
+			return True
+		return False
+
+	'''
+	Legality of a pseudo-legal move (not en-passant or castling) given the pins and check evasion squares.
+	'''
+	def isLegalMove(self, move, pins, validSquares):
+		if move.pieceMoved[1] == 'K':
+			return not self.isKingMoveIntoCheck(move)
+		if validSquares is not None and (move.endRow, move.endCol) not in validSquares:
+			return False
+		pin = pins.get((move.startRow, move.startCol))
+		return pin is None or (move.endRow - move.startRow) * pin[1] == (move.endCol - move.startCol) * pin[0]
+
+	'''
+	Scan outwards from the king of the side to move and return
+		- checks: list of (row, col, dirRow, dirCol) for every enemy piece giving check
+		- pins: dict mapping the (row, col) of a pinned ally piece to the direction of the pin
+	'''
+	def checkForPinsAndChecks(self):
+		checks = []
+		pins = {}
+		if self.whiteToMove:
+			enemyColor, allyColor = 'b', 'w'
+			startRow, startCol = self.whiteKingLocation
+		else:
+			enemyColor, allyColor = 'w', 'b'
+			startRow, startCol = self.blackKingLocation
+		for j, ray in enumerate(LINE_RAYS[startRow * 8 + startCol]):
+			possiblePin = None
+			i = 0
+			for endRow, endCol in ray:
+				i += 1
+				endPiece = self.board[endRow][endCol]
+				if endPiece[0] == allyColor:
+					if possiblePin is None: # first ally piece on the ray could be pinned
+						possiblePin = (endRow, endCol)
+					else: # second ally piece -> no pin or check from this direction
+						break
+				elif endPiece[0] == enemyColor:
+					if self.attacksAlongRay(endPiece, j, i):
+						d = LINE_DIRECTIONS[j]
+						if possiblePin is None:
+							checks.append((endRow, endCol, d[0], d[1]))
+						else:
+							pins[possiblePin] = d
+					break
+		enemyKnight = enemyColor + 'N'
+		for endRow, endCol in KNIGHT_TARGETS[startRow * 8 + startCol]:
+			if self.board[endRow][endCol] == enemyKnight:
+				checks.append((endRow, endCol, endRow - startRow, endCol - startCol))
+		return checks, pins
+
+	'''
+	Can the enemy piece found i squares away from the king along LINE_DIRECTIONS[j] attack the king?
+	'''
+	def attacksAlongRay(self, piece, j, i):
+		pieceType = piece[1]
+		if pieceType == 'Q':
+			return True
+		if pieceType == 'R':
+			return j < 4 # orthogonal directions
+		if pieceType == 'B':
+			return j >= 4 # diagonal directions
+		if i != 1:
+			return False
+		if pieceType == 'K':
+			return True
+		if pieceType == 'P': # pawns only attack diagonally forward
+			return j in ((6, 7) if piece[0] == 'w' else (4, 5))
+		return False
+
+	'''
+	Checks if sq (r,c) is attacked by any piece of enemyColor by scanning outwards from it.
+	'''
+	def isSquareAttacked(self, r, c, enemyColor):
+		board = self.board
+		for j, ray in enumerate(LINE_RAYS[r * 8 + c]):
+			i = 0
+			for endRow, endCol in ray:
+				i += 1
+				endPiece = board[endRow][endCol]
+				if endPiece != '--':
+					if endPiece[0] == enemyColor and self.attacksAlongRay(endPiece, j, i):
+						return True
+					break
+		enemyKnight = enemyColor + 'N'
+		for endRow, endCol in KNIGHT_TARGETS[r * 8 + c]:
+			if board[endRow][endCol] == enemyKnight:
+				return True
+		return False
+
+	'''
+	Would the king be in check after playing this king move? The king is lifted off its square while testing
+	so that sliding pieces see through it.
+	'''
+	def isKingMoveIntoCheck(self, move):
+		enemyColor = 'b' if move.pieceMoved[0] == 'w' else 'w'
+		self.board[move.startRow][move.startCol] = '--'
+		self.board[move.endRow][move.endCol] = move.pieceMoved
+		attacked = self.isSquareAttacked(move.endRow, move.endCol, enemyColor)
+		self.board[move.endRow][move.endCol] = move.pieceCaptured
+		self.board[move.startRow][move.startCol] = move.pieceMoved
+		return attacked
+
+	'''
+	Would our king be in check after this en-passant capture? Played on the board and taken back.
+	'''
+	def isEnpassantMoveIntoCheck(self, move):
+		enemyColor = 'b' if move.pieceMoved[0] == 'w' else 'w'
+		kingRow, kingCol = self.whiteKingLocation if move.pieceMoved[0] == 'w' else self.blackKingLocation
+		self.board[move.startRow][move.startCol] = '--'
+		self.board[move.startRow][move.endCol] = '--'
+		self.board[move.endRow][move.endCol] = move.pieceMoved
+		attacked = self.isSquareAttacked(kingRow, kingCol, enemyColor)
+		self.board[move.endRow][move.endCol] = '--'
+		self.board[move.startRow][move.endCol] = move.pieceCaptured
+		self.board[move.startRow][move.startCol] = move.pieceMoved
+		return attacked
+
+	'''
+	Attack maps of the current position: {'w': [...], 'b': [...]} where maps[color][row*8 + col] is a bitmask of the
+	squares (bit row*8 + col) holding pieces of that color which attack (row, col). Computed on first use and
+	cached until the position changes (the cache is keyed by the Zobrist key, so pushMove/popMove don't pay for it).
+	'''
+	def getAttackMaps(self):
+		if self.attackMapsKey != self.zobristKey:
+			self.attackMaps = self.computeAttackMaps()
+			self.attackMapsKey = self.zobristKey
+		return self.attackMaps
+
+	def computeAttackMaps(self):
+		maps = {'w': [0] * 64, 'b': [0] * 64}
+		for r in range(8):
+			for c in range(8):
+				piece = self.board[r][c]
+				if piece == '--':
+					continue
+				attacks = maps[piece[0]]
+				bit = 1 << (r * 8 + c)
+				pieceType = piece[1]
+				if pieceType == 'P': # pawns only attack diagonally forward
+					endRow = r - 1 if piece[0] == 'w' else r + 1
+					if 0 <= endRow < 8:
+						if c - 1 >= 0:
+							attacks[endRow * 8 + c - 1] |= bit
+						if c + 1 < 8:
+							attacks[endRow * 8 + c + 1] |= bit
+				elif pieceType == 'N' or pieceType == 'K':
+					for d in (KNIGHT_DIRECTIONS if pieceType == 'N' else LINE_DIRECTIONS):
+						endRow = r + d[0]
+						endCol = c + d[1]
+						if 0 <= endRow < 8 and 0 <= endCol < 8:
+							attacks[endRow * 8 + endCol] |= bit
+				else:
+					if pieceType == 'R':
+						directions = LINE_DIRECTIONS[:4]
+					elif pieceType == 'B':
+						directions = LINE_DIRECTIONS[4:]
+					else:
+						directions = LINE_DIRECTIONS
+					for d in directions:
+						for i in range(1, 8):
+							endRow = r + d[0] * i
+							endCol = c + d[1] * i
+							if endRow < 0 or endRow >= 8 or endCol < 0 or endCol >= 8:
+								break #off board
+							attacks[endRow * 8 + endCol] |= bit
+							if self.board[endRow][endCol] != '--': # the first piece on the ray stops it (any color)
+								break
+		return maps
+
+	'''
+	List of the (row, col) squares of the pieces of `color` attacking (r, c).
+	'''
+	def attackers(self, r, c, color):
+		mask = self.getAttackMaps()[color][r * 8 + c]
+		squares = []
+		while mask:
+			bit = mask & -mask
+			mask ^= bit
+			squares.append(divmod(bit.bit_length() - 1, 8))
+		return squares
+
+	'''
+	Is (r, c) attacked by any piece of `color`?
+	'''
+	def isAttacked(self, r, c, color):
+		return self.getAttackMaps()[color][r * 8 + c] != 0
+
+	'''
+	Static exchange evaluation of a capture: the material (SEE_VALUES) the side playing `move` wins when both
+	sides keep recapturing on the target square with their least valuable attacker, each side stopping as soon as
+	going on would lose material. Only the attacker sets are looked at (nothing is played on the board); sliders
+	behind a piece that has recaptured join in, pins are ignored.
+	'''
+	def staticExchange(self, move):
+		sq = move.endRow * 8 + move.endCol
+		removed = 1 << (move.startRow * 8 + move.startCol) # squares of the pieces that have left for sq
+		if move.isEnpassantMove:
+			removed |= 1 << (move.startRow * 8 + move.endCol)
+		gain = [SEE_VALUES[move.pieceCaptured[1]]]
+		onSquare = SEE_VALUES[move.pieceMoved[1]]
+		if move.promotion is not None:
+			gain[0] += SEE_VALUES[move.promotion[1]] - SEE_VALUES['P']
+			onSquare = SEE_VALUES[move.promotion[1]]
+		color = 'b' if move.pieceMoved[0] == 'w' else 'w'
+		while True:
+			attacker = self.leastValuableAttacker(sq, color, removed)
+			if attacker is None:
+				break
+			gain.append(onSquare - gain[-1]) # what the side recapturing is up if the other side stops here
+			onSquare = SEE_VALUES[attacker[0]]
+			removed |= attacker[1]
+			color = 'b' if color == 'w' else 'w'
+		for d in range(len(gain) - 1, 0, -1):
+			gain[d - 1] = -max(-gain[d - 1], gain[d])
+		return gain[0]
+
+	'''
+	(piece type, square bit) of the least valuable piece of `color` attacking sq, None if there is none.
+	The squares in the bitmask `removed` count as empty.
+	'''
+	def leastValuableAttacker(self, sq, color, removed):
+		board = self.board
+		best = None
+		for j, ray in enumerate(LINE_RAYS[sq]):
+			i = 0
+			for endRow, endCol in ray:
+				i += 1
+				bit = 1 << (endRow * 8 + endCol)
+				if removed & bit:
+					continue
+				piece = board[endRow][endCol]
+				if piece != '--':
+					if piece[0] == color and self.attacksAlongRay(piece, j, i):
+						if piece[1] == 'P':
+							return 'P', bit
+						if best is None or SEE_VALUES[piece[1]] < SEE_VALUES[best[0]]:
+							best = (piece[1], bit)
+					break
+		knight = color + 'N'
+		if best is None or SEE_VALUES[best[0]] > SEE_VALUES['N']:
+			for endRow, endCol in KNIGHT_TARGETS[sq]:
+				bit = 1 << (endRow * 8 + endCol)
+				if board[endRow][endCol] == knight and not removed & bit:
+					return 'N', bit
+		return best
+
+	'''
+	Checks if the current player is under check: one scan outwards from the king, so the attack maps of a new
+	position aren't built just for this (the quiescence search asks at every node)
 	'''
 	def inCheck(self):
 		if self.whiteToMove:
-			return self.isUnderAttack(self.whiteKingLocation[0], self.whiteKingLocation[1])
+			return self.isSquareAttacked(self.whiteKingLocation[0], self.whiteKingLocation[1], 'b')
 		else:
-			return self.isUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
+			return self.isSquareAttacked(self.blackKingLocation[0], self.blackKingLocation[1], 'w')
 
 	'''
 	Checks if sq (r,c) is under attack or not
 	'''
 	def isUnderAttack(self, r, c):
-		self.whiteToMove = not self.whiteToMove # switch to opponent's turn
-		opponentsMove = self.getAllPossibleMoves() #generate opponents move
-		self.whiteToMove = not self.whiteToMove # switch back turns
-		for move in opponentsMove:
-			if move.endRow == r and move.endCol == c: #sq under attak
-				return True
-		return False
+		return self.isAttacked(r, c, 'b' if self.whiteToMove else 'w') # attacked by the opponent
+
+	'''
+	Count the leaf nodes of the tree of valid moves `depth` plies deep. Used to test and time the move generator.
+	'''
+	def perft(self, depth):
+		if depth == 0:
+			return 1
+		checkMate, staleMate = self.checkMate, self.staleMate # perft shouldn't change the game's result flags
+		moves = self.getValidMoves()
+		if depth == 1:
+			nodes = len(moves)
+		else:
+			nodes = 0
+			for move in moves:
+				self.pushMove(move)
+				nodes += self.perft(depth - 1)
+				self.popMove()
+		self.checkMate, self.staleMate = checkMate, staleMate
+		return nodes
+
+	'''
+	Perft split by root move -> {chess notation of the move : nodes below it}. Handy to find where two generators disagree.
+	'''
+	def divide(self, depth):
+		counts = {}
+		for move in self.getValidMoves():
+			self.pushMove(move)
+			counts[move.getChessNotation()] = self.perft(depth - 1)
+			self.popMove()
+		return counts
 
 	'''
 	Get a list of all possible moves -> Without considering CHECKS
+	(en-passant and castling are added by getValidMoves, which has to test them against checks anyway)
 	'''
 	def getAllPossibleMoves(self):
 		moves = []
@@ -133,6 +908,9 @@ class GameState():
 	Get all possible moves for a pawn located at (r,c) and add the moves to the list.
 	'''
 	def getPawnMoves(self, r, c, moves):
+		if r == 1 and self.whiteToMove or r == 6 and not self.whiteToMove: # every move of this pawn promotes
+			self.getPromotionMoves(r, c, moves)
+			return
 		if self.whiteToMove and self.board[r][c][0] == 'w': # WHITE PAWN MOVES
 			if self.board[r-1][c] == '--': # 1 square pawn advance
 				moves.append(Move((r, c), (r-1, c), self.board))
@@ -154,85 +932,176 @@ class GameState():
 			if c+1 < len(self.board) and self.board[r+1][c+1][0] == 'w': # enemy pice to capture to the right
 				moves.append(Move((r, c), (r+1, c+1), self.board))
 
+	'''
+	Moves of a pawn one step from the last rank: every advance or capture comes in 4 versions, one per promotion piece.
+	'''
+	def getPromotionMoves(self, r, c, moves):
+		allyColor = 'w' if self.whiteToMove else 'b'
+		enemyColor = 'b' if self.whiteToMove else 'w'
+		endRow = r - 1 if self.whiteToMove else r + 1
+		for endCol in (c - 1, c, c + 1):
+			if endCol < 0 or endCol >= 8:
+				continue
+			endPiece = self.board[endRow][endCol]
+			if (endPiece == '--') if endCol == c else (endPiece[0] == enemyColor):
+				for pieceType in 'QRBN':
+					moves.append(Move((r, c), (endRow, endCol), self.board, promotion=allyColor + pieceType))
+
+	'''
+	En-passant captures onto self.enpassantPossible (nothing is added when there is none).
+	'''
+	def getEnpassantMoves(self, moves):
+		if self.enpassantPossible is None:
+			return
+		endRow, endCol = self.enpassantPossible
+		if self.whiteToMove:
+			pawn, r = 'wP', endRow + 1
+		else:
+			pawn, r = 'bP', endRow - 1
+		for c in (endCol - 1, endCol + 1):
+			if 0 <= c < 8 and self.board[r][c] == pawn:
+				moves.append(Move((r, c), (endRow, endCol), self.board, isEnpassantMove=True))
+
+	'''
+	Castling moves of the side to move, which must not be in check: the right must still be there, the squares
+	between king and rook empty, and the king may not pass or land on an attacked square.
+	kingSquares are the squares the king can legally step to, the square it passes has to be one of them.
+	'''
+	def getCastleMoves(self, moves, kingSquares):
+		if self.whiteToMove:
+			flags, enemyColor = (WHITE_KINGSIDE, WHITE_QUEENSIDE), 'b'
+		else:
+			flags, enemyColor = (BLACK_KINGSIDE, BLACK_QUEENSIDE), 'w'
+		for flag in flags:
+			if not self.castleRights & flag:
+				continue
+			_, kingSq, _, between = CASTLING[flag]
+			if any(self.board[r][c] != '--' for r, c in between):
+				continue
+			if between[0] not in kingSquares or self.isSquareAttacked(kingSq[0], between[1][1], enemyColor):
+				continue
+			moves.append(Move(kingSq, between[1], self.board, isCastleMove=True))
+
 	'''
 	Get all possible moves for a Rook located at (r,c) and add the moves to the list.
 	'''
 	def getRookMoves(self, r, c, moves):
-		directions = ((-1,0) , (1,0) , (0,-1), (0,1)) # up down left right
-		enemyColor = 'b' if self.whiteToMove else 'w' # opponenet's color according to current turn
-		for d in directions:
-			for i in range(1,8):
-				endRow = r + (d[0] * i)
-				endCol = c + (d[1] * i)
-				if endRow >=0 and endRow < len(self.board) and endCol >=0 and endCol < len(self.board[endRow]):
-					if self.board[endRow][endCol] == '--': #Empty Square
-						moves.append(Move((r, c), (endRow, endCol), self.board))
-					elif self.board[endRow][endCol][0] == enemyColor: # capture opponent's piece
-						moves.append(Move((r, c), (endRow, endCol), self.board))
-						break
-					else:
-						break # same color piece
-				else :
-					break #off board
+		self.getRayMoves(r, c, ROOK_RAYS[r * 8 + c], moves)
 
 	'''
 	Get all possible moves for a Knight located at (r,c) and add the moves to the list.
 	'''
 	def getKnightMoves(self, r, c, moves):
-		directions = ((-1,-2) , (-2,-1), (1,-2), (2,-1), (1,2), (2,1), (-1,2), (-2,1))
-		allyColor = 'w' if self.whiteToMove else 'b' # opponenet's color according to current turn
-		for d in directions:
-			endRow = r + d[0]
-			endCol = c + d[1]
-			if endRow >=0 and endRow < len(self.board) and endCol >=0 and endCol < len(self.board[endRow]):
-				endPiece = self.board[endRow][endCol]
-				if endPiece[0] != allyColor:
-					moves.append(Move((r, c), (endRow, endCol), self.board))
+		self.getJumpMoves(r, c, KNIGHT_TARGETS[r * 8 + c], moves)
 
 	'''
 	Get all possible moves for a Bishop located at (r,c) and add the moves to the list.
 	'''
 	def getBishopMoves(self, r, c, moves):
-		directions = ((-1,-1), (-1,1), (1,-1), (1,1)) # (top left) (top right) (bottom left) (bottom right)
-		enemyColor = 'b' if self.whiteToMove else 'w' # opponenet's color according to current turn
-		for d in directions:
-			for i in range(1,8):
-				endRow = r + (d[0] * i)
-				endCol = c + (d[1] * i)
-				if endRow >=0 and endRow < len(self.board) and endCol >=0 and endCol < len(self.board[endRow]):
-					if self.board[endRow][endCol] == '--': #Empty Square
-						moves.append(Move((r, c), (endRow, endCol), self.board))
-					elif self.board[endRow][endCol][0] == enemyColor: # capture opponent's piece
-						moves.append(Move((r, c), (endRow, endCol), self.board))
-						break
-					else:
-						break # same color piece
-				else :
-					break #off board
+		self.getRayMoves(r, c, BISHOP_RAYS[r * 8 + c], moves)
 
 	'''
 	Get all possible moves for a Queen located at (r,c) and add the moves to the list.
 	'''
 	def getQueenMoves(self, r, c, moves):
-		self.getRookMoves(r, c, moves)
-		self.getBishopMoves(r, c, moves)
+		self.getRayMoves(r, c, QUEEN_RAYS[r * 8 + c], moves)
 
 	'''
 	Get all possible moves for a King located at (r,c) and add the moves to the list.
 	'''
 	def getKingMoves(self, r, c, moves):
-		directions = ((-1,-1), (-1,0), (-1,1), (0,-1), (0,1), (1,-1), (1,0), (1,1))
+		self.getJumpMoves(r, c, KING_TARGETS[r * 8 + c], moves)
+
+	'''
+	Sliding piece moves along precomputed rays: every ray only holds on-board squares, nearest first, so a ray
+	is walked until the first piece (captured if it is an enemy one).
+	'''
+	def getRayMoves(self, r, c, rays, moves):
+		board = self.board
+		enemyColor = 'b' if self.whiteToMove else 'w' # opponenet's color according to current turn
+		start = (r, c)
+		for ray in rays:
+			for end in ray:
+				endPiece = board[end[0]][end[1]]
+				if endPiece == '--': #Empty Square
+					moves.append(Move(start, end, board))
+				else:
+					if endPiece[0] == enemyColor: # capture opponent's piece
+						moves.append(Move(start, end, board))
+					break # no sliding past a piece
+
+	'''
+	Knight and king moves to precomputed on-board target squares.
+	'''
+	def getJumpMoves(self, r, c, targets, moves):
+		board = self.board
 		allyColor = 'w' if self.whiteToMove else 'b' # ally color according to current turn
-		for d in directions:
-			endRow = r + d[0]
-			endCol = c + d[1]
-			if endRow >=0 and endRow < len(self.board) and endCol >=0 and endCol < len(self.board[endRow]):
-				endPiece = self.board[endRow][endCol]
-				if endPiece[0] != allyColor:
-					moves.append(Move((r, c), (endRow, endCol), self.board))
+		start = (r, c)
+		for end in targets:
+			if board[end[0]][end[1]][0] != allyColor:
+				moves.append(Move(start, end, board))
+
+	'''
+	Captures and promotions of the piece on (r,c) -> the first stage of generateStagedMoves.
+	'''
+	def getTacticalMoves(self, r, c, moves):
+		board = self.board
+		pieceType = board[r][c][1]
+		enemyColor = 'b' if self.whiteToMove else 'w'
+		start = (r, c)
+		if pieceType == 'P':
+			if r == (1 if self.whiteToMove else 6): # every move of this pawn promotes
+				self.getPromotionMoves(r, c, moves)
+				return
+			endRow = r - 1 if self.whiteToMove else r + 1
+			for endCol in (c - 1, c + 1):
+				if 0 <= endCol < 8 and board[endRow][endCol][0] == enemyColor:
+					moves.append(Move(start, (endRow, endCol), board))
+		elif pieceType in JUMP_TARGETS:
+			for end in JUMP_TARGETS[pieceType][r * 8 + c]:
+				if board[end[0]][end[1]][0] == enemyColor:
+					moves.append(Move(start, end, board))
+		else:
+			for ray in SLIDER_RAYS[pieceType][r * 8 + c]:
+				for end in ray:
+					endPiece = board[end[0]][end[1]]
+					if endPiece != '--':
+						if endPiece[0] == enemyColor:
+							moves.append(Move(start, end, board))
+						break
+
+	'''
+	Moves of the piece on (r,c) to empty squares, without promotions and castling -> second stage of generateStagedMoves.
+	'''
+	def getQuietMoves(self, r, c, moves):
+		board = self.board
+		pieceType = board[r][c][1]
+		start = (r, c)
+		if pieceType == 'P':
+			if self.whiteToMove:
+				step, homeRow, promotionRow = -1, 6, 1
+			else:
+				step, homeRow, promotionRow = 1, 1, 6
+			if r != promotionRow and board[r + step][c] == '--': # 1 square pawn advance
+				moves.append(Move(start, (r + step, c), board))
+				if r == homeRow and board[r + 2 * step][c] == '--': # 2 square pawn advance
+					moves.append(Move(start, (r + 2 * step, c), board))
+		elif pieceType in JUMP_TARGETS:
+			for end in JUMP_TARGETS[pieceType][r * 8 + c]:
+				if board[end[0]][end[1]] == '--':
+					moves.append(Move(start, end, board))
+		else:
+			for ray in SLIDER_RAYS[pieceType][r * 8 + c]:
+				for end in ray:
+					if board[end[0]][end[1]] != '--':
+						break
+					moves.append(Move(start, end, board))
 
 
 class Move():
+	# no per-instance __dict__ -> a move is a small fixed size object, thousands of them are made per search
+	__slots__ = ('startRow', 'startCol', 'endRow', 'endCol', 'pieceMoved', 'pieceCaptured', 'moveId',
+				 'isEnpassantMove', 'isCastleMove', 'promotion')
 
 	#maps keys to values
 	#For converting (row, col) to Chess Notations => (0,0) -> a8
@@ -242,18 +1111,36 @@ class Move():
 	filesToCols = {"a":0, "b":1, "c":2, "d":3,
 				   "e":4, "f":5, "g":6, "h":7}
 	colsToFiles = {v:k  for k,v in filesToCols.items()}
+	#added to the moveId of underpromotions -> a queen promotion has the id of a plain move between the same squares,
+	#so a move made from two clicks on the board finds the queen promotion
+	underpromotionIds = {'R': 10000, 'B': 20000, 'N': 30000}
 
-	def __init__(self, startSq, endSq, board):
-		self.startRow = startSq[0]
-		self.startCol = startSq[1]
-		self.endRow = endSq[0]
-		self.endCol = endSq[1]
-		self.pieceMoved = board[self. startRow][self. startCol] # can't be '--'
-		self.pieceCaptured = board[self. endRow][self. endCol]  # can be '--' -> no piece was captured
-		self.moveId = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
+	'''
+	promotion is the piece a pawn reaching the last rank turns into (e.g. 'wQ'), None for every other move.
+	'''
+	def __init__(self, startSq, endSq, board, isEnpassantMove=False, isCastleMove=False, promotion=None):
+		startRow, startCol = startSq # locals -> a move is created for every generated move, keep this cheap
+		endRow, endCol = endSq
+		self.startRow = startRow
+		self.startCol = startCol
+		self.endRow = endRow
+		self.endCol = endCol
+		self.pieceMoved = board[startRow][startCol] # can't be '--'
+		self.pieceCaptured = board[endRow][endCol]  # can be '--' -> no piece was captured
+		self.isEnpassantMove = isEnpassantMove
+		if isEnpassantMove: # the captured pawn isn't on the end square
+			self.pieceCaptured = 'bP' if self.pieceMoved == 'wP' else 'wP'
+		self.isCastleMove = isCastleMove
+		self.promotion = promotion
+		self.moveId = startRow * 1000 + startCol * 100 + endRow * 10 + endCol
+		if promotion is not None:
+			self.moveId += self.underpromotionIds.get(promotion[1], 0)
 
 	def getChessNotation(self):
-		return self.getFileRank(self.startRow,self.startCol) + self.getFileRank(self.endRow,self.endCol)
+		notation = self.getFileRank(self.startRow,self.startCol) + self.getFileRank(self.endRow,self.endCol)
+		if self.promotion is not None:
+			notation += self.promotion[1].lower() # e7e8q
+		return notation
 
 	def getFileRank (self, r, c):
 		return self.colsToFiles[c] + self.rowsToRanks[r]
@@ -264,6 +1151,12 @@ class Move():
 	def __eq__(self,other):
 		return isinstance(other, Move) and self.moveId == other.moveId
 
+	'''
+	equal moves have equal moveIds -> moves can be used in sets and as dict keys
+	'''
+	def __hash__(self):
+		return self.moveId
+
 
 
     
\ No newline at end of file
@@ -114,6 +114,36 @@ class GameState():
 				return True
 		return False
 
+	'''
+	Count the leaf nodes of the tree of valid moves `depth` plies deep. Used to test and time the move generator.
+	'''
+	def perft(self, depth):
+		if depth == 0:
+			return 1
+		checkMate, staleMate = self.checkMate, self.staleMate # perft shouldn't change the game's result flags
+		moves = self.getValidMoves()
+		if depth == 1:
+			nodes = len(moves)
+		else:
+			nodes = 0
+			for move in moves:
+				self.makeMove(move)
+				nodes += self.perft(depth - 1)
+				self.undoMove()
+		self.checkMate, self.staleMate = checkMate, staleMate
+		return nodes
+
+	'''
+	Perft split by root move -> {chess notation of the move : nodes below it}. Handy to find where two generators disagree.
+	'''
+	def divide(self, depth):
+		counts = {}
+		for move in self.getValidMoves():
+			self.makeMove(move)
+			counts[move.getChessNotation()] = self.perft(depth - 1)
+			self.undoMove()
+		return counts
+
 	'''
 	Get a list of all possible moves -> Without considering CHECKS
 	'''
@@ -0,0 +1,192 @@
+"""
+Equivalence check of ChessEngine's move generators (list and bitboard backends), which find checks and pins from
+the king, with the make/undo filter they replaced:
+    python ChessEquivalence.py                              # 2 plies below every position
+    python ChessEquivalence.py --depth 3 --position italian
+
+At every node of the perft tree the legal moves of both backends have to be
+    - the legal moves of ChessEngine2, the original make/undo engine, under its partial rules: castling, en-passant
+      and promotions are left out on both sides (POSITIONS only, ChessEngine2 can't read FEN)
+    - under the full rules, the pseudo-legal moves of ChessEngine (plus castling through unattacked squares) that
+      don't leave the king attacked once they are played
+and the divide counts (perft split by root move) of every position have to agree. The process exits with 1 on any
+difference.
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+
+import ChessEngine
+import ChessEngine2
+
+"""
+The positions are reached by playing moves (in the notation of Move.getChessNotation) from the start position.
+"""
+POSITIONS = {
+    'start': [],
+    'italian': ['e2e4', 'e7e5', 'g1f3', 'b8c6', 'f1c4', 'f8c5', 'c2c3', 'g8f6', 'd2d4', 'e5d4',
+                'c3d4', 'c5b4', 'b1c3', 'f6e4'],
+    'sicilian': ['e2e4', 'c7c5', 'g1f3', 'd7d6', 'd2d4', 'c5d4', 'f3d4', 'g8f6', 'b1c3', 'a7a6',
+                 'c1g5', 'e7e6', 'f2f4', 'f8e7', 'd1f3', 'd8c7'],
+    'kings-gambit': ['e2e4', 'e7e5', 'f2f4', 'e5f4', 'g1f3', 'g7g5', 'f1c4', 'g5g4', 'e1f1', 'g4f3',
+                     'd1f3', 'd8f6'],
+    'queens-gambit': ['d2d4', 'd7d5', 'c2c4', 'e7e6', 'b1c3', 'g8f6', 'c1g5', 'f8b4', 'e2e3', 'h7h6',
+                      'g5f6', 'd8f6', 'c4d5', 'e6d5', 'd1b3'],
+}
+
+"""
+Standard perft test positions (chessprogramming.org "Perft Results") for castling, en-passant and promotion.
+"""
+FEN_POSITIONS = {
+    'kiwipete': 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+    'cpw-3': '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+    'cpw-4': 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+    'cpw-5': 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+    'cpw-6': 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+}
+
+
+def setupPosition(engine, name, backend=None):
+    if name in FEN_POSITIONS:
+        return engine.GameState.fromFen(FEN_POSITIONS[name], backend)
+    gs = engine.GameState() if backend is None else engine.GameState(backend=backend)
+    for notation in POSITIONS[name]:
+        for move in gs.getValidMoves():
+            if move.getChessNotation() == notation:
+                gs.makeMove(move)
+                break
+        else:
+            raise ValueError("illegal move %s while setting up position '%s'" % (notation, name))
+    return gs
+
+
+"""
+The make/undo filter: a pseudo-legal move is legal when none of the opponent's pseudo-legal moves ends on our
+king once it is played (ChessEngine2.getValidMoves/isUnderAttack).
+"""
+
+def isKingAttacked(gs, white):
+    kingRow, kingCol = gs.whiteKingLocation if white else gs.blackKingLocation
+    whiteToMove = gs.whiteToMove
+    gs.whiteToMove = not white
+    attacked = any(move.endRow == kingRow and move.endCol == kingCol for move in gs.getAllPossibleMoves())
+    gs.whiteToMove = whiteToMove
+    return attacked
+
+
+def referenceMoves(gs):
+    white = gs.whiteToMove
+    candidates = gs.getAllPossibleMoves()
+    gs.getEnpassantMoves(candidates)
+    if not isKingAttacked(gs, white):
+        for flag, (_, kingSq, _, between) in ChessEngine.CASTLING.items():
+            if gs.castleRights & flag and (kingSq[0] == 7) == white and all(gs.board[r][c] == '--' for r, c in between):
+                gs.makeMove(ChessEngine.Move(kingSq, between[0], gs.board)) # the square the king passes
+                passesAttacked = isKingAttacked(gs, white)
+                gs.undoMove()
+                if not passesAttacked:
+                    candidates.append(ChessEngine.Move(kingSq, between[1], gs.board, isCastleMove=True))
+    moves = {}
+    for move in candidates:
+        gs.makeMove(move)
+        if not isKingAttacked(gs, white):
+            moves[move.getChessNotation()] = move
+        gs.undoMove()
+    return moves
+
+
+def validMoves(gs):
+    return {move.getChessNotation(): move for move in gs.getValidMoves()}
+
+
+def partialRulesMoves(gs):
+    return {move.getChessNotation(): move for move in gs.getValidMoves()
+            if not (getattr(move, 'isCastleMove', False) or getattr(move, 'isEnpassantMove', False)
+                    or move.pieceMoved[1] == 'P' and move.endRow in (0, 7))}
+
+
+def divide(gs, generate, depth):
+    counts = {}
+    for notation, move in generate(gs).items():
+        gs.makeMove(move)
+        counts[notation] = perft(gs, generate, depth - 1)
+        gs.undoMove()
+    return counts
+
+
+def perft(gs, generate, depth):
+    if depth == 0:
+        return 1
+    moves = generate(gs)
+    if depth == 1:
+        return len(moves)
+    return sum(divide(gs, generate, depth).values())
+
+
+def compareTree(sides, depth, path, mismatches):
+    """
+    sides: (label, GameState, moves function) played in lockstep, the first one is the reference. Every node's move
+    set is compared, the moves all sides agree on are searched further.
+    """
+    if depth == 0:
+        return
+    moveSets = [generate(gs) for _, gs, generate in sides]
+    reference = moveSets[0]
+    for (label, _, _), moves in zip(sides[1:], moveSets[1:]):
+        if moves.keys() != reference.keys():
+            mismatches.append('%s after [%s]: missing %s, extra %s' % (
+                label, ' '.join(path), sorted(reference.keys() - moves.keys()), sorted(moves.keys() - reference.keys())))
+    if depth == 1:
+        return
+    for notation in reference:
+        if not all(notation in moves for moves in moveSets):
+            continue
+        for (_, gs, _), moves in zip(sides, moveSets):
+            gs.makeMove(moves[notation])
+        compareTree(sides, depth - 1, path + [notation], mismatches)
+        for _, gs, _ in sides:
+            gs.undoMove()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move generator equivalence with the make/undo filter')
+    parser.add_argument('--position', nargs='+', default=list(POSITIONS) + list(FEN_POSITIONS),
+                        choices=list(POSITIONS) + list(FEN_POSITIONS))
+    parser.add_argument('--depth', type=int, default=2, help='plies below every position that are compared')
+    parser.add_argument('--show', type=int, default=20, help='differences printed at most')
+    args = parser.parse_args(argv)
+
+    checks = []
+    for name in args.position:
+        if name in POSITIONS:
+            checks.append((name, 'partial', [('ChessEngine2', ChessEngine2, None, partialRulesMoves),
+                                             ('ChessEngine', ChessEngine, 'list', partialRulesMoves),
+                                             ('ChessEngine-bitboard', ChessEngine, 'bitboard', partialRulesMoves)]))
+        checks.append((name, 'full', [('make/undo', ChessEngine, 'list', referenceMoves),
+                                      ('ChessEngine', ChessEngine, 'list', validMoves),
+                                      ('ChessEngine-bitboard', ChessEngine, 'bitboard', validMoves)]))
+    failures = []
+    print('%-15s %-8s %6s %12s %8s' % ('position', 'rules', 'depth', 'nodes', 'result'))
+    for name, rules, engines in checks:
+        sides = [(label, setupPosition(engine, name, backend), generate) for label, engine, backend, generate in engines]
+        mismatches = []
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull): #getValidMoves announces mates
+            compareTree(sides, args.depth, [], mismatches)
+            counts = [divide(gs, generate, args.depth) for _, gs, generate in sides]
+        for (label, _, _), count in zip(sides[1:], counts[1:]):
+            if count != counts[0]:
+                mismatches.append('%s divide(%d) differs from the %s divide' % (label, args.depth, sides[0][0]))
+        print('%-15s %-8s %6d %12d %8s' % (name, rules, args.depth, sum(counts[0].values()),
+                                          'FAIL' if mismatches else 'OK'))
+        failures += ['%s (%s rules): %s' % (name, rules, mismatch) for mismatch in mismatches]
+    for failure in failures[:args.show]:
+        print('FAIL: ' + failure)
+    if len(failures) > args.show:
+        print('... %d more differences' % (len(failures) - args.show))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
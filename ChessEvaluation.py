@@ -0,0 +1,153 @@
+"""
+Static evaluation: material + piece-square tables, tapered between middlegame and endgame.
+	- the tables are written from white's point of view with row 0 = 8th rank (same layout as GameState.board)
+	- black uses the same tables mirrored vertically
+	- GameState keeps mgScore/egScore/phase up to date in pushMove/popMove (white positive),
+	  so evaluate(gs) is O(1); evaluateFromScratch(gs) rescans the board and is used to check it
+"""
+
+MATERIAL_MG = {'P': 82, 'N': 337, 'B': 365, 'R': 477, 'Q': 1025, 'K': 0}
+MATERIAL_EG = {'P': 94, 'N': 281, 'B': 297, 'R': 512, 'Q': 936, 'K': 0}
+
+#contribution of each piece to the game phase: 24 with all pieces on the board (middlegame) down to 0 (endgame)
+PHASE_WEIGHTS = {'P': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+MAX_PHASE = 24
+
+PAWN_TABLE = [
+	[  0,   0,   0,   0,   0,   0,   0,   0],
+	[ 50,  50,  50,  50,  50,  50,  50,  50],
+	[ 10,  10,  20,  30,  30,  20,  10,  10],
+	[  5,   5,  10,  25,  25,  10,   5,   5],
+	[  0,   0,   0,  20,  20,   0,   0,   0],
+	[  5,  -5, -10,   0,   0, -10,  -5,   5],
+	[  5,  10,  10, -20, -20,  10,  10,   5],
+	[  0,   0,   0,   0,   0,   0,   0,   0]]
+
+PAWN_TABLE_EG = [
+	[  0,   0,   0,   0,   0,   0,   0,   0],
+	[ 80,  80,  80,  80,  80,  80,  80,  80],
+	[ 50,  50,  50,  50,  50,  50,  50,  50],
+	[ 30,  30,  30,  30,  30,  30,  30,  30],
+	[ 20,  20,  20,  20,  20,  20,  20,  20],
+	[ 10,  10,  10,  10,  10,  10,  10,  10],
+	[  0,   0,   0,   0,   0,   0,   0,   0],
+	[  0,   0,   0,   0,   0,   0,   0,   0]]
+
+KNIGHT_TABLE = [
+	[-50, -40, -30, -30, -30, -30, -40, -50],
+	[-40, -20,   0,   0,   0,   0, -20, -40],
+	[-30,   0,  10,  15,  15,  10,   0, -30],
+	[-30,   5,  15,  20,  20,  15,   5, -30],
+	[-30,   0,  15,  20,  20,  15,   0, -30],
+	[-30,   5,  10,  15,  15,  10,   5, -30],
+	[-40, -20,   0,   5,   5,   0, -20, -40],
+	[-50, -40, -30, -30, -30, -30, -40, -50]]
+
+BISHOP_TABLE = [
+	[-20, -10, -10, -10, -10, -10, -10, -20],
+	[-10,   0,   0,   0,   0,   0,   0, -10],
+	[-10,   0,   5,  10,  10,   5,   0, -10],
+	[-10,   5,   5,  10,  10,   5,   5, -10],
+	[-10,   0,  10,  10,  10,  10,   0, -10],
+	[-10,  10,  10,  10,  10,  10,  10, -10],
+	[-10,   5,   0,   0,   0,   0,   5, -10],
+	[-20, -10, -10, -10, -10, -10, -10, -20]]
+
+ROOK_TABLE = [
+	[  0,   0,   0,   0,   0,   0,   0,   0],
+	[  5,  10,  10,  10,  10,  10,  10,   5],
+	[ -5,   0,   0,   0,   0,   0,   0,  -5],
+	[ -5,   0,   0,   0,   0,   0,   0,  -5],
+	[ -5,   0,   0,   0,   0,   0,   0,  -5],
+	[ -5,   0,   0,   0,   0,   0,   0,  -5],
+	[ -5,   0,   0,   0,   0,   0,   0,  -5],
+	[  0,   0,   0,   5,   5,   0,   0,   0]]
+
+QUEEN_TABLE = [
+	[-20, -10, -10,  -5,  -5, -10, -10, -20],
+	[-10,   0,   0,   0,   0,   0,   0, -10],
+	[-10,   0,   5,   5,   5,   5,   0, -10],
+	[ -5,   0,   5,   5,   5,   5,   0,  -5],
+	[  0,   0,   5,   5,   5,   5,   0,  -5],
+	[-10,   5,   5,   5,   5,   5,   0, -10],
+	[-10,   0,   5,   0,   0,   0,   0, -10],
+	[-20, -10, -10,  -5,  -5, -10, -10, -20]]
+
+KING_TABLE = [
+	[-30, -40, -40, -50, -50, -40, -40, -30],
+	[-30, -40, -40, -50, -50, -40, -40, -30],
+	[-30, -40, -40, -50, -50, -40, -40, -30],
+	[-30, -40, -40, -50, -50, -40, -40, -30],
+	[-20, -30, -30, -40, -40, -30, -30, -20],
+	[-10, -20, -20, -20, -20, -20, -20, -10],
+	[ 20,  20,   0,   0,   0,   0,  20,  20],
+	[ 20,  30,  10,   0,   0,  10,  30,  20]]
+
+KING_TABLE_EG = [
+	[-50, -40, -30, -20, -20, -30, -40, -50],
+	[-30, -20, -10,   0,   0, -10, -20, -30],
+	[-30, -10,  20,  30,  30,  20, -10, -30],
+	[-30, -10,  30,  40,  40,  30, -10, -30],
+	[-30, -10,  30,  40,  40,  30, -10, -30],
+	[-30, -10,  20,  30,  30,  20, -10, -30],
+	[-30, -30,   0,   0,   0,   0, -30, -30],
+	[-50, -30, -30, -30, -30, -30, -30, -50]]
+
+TABLES_MG = {'P': PAWN_TABLE, 'N': KNIGHT_TABLE, 'B': BISHOP_TABLE, 'R': ROOK_TABLE, 'Q': QUEEN_TABLE, 'K': KING_TABLE}
+TABLES_EG = {'P': PAWN_TABLE_EG, 'N': KNIGHT_TABLE, 'B': BISHOP_TABLE, 'R': ROOK_TABLE, 'Q': QUEEN_TABLE,
+			 'K': KING_TABLE_EG}
+
+
+'''
+Per piece (e.g. 'bN') a list of 64 values indexed by row*8 + col with material and table value combined,
+positive for white pieces and negative for black ones. '--' maps to zeros so makeMove needs no branches.
+'''
+def buildSquareScores(materials, tables):
+	scores = {'--': [0] * 64}
+	for pieceType, table in tables.items():
+		scores['w' + pieceType] = [materials[pieceType] + table[r][c] for r in range(8) for c in range(8)]
+		scores['b' + pieceType] = [-(materials[pieceType] + table[7 - r][c]) for r in range(8) for c in range(8)]
+	return scores
+
+
+SQUARE_SCORES_MG = buildSquareScores(MATERIAL_MG, TABLES_MG)
+SQUARE_SCORES_EG = buildSquareScores(MATERIAL_EG, TABLES_EG)
+PIECE_PHASES = {piece: PHASE_WEIGHTS[piece[1]] for piece in SQUARE_SCORES_MG if piece != '--'}
+PIECE_PHASES['--'] = 0
+
+
+'''
+(mgScore, egScore, phase) of a board, white positive.
+'''
+def computeScores(board):
+	mg = eg = phase = 0
+	for r in range(8):
+		for c in range(8):
+			piece = board[r][c]
+			if piece == '--':
+				continue
+			mg += SQUARE_SCORES_MG[piece][r * 8 + c]
+			eg += SQUARE_SCORES_EG[piece][r * 8 + c]
+			phase += PIECE_PHASES[piece]
+	return mg, eg, phase
+
+
+def taper(mg, eg, phase):
+	phase = min(phase, MAX_PHASE) # promotions can push the phase past the starting value
+	return (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+'''
+Evaluation in centipawns from the point of view of the side to move, using the scores kept by makeMove.
+'''
+def evaluate(gs):
+	score = taper(gs.mgScore, gs.egScore, gs.phase)
+	return score if gs.whiteToMove else -score
+
+
+'''
+Same as evaluate but recomputed from the board -> used to check the incremental scores and to benchmark them.
+'''
+def evaluateFromScratch(gs):
+	score = taper(*computeScores(gs.board))
+	return score if gs.whiteToMove else -score
@@ -3,14 +3,28 @@ This is our main driver file. It will be responsible for handling user input and
 GameState object.
 """
 
+import time
+
 import pygame as p
+import ChessBook
 import ChessEngine
+import ChessProfiler
+import ChessWorker
 
 WIDTH = HEIGHT = 1024
 DIMENSION = 8 #dimensions of a chess board are 8x8
 SQ_SIZE = HEIGHT//DIMENSION
 MAX_FPS = 15 #for animations 
 IMAGES = {}
+PLAYER_ONE_HUMAN = True #True if a human plays white, False if the AI does
+PLAYER_TWO_HUMAN = True #same for black
+AI_TIME_LIMIT = 1.0 #seconds the AI may think per move
+SHOW_STATS = True #frame time / CPU overlay in the top left corner (toggled with 's')
+STATS_INTERVAL = 1.0 #seconds between two updates of the overlay
+PROFILE_LINES = 5 #functions with the most self time listed in the overlay while profiling (toggled with 'p')
+PROFILE_PATH = 'profile' #profile.json and profile.folded (flame graph input) are written when profiling stops
+BOOK_PATH = 'book.bin' #opening book and endgame tables the AI plays from when they exist (see ChessBook.py)
+TABLES_PATH = 'tables'
 
 """
 Initialize a global dictionary of images. This will be called exactly once in the main
@@ -32,19 +46,32 @@ def main():
     clock = p.time.Clock()
     screen.fill(p.Color("white"))
     gs = ChessEngine.GameState()
-    validMoves = gs.getValidMoves()
-    moveMade = False #flag variable for when a move is made
+    #valid moves, AI moves and analysis are computed on a background thread
+    worker = ChessWorker.EngineWorker(lookup=ChessBook.openLookup(BOOK_PATH, TABLES_PATH))
+    validMoves = {} #clicked move -> generated move (a hash lookup), filled in when the worker delivers the moves
+    movesReady = False
+    aiThinking = False
+    analysing = False #print a running analysis of the position on human turns (toggled with 'a')
+    announcedKey = None #position whose checkmate/stalemate was already printed
+    moveMade = True #flag variable for when a move is made -> True asks the worker for the first position's moves
     loadImages() #only do this once, before the while loop
     running = True
     sqSelected = () #empty, no square is selected; keep track of the last click (tuple: (row, col))
     playerClicks = [] #keep track of player clicks (two tuples: [(6, 4), (4, 4)])
+    showThreats = False #highlight the pieces of the side to move which are attacked (toggled with 't')
+    showStats = SHOW_STATS
+    renderer = BoardRenderer(screen)
+    profiler = ChessProfiler.Profiler()
+    stats = FrameStats(profiler)
 
     while running:
+        frameStart = time.perf_counter()
+        humanTurn = isHumanTurn(gs)
         for e in p.event.get():
             if e.type == p.QUIT:
                 running = False
             #mouse clicks
-            elif e.type == p.MOUSEBUTTONDOWN:
+            elif e.type == p.MOUSEBUTTONDOWN and humanTurn:
                 location = p.mouse.get_pos() #(x,y) location of mouse
                 col = location[0]//SQ_SIZE
                 row = location[1]//SQ_SIZE
@@ -58,7 +85,7 @@ def main():
                     move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
                     print(move.getChessNotation())
                     if move in validMoves:
-                        gs.makeMove(move)
+                        gs.makeMove(validMoves[move]) #the generated move knows about castling, en-passant and promotion (to a queen)
                         moveMade = True
                         sqSelected = () #reset user clicks
                         playerClicks = []
@@ -69,36 +96,193 @@ def main():
                 if e.key == p.K_z:
                     gs.undoMove()
                     moveMade = True
+                elif e.key == p.K_t:
+                    showThreats = not showThreats
+                elif e.key == p.K_s:
+                    showStats = not showStats
+                elif e.key == p.K_a:
+                    analysing = not analysing
+                    moveMade = True #restart the engine jobs of this position with or without the analysis
+                elif e.key == p.K_p:
+                    if profiler.active:
+                        profiler.stop(gs)
+                        print('\n'.join(profiler.summary(20)))
+                        profiler.writeJson(PROFILE_PATH + '.json')
+                        profiler.writeCollapsed(PROFILE_PATH + '.folded')
+                        print('profile written to %s.json and %s.folded' % (PROFILE_PATH, PROFILE_PATH))
+                    else:
+                        profiler.reset()
+                        profiler.start(gs)
 
-        if moveMade:
-            validMoves = gs.getValidMoves()
+        if moveMade: #whatever the worker is still doing belongs to the previous position
+            worker.cancel()
+            aiThinking = False
+            validMoves = {}
+            movesReady = False
+            worker.requestMoves(gs)
+            if analysing and isHumanTurn(gs):
+                worker.requestAnalysis(gs)
             moveMade = False
 
-        drawGameState(screen, gs)
+        for result in worker.poll():
+            if result.key != gs.zobristKey:
+                continue
+            if result.kind == 'moves':
+                moves, gs.checkMate, gs.staleMate = result.value
+                validMoves = {move: move for move in moves}
+                movesReady = True
+                if result.key != announcedKey:
+                    announcedKey = result.key
+                    if gs.checkMate:
+                        print("CHECK MATE! " + ('w' if not gs.whiteToMove else 'b') + " wins")
+                    elif gs.staleMate:
+                        print("DRAW DUE TO STALEMATE")
+            elif result.kind == 'search':
+                aiThinking = False
+                print(result.value)
+                gs.makeMove(result.value.bestMove)
+                moveMade = True
+            else:
+                print('analysis:', result.value)
+
+        #AI move finder -> the search runs on the worker, its move is played when the result arrives
+        if not isHumanTurn(gs) and movesReady and validMoves and not aiThinking:
+            worker.requestSearch(gs, timeLimit=AI_TIME_LIMIT)
+            aiThinking = True
+
+        with profiler.section('render'):
+            rects = renderer.render(gs, showThreats, stats.text if showStats else None)
+        if rects: #nothing changed -> nothing is drawn or sent to the display
+            p.display.update(rects)
+        stats.frameDone(time.perf_counter() - frameStart)
         clock.tick(MAX_FPS)
-        p.display.flip() 
+    profiler.stop(gs)
+    worker.close()
+
+def isHumanTurn(gs):
+    return (gs.whiteToMove and PLAYER_ONE_HUMAN) or (not gs.whiteToMove and PLAYER_TWO_HUMAN)
 
 """
-Responsible for all the graphics within a current game state. 
+Frame time and CPU use of the main loop, summed up every STATS_INTERVAL seconds into the overlay text.
+The frame time is the work done per frame, without the time clock.tick sleeps. While the profiler runs,
+the functions with the most self time are listed below it.
 """
 
-def drawGameState(screen, gs): 
-    drawBoard(screen) #draw squares on the board
-    drawPieces(screen, gs.board) #draw pieces on top of squares
+class FrameStats():
+    def __init__(self, profiler=None):
+        self.profiler = profiler
+        self.text = ''
+        self.frames = 0
+        self.work = 0.0
+        self.start = time.perf_counter()
+        self.cpuStart = time.process_time()
+
+    def frameDone(self, seconds):
+        self.frames += 1
+        self.work += seconds
+        elapsed = time.perf_counter() - self.start
+        if elapsed >= STATS_INTERVAL:
+            cpu = time.process_time() - self.cpuStart
+            self.text = '%.0f fps  %.2f ms/frame  %.0f%% cpu' % (self.frames / elapsed, 1000 * self.work / self.frames,
+                                                              100 * cpu / elapsed)
+            if self.profiler is not None and self.profiler.active:
+                self.text += '\n' + '\n'.join(self.profiler.summary(PROFILE_LINES))
+            self.frames = 0
+            self.work = 0.0
+            self.start = time.perf_counter()
+            self.cpuStart = time.process_time()
 
-def drawBoard(screen):
+"""
+Draws the game with dirty rectangles: the empty board is rendered once into a cached surface, and every frame
+only the squares whose piece or highlight changed since the last frame are redrawn (background copied from the
+cache, then highlight and piece). render returns the rectangles to pass to p.display.update -> an empty list
+when nothing changed, so a static board costs next to nothing.
+"""
+
+class BoardRenderer():
+    def __init__(self, screen):
+        self.screen = screen
+        self.background = drawBoard(p.Surface(screen.get_size()))
+        self.highlight = p.Surface((SQ_SIZE, SQ_SIZE))
+        self.highlight.set_alpha(100) #transparency
+        self.highlight.fill(p.Color("red"))
+        self.font = p.font.Font(None, 28)
+        self.board = None #copy of the board on screen, None -> everything has to be drawn
+        self.key = None #(zobristKey, showThreats) of the position on screen
+        self.threats = set()
+        self.overlay = None #overlay text on screen
+        self.overlayRect = None
+
+    def render(self, gs, showThreats, overlay):
+        dirty = set()
+        key = (gs.zobristKey, showThreats)
+        if self.board is None:
+            dirty = {(r, c) for r in range(DIMENSION) for c in range(DIMENSION)}
+        elif key != self.key:
+            for r in range(DIMENSION):
+                for c in range(DIMENSION):
+                    if gs.board[r][c] != self.board[r][c]:
+                        dirty.add((r, c))
+        if key != self.key:
+            threats = threatSquares(gs) if showThreats else set()
+            dirty |= threats ^ self.threats
+            self.threats = threats
+            self.board = [list(row) for row in gs.board]
+            self.key = key
+        overlayChanged = overlay != self.overlay
+        if overlayChanged and self.overlayRect is not None: #erase the old overlay
+            dirty |= squaresUnder(self.overlayRect)
+        rects = []
+        for r, c in dirty:
+            rect = p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
+            self.screen.blit(self.background, rect, rect)
+            if (r, c) in self.threats:
+                self.screen.blit(self.highlight, rect)
+            piece = self.board[r][c]
+            if piece != "--": #not empty square
+                self.screen.blit(IMAGES[piece], rect)
+            rects.append(rect)
+        if overlay and (overlayChanged or dirty & squaresUnder(self.overlayRect)): #squares drawn over the overlay
+            lines = [self.font.render(line, True, p.Color("white")) for line in overlay.split('\n')]
+            self.overlayRect = p.Rect(0, 0, max(line.get_width() for line in lines) + 12,
+                                      sum(line.get_height() for line in lines) + 8)
+            self.screen.fill(p.Color("black"), self.overlayRect)
+            y = 4
+            for line in lines:
+                self.screen.blit(line, (6, y))
+                y += line.get_height()
+            rects.append(self.overlayRect)
+        elif not overlay:
+            self.overlayRect = None
+        self.overlay = overlay
+        return rects
+
+"""
+Draw the squares of an empty board onto surface (done once, the result is cached by BoardRenderer).
+"""
+
+def drawBoard(surface):
     colors = [p.Color("light gray"), p.Color("dark green")]
     for r in range(DIMENSION):
         for c in range(DIMENSION): 
             color = colors[((r+c) % 2)]
-            p.draw.rect(screen, color, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+            p.draw.rect(surface, color, p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+    return surface
 
-def drawPieces(screen, board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != "--": #not empty square
-                screen.blit(IMAGES[piece], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+"""
+Squares holding pieces of the side to move which are attacked.
+"""
+
+def threatSquares(gs):
+    allyColor, enemyColor = ('w', 'b') if gs.whiteToMove else ('b', 'w')
+    return {(r, c) for r in range(DIMENSION) for c in range(DIMENSION)
+            if gs.board[r][c][0] == allyColor and gs.isAttacked(r, c, enemyColor)} #looked up in the cached attack maps
+
+def squaresUnder(rect):
+    if rect is None:
+        return set()
+    return {(r, c) for r in range(rect.top // SQ_SIZE, (rect.bottom - 1) // SQ_SIZE + 1)
+            for c in range(rect.left // SQ_SIZE, (rect.right - 1) // SQ_SIZE + 1)}
 
 if __name__ == "__main__":
 	main()
\ No newline at end of file
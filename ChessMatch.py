@@ -0,0 +1,394 @@
+"""
+Headless engine-vs-engine matches to measure engine changes: two players (Searcher settings) play each other
+over a process pool and the result is reported as an Elo difference.
+	- openings: every pair of games starts from the same position with colors swapped, either a few random plies
+	  from the start position (seeded, so a match can be replayed) or FENs from a file
+	- adjudication: checkmate/stalemate (GameState.checkMate/staleMate), threefold repetition (Zobrist keys),
+	  fifty-move rule, insufficient material and a ply limit
+	- every finished game is appended to the PGN file right away
+	- report: wins/draws/losses, Elo difference with its confidence interval, likelihood of superiority,
+	  games/hour, and an SPRT that stops the match once [elo0, elo1] is decided
+A player is name[:option=value,...] with the options depth, movetime (ms) and the Searcher keyword arguments:
+	python ChessMatch.py --engine1 "qsearch:depth=3" --engine2 "plain:depth=3,quiescence=0" --games 200 --pgn match.pgn
+	python ChessMatch.py --engine1 new:movetime=100 --engine2 old:movetime=100,seePruning=0 --sprt 0 10 --workers 4
+"""
+
+import argparse
+import concurrent.futures
+import json
+import math
+import os
+import random
+import sys
+import time
+
+import ChessAI
+import ChessEngine
+import ChessPGN
+
+DEFAULT_DEPTH = 4
+MAX_PLIES = 400
+FIFTY_MOVE_PLIES = 100
+REPETITIONS = 3
+SEARCHER_OPTIONS = ('ttSize', 'stagedMoves', 'quiescence', 'seePruning')
+#result of a game -> points of white
+RESULT_POINTS = {'1-0': 1.0, '0-1': 0.0, '1/2-1/2': 0.5}
+#two-sided normal quantiles of the confidence levels offered for the Elo interval
+NORMAL_QUANTILES = {0.9: 1.6449, 0.95: 1.9600, 0.99: 2.5758}
+
+
+class Player():
+	def __init__(self, name, depth=None, movetime=None, **searcherOptions):
+		self.name = name
+		self.depth = depth if depth is not None else (DEFAULT_DEPTH if movetime is None else ChessAI.MAX_DEPTH)
+		self.movetime = movetime # ms per move, None to search to depth
+		self.searcherOptions = searcherOptions
+
+	def __repr__(self):
+		options = ['depth=%d' % self.depth] + (['movetime=%d' % self.movetime] if self.movetime else [])
+		options += ['%s=%s' % item for item in sorted(self.searcherOptions.items())]
+		return '%s:%s' % (self.name, ','.join(options))
+
+	'''
+	Player from its command line form name[:option=value,...]. Values are integers (0/1 for the switches).
+	'''
+	@staticmethod
+	def parse(text):
+		name, _, options = text.partition(':')
+		kwargs = {}
+		for option in filter(None, options.split(',')):
+			key, _, value = option.partition('=')
+			if key not in ('depth', 'movetime') + SEARCHER_OPTIONS:
+				raise ValueError('unknown player option %r (expected depth, movetime or one of %s)' % (
+					key, ', '.join(SEARCHER_OPTIONS)))
+			try:
+				kwargs[key] = int(value)
+			except ValueError:
+				raise ValueError('bad value %r for %s' % (value, key))
+		return Player(name or 'engine', **kwargs)
+
+	def newSearcher(self):
+		return ChessAI.Searcher(**self.searcherOptions)
+
+	def findMove(self, searcher, gs):
+		result = searcher.search(gs, self.depth, self.movetime / 1000 if self.movetime else None)
+		return result.bestMove if result is not None else None
+
+
+'''
+UCI moves of `plies` random moves from the start position (none of them ending the game).
+'''
+def randomOpening(rng, plies):
+	while True:
+		gs = ChessEngine.GameState()
+		moves = []
+		for _ in range(plies):
+			validMoves = gs.getValidMoves()
+			if not validMoves:
+				break
+			move = rng.choice(validMoves)
+			moves.append(move.getChessNotation())
+			gs.pushMove(move)
+		if len(moves) == plies and gs.hasLegalMove():
+			return moves
+
+
+'''
+Only kings, or kings and a single knight or bishop -> nobody can mate.
+'''
+def insufficientMaterial(gs):
+	pieces = [piece[1] for row in gs.board for piece in row if piece != '--' and piece[1] != 'K']
+	return not pieces or (len(pieces) == 1 and pieces[0] in 'NB')
+
+
+'''
+Play one game in a worker process. job is (index, fen, openingMoves, white, black, maxPlies, backend);
+returns a dict with the result, the reason the game ended, its SAN moves and how long it took.
+'''
+def playGame(job):
+	index, fen, openingMoves, white, black, maxPlies, backend = job
+	start = time.perf_counter()
+	gs = ChessEngine.GameState.fromFen(fen or ChessEngine.START_FEN, backend)
+	searchers = {True: white.newSearcher(), False: black.newSearcher()}
+	sans = []
+	seen = {gs.zobristKey: 1}
+	quietPlies = 0 # since the last capture or pawn move
+	result = termination = None
+	plies = 0
+	while result is None:
+		validMoves = gs.getValidMoves()
+		if not validMoves:
+			if gs.checkMate:
+				result, termination = ('0-1' if gs.whiteToMove else '1-0'), 'checkmate'
+			else:
+				result, termination = '1/2-1/2', 'stalemate'
+			break
+		if seen[gs.zobristKey] >= REPETITIONS:
+			result, termination = '1/2-1/2', 'repetition'
+		elif quietPlies >= FIFTY_MOVE_PLIES:
+			result, termination = '1/2-1/2', 'fifty-move rule'
+		elif insufficientMaterial(gs):
+			result, termination = '1/2-1/2', 'insufficient material'
+		elif plies >= maxPlies:
+			result, termination = '1/2-1/2', 'move limit'
+		if result is not None:
+			break
+		if plies < len(openingMoves):
+			move = next((move for move in validMoves if move.getChessNotation() == openingMoves[plies]), None)
+			if move is None:
+				raise ValueError('illegal opening move %s' % openingMoves[plies])
+		else:
+			player = white if gs.whiteToMove else black
+			move = player.findMove(searchers[gs.whiteToMove], gs)
+		sans.append(ChessPGN.moveToSan(gs, move, validMoves))
+		quietPlies = 0 if move.pieceCaptured != '--' or move.pieceMoved[1] == 'P' else quietPlies + 1
+		gs.pushMove(move)
+		seen[gs.zobristKey] = seen.get(gs.zobristKey, 0) + 1
+		plies += 1
+	return {'index': index, 'fen': fen, 'white': white.name, 'black': black.name, 'result': result,
+			'termination': termination, 'moves': sans, 'seconds': time.perf_counter() - start}
+
+
+'''
+Expected score of the side that is elo points stronger, and its inverse.
+'''
+def scoreFromElo(elo):
+	return 1 / (1 + 10 ** (-elo / 400))
+
+
+def eloFromScore(score):
+	if score <= 0:
+		return -math.inf
+	if score >= 1:
+		return math.inf
+	return -400 * math.log10(1 / score - 1)
+
+
+class MatchStats():
+	'''
+	Wins, draws and losses of the first player and the statistics derived from them.
+	'''
+	def __init__(self):
+		self.wins = 0
+		self.draws = 0
+		self.losses = 0
+
+	def add(self, points):
+		if points == 1:
+			self.wins += 1
+		elif points == 0:
+			self.losses += 1
+		else:
+			self.draws += 1
+
+	def games(self):
+		return self.wins + self.draws + self.losses
+
+	def score(self):
+		return (self.wins + self.draws / 2) / self.games() if self.games() else 0.5
+
+	'''
+	Variance of the points of one game around the mean score.
+	'''
+	def variance(self):
+		games = self.games()
+		if not games:
+			return 0.0
+		score = self.score()
+		return (self.wins * (1 - score) ** 2 + self.draws * (0.5 - score) ** 2 + self.losses * score ** 2) / games
+
+	def elo(self):
+		return eloFromScore(self.score())
+
+	'''
+	(low, high) Elo difference at the given confidence, from the normal approximation of the mean score.
+	'''
+	def eloInterval(self, confidence=0.95):
+		games = self.games()
+		if not games:
+			return -math.inf, math.inf
+		z = NORMAL_QUANTILES[confidence]
+		margin = z * math.sqrt(self.variance() / games)
+		return eloFromScore(self.score() - margin), eloFromScore(self.score() + margin)
+
+	'''
+	Likelihood of superiority: the probability that the first player is the stronger one (draws left out).
+	'''
+	def los(self):
+		decisive = self.wins + self.losses
+		if not decisive:
+			return 0.5
+		return 0.5 * (1 + math.erf((self.wins - self.losses) / math.sqrt(2 * decisive)))
+
+	'''
+	Log likelihood ratio of H1 (elo1) against H0 (elo0) and its (lower, upper) bounds for the error rates alpha and
+	beta, with the normal approximation of the generalized SPRT: the match is decided once the LLR leaves the bounds.
+	'''
+	def sprt(self, elo0, elo1, alpha=0.05, beta=0.05):
+		lower, upper = math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+		variance = self.variance()
+		if not variance:
+			return 0.0, lower, upper
+		score0, score1 = scoreFromElo(elo0), scoreFromElo(elo1)
+		llr = self.games() * (score1 - score0) * (2 * self.score() - score0 - score1) / (2 * variance)
+		return llr, lower, upper
+
+
+
+'''
+The jobs of a match: pairs of games from the same opening with colors swapped, the first player white first.
+'''
+def matchJobs(player1, player2, games, openingPlies=4, openings=None, seed=1, maxPlies=MAX_PLIES, backend='bitboard'):
+	rng = random.Random(seed)
+	for index in range(games):
+		if index % 2 == 0:
+			if openings:
+				fen, openingMoves = openings[(index // 2) % len(openings)], []
+			else:
+				fen, openingMoves = None, randomOpening(rng, openingPlies)
+		white, black = (player1, player2) if index % 2 == 0 else (player2, player1)
+		yield index, fen, openingMoves, white, black, maxPlies, backend
+
+
+'''
+Play the match, keeping workers games in flight. onGame(game, stats) is called in the main process after every
+game (e.g. to write it out and print progress). With sprt=(elo0, elo1, alpha, beta) the match stops as soon as the
+test is decided. Returns (stats, decision) where decision is 'H0', 'H1' or None.
+'''
+def runMatch(jobs, player1Name, workers=None, sprt=None, onGame=None, executor=None):
+	stats = MatchStats()
+	decision = None
+	ownExecutor = executor is None
+	executor = executor or concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+	jobs = iter(jobs)
+	running = set()
+	try:
+		while True:
+			while decision is None and len(running) < 2 * (workers or os.cpu_count()):
+				job = next(jobs, None)
+				if job is None:
+					break
+				running.add(executor.submit(playGame, job))
+			if not running:
+				break
+			done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+			for future in sorted(done, key=lambda future: future.result()['index']):
+				game = future.result()
+				points = RESULT_POINTS[game['result']]
+				stats.add(points if game['white'] == player1Name else 1 - points)
+				if onGame is not None:
+					onGame(game, stats)
+				if sprt is not None and decision is None:
+					llr, lower, upper = stats.sprt(*sprt)
+					if llr <= lower:
+						decision = 'H0'
+					elif llr >= upper:
+						decision = 'H1'
+			if decision is not None:
+				for future in running:
+					future.cancel() # games already being played are still waited for, but not counted
+				running = set()
+	finally:
+		if ownExecutor:
+			executor.shutdown()
+	return stats, decision
+
+
+def formatElo(elo):
+	return '%+.0f' % elo if math.isfinite(elo) else ('+inf' if elo > 0 else '-inf')
+
+
+def pgnHeaders(game, date):
+	headers = {'Event': 'ChessMatch', 'Site': '?', 'Date': date, 'Round': str(game['index'] + 1),
+			   'White': game['white'], 'Black': game['black'], 'Result': game['result']}
+	if game['fen']:
+		headers['SetUp'] = '1'
+		headers['FEN'] = game['fen']
+	headers['Termination'] = game['termination']
+	return headers
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Play engine-vs-engine matches and report the Elo difference')
+	parser.add_argument('--engine1', default='engine1', help='name[:option=value,...] of the player under test')
+	parser.add_argument('--engine2', default='engine2', help='name[:option=value,...] of the reference player')
+	parser.add_argument('--games', type=int, default=100)
+	parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+	parser.add_argument('--pgn', help='append the games to this PGN file')
+	parser.add_argument('--openings', help='file of opening FENs, one per line (default: random openings)')
+	parser.add_argument('--opening-plies', type=int, default=4, help='random plies of the generated openings')
+	parser.add_argument('--seed', type=int, default=1, help='seed of the generated openings')
+	parser.add_argument('--max-plies', type=int, default=MAX_PLIES, help='plies after which a game is drawn')
+	parser.add_argument('--backend', default='bitboard', choices=('list', 'bitboard'))
+	parser.add_argument('--sprt', type=float, nargs=2, metavar=('ELO0', 'ELO1'), help='stop once the SPRT decides')
+	parser.add_argument('--alpha', type=float, default=0.05)
+	parser.add_argument('--beta', type=float, default=0.05)
+	parser.add_argument('--confidence', type=float, default=0.95, choices=sorted(NORMAL_QUANTILES))
+	parser.add_argument('--progress', type=int, default=10, help='print the standings every this many games')
+	parser.add_argument('--json', help='write the final report to this JSON file')
+	args = parser.parse_args(argv)
+
+	try:
+		player1, player2 = Player.parse(args.engine1), Player.parse(args.engine2)
+	except ValueError as e:
+		parser.error(str(e))
+	if player1.name == player2.name:
+		player2.name += '-2'
+	openings = None
+	if args.openings:
+		with open(args.openings) as f:
+			openings = [line.strip() for line in f if line.strip() and not line.startswith('#')]
+		for fen in openings:
+			ChessEngine.GameState.fromFen(fen) # a bad FEN fails here instead of in a worker
+	sprt = (args.sprt[0], args.sprt[1], args.alpha, args.beta) if args.sprt else None
+	print('%r vs %r, %d games' % (player1, player2, args.games), flush=True)
+
+	pgn = open(args.pgn, 'a') if args.pgn else None
+	date = time.strftime('%Y.%m.%d')
+	start = time.perf_counter()
+
+	def standings(stats):
+		low, high = stats.eloInterval(args.confidence)
+		line = '%d games: +%d =%d -%d  score %.3f  Elo %s [%s, %s]  LOS %.1f%%  %.0f games/h' % (
+			stats.games(), stats.wins, stats.draws, stats.losses, stats.score(), formatElo(stats.elo()),
+			formatElo(low), formatElo(high), 100 * stats.los(), stats.games() / (time.perf_counter() - start) * 3600)
+		if sprt is not None:
+			line += '  LLR %.2f (%.2f, %.2f)' % stats.sprt(*sprt)
+		return line
+
+	def onGame(game, stats):
+		if pgn is not None:
+			pgn.write(ChessPGN.gameToPgn(pgnHeaders(game, date), game['moves'], game['result']))
+			pgn.flush()
+		if args.progress and stats.games() % args.progress == 0:
+			print(standings(stats), flush=True)
+
+	jobs = matchJobs(player1, player2, args.games, args.opening_plies, openings, args.seed, args.max_plies,
+					 args.backend)
+	try:
+		stats, decision = runMatch(jobs, player1.name, args.workers, sprt, onGame)
+	finally:
+		if pgn is not None:
+			pgn.close()
+	seconds = time.perf_counter() - start
+	print(standings(stats))
+	if sprt is not None:
+		print('SPRT [%g, %g]: %s' % (sprt[0], sprt[1], {'H1': 'H1 accepted (%s is stronger)' % player1.name,
+														  'H0': 'H0 accepted', None: 'undecided'}[decision]))
+	if args.json:
+		low, high = stats.eloInterval(args.confidence)
+		report = {'player1': repr(player1), 'player2': repr(player2), 'games': stats.games(), 'wins': stats.wins,
+				  'draws': stats.draws, 'losses': stats.losses, 'score': stats.score(), 'elo': stats.elo(),
+				  'eloLow': low, 'eloHigh': high, 'confidence': args.confidence, 'los': stats.los(),
+				  'seconds': seconds, 'gamesPerHour': stats.games() / seconds * 3600 if seconds else 0.0}
+		if sprt is not None:
+			llr, lower, upper = stats.sprt(*sprt)
+			report['sprt'] = {'elo0': sprt[0], 'elo1': sprt[1], 'alpha': sprt[2], 'beta': sprt[3], 'llr': llr,
+							  'lower': lower, 'upper': upper, 'decision': decision}
+		with open(args.json, 'w') as f:
+			json.dump(report, f, indent=2) # infinite Elo values are written as Infinity
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,261 @@
+"""
+Streaming PGN reader, SAN parsing/emission and a replayer that validates games against the engine.
+	- readGames(file) yields one PgnGame at a time, so archives of any size are read with constant memory
+	- parseSan/moveToSan convert between standard algebraic notation and Move objects of a GameState
+	- replayGames plays every game through GameState and flags the first illegal move, optionally
+	  spreading the games over worker processes
+Run it on a file:
+	python ChessPGN.py games.pgn --workers 4
+"""
+
+import argparse
+import itertools
+import multiprocessing
+import re
+import sys
+import time
+
+import ChessEngine
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+TAG_PATTERN = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$')
+SAN_PATTERN = re.compile(r'^([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?[+#]?[!?]*$')
+CASTLE_PATTERN = re.compile(r'^(O-O-O|O-O|0-0-0|0-0)[+#]?[!?]*$')
+MOVE_NUMBER_PATTERN = re.compile(r'^\d+\.+')
+
+
+class PgnGame():
+	def __init__(self, headers, moves, result):
+		self.headers = headers # dict of the tag pairs
+		self.moves = moves # list of SAN strings
+		self.result = result
+
+	def __repr__(self):
+		return 'PgnGame(%s vs %s, %d moves, %s)' % (self.headers.get('White', '?'), self.headers.get('Black', '?'),
+													len(self.moves), self.result)
+
+
+'''
+Split movetext into SAN tokens (comments, variations, NAGs and move numbers removed) and the result.
+'''
+def parseMovetext(text):
+	text = re.sub(r'\{[^}]*\}', ' ', text)
+	while '(' in text: # variations can be nested -> remove the innermost ones first
+		stripped = re.sub(r'\([^()]*\)', ' ', text)
+		if stripped == text:
+			break
+		text = stripped
+	moves = []
+	result = '*'
+	for token in text.split():
+		token = MOVE_NUMBER_PATTERN.sub('', token)
+		if not token or token.startswith('$'):
+			continue
+		if token in RESULTS:
+			result = token
+			continue
+		moves.append(token)
+	return moves, result
+
+
+'''
+Generator of PgnGame objects from an open text file (or any iterable of lines).
+'''
+def readGames(lines):
+	headers = {}
+	movetext = []
+	for line in lines:
+		line = line.strip()
+		if line.startswith('%'): # escape mechanism -> line is ignored
+			continue
+		if line.startswith('['):
+			if movetext: # a new tag section starts the next game
+				yield PgnGame(headers, *parseMovetext(' '.join(movetext)))
+				headers, movetext = {}, []
+			match = TAG_PATTERN.match(line)
+			if match:
+				headers[match.group(1)] = match.group(2).replace('\\"', '"').replace('\\\\', '\\')
+			continue
+		if ';' in line: # rest of line comment
+			line = line[:line.index(';')]
+		if line:
+			movetext.append(line)
+	if movetext or headers:
+		yield PgnGame(headers, *parseMovetext(' '.join(movetext)))
+
+
+'''
+The Move in validMoves (the valid moves of gs) written as san, or None if there is no such move.
+'''
+def parseSan(gs, san, validMoves=None):
+	if validMoves is None:
+		validMoves = gs.getValidMoves()
+	castle = CASTLE_PATTERN.match(san)
+	if castle:
+		endCol = 2 if castle.group(1) in ('O-O-O', '0-0-0') else 6
+		for move in validMoves:
+			if move.isCastleMove and move.endCol == endCol:
+				return move
+		return None
+	match = SAN_PATTERN.match(san)
+	if not match:
+		return None
+	pieceType, fromFile, fromRank, _, target, promotion = match.groups()
+	pieceType = pieceType or 'P'
+	endRow = ChessEngine.Move.ranksToRows[target[1]]
+	endCol = ChessEngine.Move.filesToCols[target[0]]
+	found = None
+	for move in validMoves:
+		if move.endRow != endRow or move.endCol != endCol or move.pieceMoved[1] != pieceType:
+			continue
+		if fromFile is not None and move.startCol != ChessEngine.Move.filesToCols[fromFile]:
+			continue
+		if fromRank is not None and move.startRow != ChessEngine.Move.ranksToRows[fromRank]:
+			continue
+		if (move.promotion[1] if move.promotion is not None else None) != promotion:
+			continue # a promotion has to name the new piece, other moves must not
+		if found is not None:
+			return None # ambiguous
+		found = move
+	return found
+
+
+'''
+Standard algebraic notation of a valid move of gs (with + or # when it gives check or mate).
+'''
+def moveToSan(gs, move, validMoves=None):
+	if validMoves is None:
+		validMoves = gs.getValidMoves()
+	pieceType = move.pieceMoved[1]
+	target = move.getFileRank(move.endRow, move.endCol)
+	if move.isCastleMove:
+		san = 'O-O' if move.endCol > move.startCol else 'O-O-O'
+	elif pieceType == 'P':
+		san = (move.colsToFiles[move.startCol] + 'x' + target) if move.startCol != move.endCol else target
+		if move.promotion is not None:
+			san += '=' + move.promotion[1]
+	else:
+		others = [other for other in validMoves if other.pieceMoved == move.pieceMoved and other != move
+				  and other.endRow == move.endRow and other.endCol == move.endCol]
+		disambiguation = ''
+		if others:
+			if all(other.startCol != move.startCol for other in others):
+				disambiguation = move.colsToFiles[move.startCol]
+			elif all(other.startRow != move.startRow for other in others):
+				disambiguation = move.rowsToRanks[move.startRow]
+			else:
+				disambiguation = move.getFileRank(move.startRow, move.startCol)
+		san = pieceType + disambiguation + ('x' if move.pieceCaptured != '--' else '') + target
+	gs.pushMove(move)
+	if gs.checkForPinsAndChecks()[0]:
+		san += '+' if gs.hasLegalMove() else '#'
+	gs.popMove()
+	return san
+
+
+'''
+PGN text of one game. moves are SAN strings, the first one played by white.
+'''
+def gameToPgn(headers, moves, result):
+	lines = ['[%s "%s"]' % (key, str(value).replace('\\', '\\\\').replace('"', '\\"')) for key, value in headers.items()]
+	lines.append('')
+	tokens = []
+	for i, san in enumerate(moves):
+		if i % 2 == 0:
+			tokens.append('%d.' % (i // 2 + 1))
+		tokens.append(san)
+	tokens.append(result)
+	text, line = [], ''
+	for token in tokens: # PGN export format keeps lines below 80 characters
+		if line and len(line) + 1 + len(token) > 79:
+			text.append(line)
+			line = token
+		else:
+			line = line + ' ' + token if line else token
+	text.append(line)
+	return '\n'.join(lines + text) + '\n\n'
+
+
+class ReplayResult():
+	def __init__(self, index, headers, plies, error=None):
+		self.index = index # position of the game in the file (0 based)
+		self.white = headers.get('White', '?')
+		self.black = headers.get('Black', '?')
+		self.plies = plies # moves replayed successfully
+		self.error = error # None, or a description of the first illegal move
+
+	def __repr__(self):
+		return 'ReplayResult(game %d: %s)' % (self.index, self.error or 'ok, %d plies' % self.plies)
+
+
+'''
+Play one game through a fresh GameState (starting from its FEN tag if it has one).
+'''
+def replayGame(game, index=0, backend='list'):
+	try:
+		if game.headers.get('SetUp') == '1' and 'FEN' in game.headers:
+			gs = ChessEngine.GameState.fromFen(game.headers['FEN'], backend)
+		else:
+			gs = ChessEngine.GameState(backend=backend)
+	except ValueError as e:
+		return ReplayResult(index, game.headers, 0, 'bad FEN: %s' % e)
+	for ply, san in enumerate(game.moves):
+		move = parseSan(gs, san)
+		if move is None:
+			moveNumber = (gs.firstPly + ply) // 2 + 1
+			return ReplayResult(index, game.headers, ply, 'illegal move %d%s %s' % (
+				moveNumber, '.' if gs.whiteToMove else '...', san))
+		gs.pushMove(move) # no moveLog -> nothing is kept for the user
+	return ReplayResult(index, game.headers, len(game.moves))
+
+
+def replayWorker(args):
+	index, game, backend = args
+	return replayGame(game, index, backend)
+
+
+'''
+Generator of ReplayResults for every game of a PGN file, in file order. With workers > 1 the games are sent to a
+process pool in batches, so at most batchSize games are held in memory at any time.
+'''
+def replayGames(lines, workers=1, backend='list', batchSize=256):
+	games = ((index, game, backend) for index, game in enumerate(readGames(lines)))
+	if workers <= 1:
+		for args in games:
+			yield replayWorker(args)
+		return
+	with multiprocessing.Pool(workers) as pool:
+		while True:
+			batch = list(itertools.islice(games, batchSize))
+			if not batch:
+				break
+			for result in pool.imap(replayWorker, batch, chunksize=max(1, batchSize // (workers * 4))):
+				yield result
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='Validate and replay the games of a PGN file')
+	parser.add_argument('pgn', help='PGN file')
+	parser.add_argument('--workers', type=int, default=1, help='worker processes (default: 1, no pool)')
+	parser.add_argument('--backend', default='list', choices=('list', 'bitboard'))
+	parser.add_argument('--quiet', action='store_true', help="don't list the games with illegal moves")
+	args = parser.parse_args(argv)
+
+	games = plies = illegal = 0
+	start = time.perf_counter()
+	with open(args.pgn, encoding='utf-8', errors='replace') as f:
+		for result in replayGames(f, args.workers, args.backend):
+			games += 1
+			plies += result.plies
+			if result.error:
+				illegal += 1
+				if not args.quiet:
+					print('game %d (%s - %s): %s' % (result.index + 1, result.white, result.black, result.error))
+	seconds = time.perf_counter() - start
+	print('%d games, %d moves, %d with illegal moves in %.2fs -> %.1f games/sec, %.0f moves/sec' % (
+		games, plies, illegal, seconds, games / seconds if seconds else 0, plies / seconds if seconds else 0))
+	return 1 if illegal else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,94 @@
+"""
+Multi-process analysis by splitting the root moves of a position over a ProcessPoolExecutor.
+	- every worker rebuilds the position from GameState.snapshot() (a short string, no move log) and
+	  works on the subtree of one root move
+	- parallelPerft/parallelDivide add the node counts up, parallelSearch keeps the best root score
+Pass an existing executor to reuse its worker processes between calls.
+"""
+
+import concurrent.futures
+import os
+
+import ChessAI
+import ChessEngine
+import ChessEvaluation
+
+
+def perftWorker(snapshot, moveId, depth):
+	gs = ChessEngine.GameState.fromSnapshot(snapshot)
+	move = findMove(gs, moveId)
+	gs.makeMove(move)
+	return move.getChessNotation(), gs.perft(depth - 1)
+
+
+def searchWorker(snapshot, moveId, depth):
+	gs = ChessEngine.GameState.fromSnapshot(snapshot)
+	move = findMove(gs, moveId)
+	gs.makeMove(move)
+	terminal = not gs.hasLegalMove() # stops at the first legal move instead of generating them all
+	if depth <= 1 or terminal:
+		if terminal:
+			score = ChessAI.CHECKMATE - 1 if gs.inCheck() else ChessAI.STALEMATE # the root move mates or stalemates
+		else:
+			score = -ChessEvaluation.evaluate(gs)
+		return moveId, score, 1
+	searcher = ChessAI.Searcher()
+	result = searcher.search(gs, maxDepth=depth - 1)
+	score = -result.score
+	if score > ChessAI.MATE_BOUND: # mate distances are one ply longer seen from the root
+		score -= 1
+	elif score < -ChessAI.MATE_BOUND:
+		score += 1
+	return moveId, score, searcher.nodes + 1
+
+
+def findMove(gs, moveId):
+	for move in gs.getValidMoves():
+		if move.moveId == moveId:
+			return move
+	raise ValueError('move %d is not valid in this position' % moveId)
+
+
+def runSplit(worker, gs, depth, workers, executor):
+	snapshot = gs.snapshot()
+	moveIds = [move.moveId for move in gs.getValidMoves()]
+	ownExecutor = executor is None
+	if ownExecutor:
+		executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+	try:
+		futures = [executor.submit(worker, snapshot, moveId, depth) for moveId in moveIds]
+		return [future.result() for future in futures]
+	finally:
+		if ownExecutor:
+			executor.shutdown()
+
+
+'''
+Perft split by root move computed in worker processes -> {chess notation of the move : nodes below it}
+'''
+def parallelDivide(gs, depth, workers=None, executor=None):
+	if depth < 1:
+		raise ValueError('depth must be at least 1')
+	return dict(runSplit(perftWorker, gs, depth, workers, executor))
+
+
+def parallelPerft(gs, depth, workers=None, executor=None):
+	if depth == 0:
+		return 1
+	return sum(parallelDivide(gs, depth, workers, executor).values())
+
+
+'''
+Fixed depth search with every root move searched by its own worker. Returns (bestMove, score, scores, nodes)
+where scores maps every root move to its score from the point of view of the side to move.
+The workers can't share alpha-beta bounds, so this searches more nodes than one Searcher would,
+but spreads them over all cores.
+'''
+def parallelSearch(gs, depth, workers=None, executor=None):
+	moves = {move.moveId: move for move in gs.getValidMoves()}
+	if not moves:
+		return None, None, {}, 0
+	results = runSplit(searchWorker, gs, depth, workers, executor)
+	scores = {moves[moveId]: score for moveId, score, _ in results}
+	bestMove = max(scores, key=scores.get)
+	return bestMove, scores[bestMove], scores, sum(nodes for _, _, nodes in results)
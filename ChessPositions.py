@@ -0,0 +1,142 @@
+"""
+Fixed-width binary position format for storing and bulk loading large sets of positions.
+Every position takes exactly RECORD_SIZE (32) bytes:
+	- 8 bytes: occupancy, bit (row*8 + col) set for every occupied square (big endian)
+	- 16 bytes: one 4 bit piece code per occupied square in square order, two per byte (high nibble first)
+	- 1 byte: flags, bit 0 set when black is to move, bits 1-4 the castling rights (GameState.castleRights << 1)
+	- 1 byte: en-passant square (row*8 + col), 255 when there is none
+	- 2 bytes: halfmove clock, 2 bytes: fullmove number, 2 bytes reserved
+A position never has more than 32 pieces, so the piece codes always fit.
+PositionFile memory-maps a file of records, so the i-th position is decoded only when it is asked for.
+"""
+
+import mmap
+import struct
+
+import ChessEngine
+
+RECORD = struct.Struct('>Q16sBBHH2x')
+RECORD_SIZE = RECORD.size
+NO_SQUARE = 255
+
+PIECE_CODES = {'wP': 1, 'wN': 2, 'wB': 3, 'wR': 4, 'wQ': 5, 'wK': 6, 'bP': 7, 'bN': 8, 'bB': 9, 'bR': 10, 'bQ': 11, 'bK': 12}
+CODE_PIECES = {code: piece for piece, code in PIECE_CODES.items()}
+
+
+def encodePosition(gs):
+	occupancy = 0
+	codes = []
+	for r in range(8):
+		for c in range(8):
+			piece = gs.board[r][c]
+			if piece != '--':
+				occupancy |= 1 << (r * 8 + c)
+				codes.append(PIECE_CODES[piece])
+	if len(codes) > 32:
+		raise ValueError('a position can have at most 32 pieces')
+	codes.extend([0] * (32 - len(codes)))
+	packed = bytes((codes[i] << 4) | codes[i + 1] for i in range(0, 32, 2))
+	fullMoveNumber = (gs.firstPly + len(gs.undoStack)) // 2 + 1
+	flags = (0 if gs.whiteToMove else 1) | gs.castleRights << 1
+	if gs.enpassantPossible is None:
+		enpassant = NO_SQUARE
+	else:
+		enpassant = gs.enpassantPossible[0] * 8 + gs.enpassantPossible[1]
+	return RECORD.pack(occupancy, packed, flags, enpassant, 0, fullMoveNumber)
+
+
+'''
+Decode the record at offset of a bytes-like object into (board, whiteToMove, fullMoveNumber, castleRights,
+enpassantPossible) without making a GameState.
+'''
+def decodeBoard(data, offset=0):
+	occupancy, packed, flags, enpassant, _, fullMoveNumber = RECORD.unpack_from(data, offset)
+	squares = ['--'] * 64
+	i = 0
+	while occupancy:
+		bit = occupancy & -occupancy
+		occupancy ^= bit
+		code = packed[i >> 1] >> 4 if i & 1 == 0 else packed[i >> 1] & 15
+		squares[bit.bit_length() - 1] = CODE_PIECES[code]
+		i += 1
+	board = [squares[r * 8:r * 8 + 8] for r in range(8)]
+	enpassantPossible = None if enpassant == NO_SQUARE else divmod(enpassant, 8)
+	return board, not flags & 1, fullMoveNumber, (flags >> 1) & ChessEngine.ALL_CASTLING, enpassantPossible
+
+
+def decodePosition(data, offset=0, backend='list'):
+	gs = ChessEngine.GameState(backend=backend)
+	gs.loadBoard(*decodeBoard(data, offset))
+	return gs
+
+
+'''
+Write an iterable of GameStates to path, one record each. Returns the number of positions written.
+'''
+def writePositions(path, states):
+	count = 0
+	with open(path, 'wb') as f:
+		for gs in states:
+			f.write(encodePosition(gs))
+			count += 1
+	return count
+
+
+class PositionFile():
+	'''
+	Read-only, memory-mapped view of a file written by writePositions. Nothing is read up front:
+	positions[i] decodes the i-th record and iterating streams them in order.
+	'''
+	def __init__(self, path, backend='list'):
+		self.backend = backend
+		self.file = open(path, 'rb')
+		self.file.seek(0, 2)
+		size = self.file.tell()
+		if size % RECORD_SIZE:
+			self.file.close()
+			raise ValueError('%s is not a position file (size %d is not a multiple of %d)' % (path, size, RECORD_SIZE))
+		self.count = size // RECORD_SIZE
+		self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+
+	def __len__(self):
+		return self.count
+
+	def __getitem__(self, i):
+		if i < 0:
+			i += self.count
+		if not 0 <= i < self.count:
+			raise IndexError('position index out of range')
+		return decodePosition(self.data, i * RECORD_SIZE, self.backend)
+
+	def __iter__(self):
+		for i in range(self.count):
+			yield decodePosition(self.data, i * RECORD_SIZE, self.backend)
+
+	'''
+	Iterate the tuples of decodeBoard -> cheaper than building GameStates when only the board is needed.
+	'''
+	def boards(self):
+		for i in range(self.count):
+			yield decodeBoard(self.data, i * RECORD_SIZE)
+
+	def close(self):
+		if isinstance(self.data, mmap.mmap):
+			self.data.close()
+		self.file.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+
+'''
+Stream GameStates from a text file with one FEN per line (blank lines and lines starting with # are skipped).
+'''
+def readFenFile(path, backend='list'):
+	with open(path) as f:
+		for line in f:
+			line = line.strip()
+			if line and not line.startswith('#'):
+				yield ChessEngine.GameState.fromFen(line, backend)
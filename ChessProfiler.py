@@ -0,0 +1,348 @@
+"""
+Opt-in profiling of the engine hot paths: call counts, total time and self time per function, per call stack.
+	- start() replaces the methods listed in TARGETS with timing wrappers on their classes, stop() puts the
+	  originals back -> while the profiler is off nothing is wrapped and the engine runs at full speed
+	- every thread keeps its own stack and counters, so the UI thread and the engine worker don't mix
+	- generators (generateStagedMoves) are timed while they run: every resume is a frame under whoever asked for the
+	  next move, counted as one call only the first time
+	- recursive calls (negamax, quiescenceSearch) are calls and frames of their own, so the stacks keep the recursion
+	  depth; their total time is only added up at the outermost call
+	- the self time of generateValidMoves is the legality filter (everything its generators don't account for)
+	- report()/writeJson() give the per-function numbers, writeCollapsed() one 'thread;caller;callee microseconds'
+	  line per stack for flamegraph.pl / speedscope
+Profile a perft or a search from the command line:
+	python ChessProfiler.py --perft 4 --collapsed perft.folded
+	python ChessProfiler.py --fen "<fen>" --search 5 --json search.json
+	python ChessProfiler.py --check 4      # profiled call counts of the recursive search against plain counters
+"""
+
+import argparse
+import contextlib
+import importlib
+import inspect
+import json
+import sys
+import threading
+import time
+
+#(module, class, methods) to wrap -> only methods a class defines itself are wrapped
+ENGINE_METHODS = ('getValidMoves', 'generateValidMoves', 'legalTargets', 'countValidMoves', 'getAllPossibleMoves',
+				  'getPawnMoves', 'getRookMoves', 'getKnightMoves', 'getBishopMoves', 'getQueenMoves', 'getKingMoves',
+				  'getEnpassantMoves', 'getCastleMoves', 'generateStagedMoves', 'getTacticalMoves', 'getQuietMoves',
+				  'hasLegalMove', 'isLegalMove', 'checkEvasionSquares', 'pinnedPieces', 'checkForPinsAndChecks',
+				  'isKingMoveIntoCheck', 'isEnpassantMoveIntoCheck', 'isUnderAttack', 'isAttacked',
+				  'isSquareAttacked', 'getAttackMaps', 'computeAttackMaps', 'attackersOf', 'attackedSquares',
+				  'playBits', 'takeBackBits', 'staticExchange', 'leastValuableAttacker', 'makeMove', 'undoMove',
+				  'pushMove', 'popMove')
+TARGETS = (
+	('ChessEngine', 'GameState', ENGINE_METHODS),
+	('ChessBitboard', 'BitboardGameState', ENGINE_METHODS),
+	('ChessEngine', 'Move', ('__init__',)),
+	('ChessAI', 'Searcher', ('search', 'negamax', 'quiescenceSearch', 'orderMoves')),
+)
+
+
+class ThreadData():
+	def __init__(self, name):
+		self.name = name
+		self.frames = [[(name,), None, 0.0, None]] # [stack path, function name, time spent in wrapped callees, function]
+		self.functions = {} # name -> [calls, total seconds, self seconds]
+		self.stacks = {} # stack path -> self seconds
+
+
+class Profiler():
+	def __init__(self):
+		self.active = False
+		self.originals = [] # (class, method name, original function) of the wrapped methods
+		self.local = threading.local()
+		self.threads = []
+		self.lock = threading.Lock()
+		self.started = None
+		self.elapsed = 0.0
+
+	'''
+	Wrap the TARGETS methods. moveFunctions of existing GameStates hold bound methods made when they were
+	created -> pass those states so they are refreshed too (new states pick up the wrappers by themselves).
+	'''
+	def start(self, *states):
+		if self.active:
+			return
+		for moduleName, className, methods in TARGETS:
+			cls = getattr(importlib.import_module(moduleName), className)
+			for name in methods:
+				if name in cls.__dict__:
+					original = cls.__dict__[name]
+					self.originals.append((cls, name, original))
+					setattr(cls, name, self.wrap('Move' if cls.__name__ == 'Move' else name, original))
+		self.active = True
+		self.started = time.perf_counter()
+		refreshMoveFunctions(states)
+
+	def stop(self, *states):
+		if not self.active:
+			return
+		for cls, name, original in reversed(self.originals):
+			setattr(cls, name, original)
+		self.originals = []
+		self.active = False
+		self.elapsed += time.perf_counter() - self.started
+		refreshMoveFunctions(states)
+
+	def reset(self):
+		with self.lock:
+			for data in self.threads:
+				data.functions.clear()
+				data.stacks.clear()
+		self.elapsed = 0.0
+		self.started = time.perf_counter()
+
+	def threadData(self):
+		try:
+			return self.local.data
+		except AttributeError:
+			data = self.local.data = ThreadData(threading.current_thread().name)
+			with self.lock:
+				self.threads.append(data)
+			return data
+
+	def wrap(self, name, function):
+		if inspect.isgeneratorfunction(function):
+			return self.wrapGenerator(name, function)
+		profiler = self
+		clock = time.perf_counter
+
+		def wrapper(*args, **kwargs):
+			data = profiler.threadData()
+			frames = data.frames
+			parent = frames[-1]
+			if parent[1] == name and parent[3] is not function: # an override calling super() -> one call, the outer one
+				return function(*args, **kwargs)
+			frame = [parent[0] + (name,), name, 0.0, function]
+			frames.append(frame)
+			start = clock()
+			try:
+				return function(*args, **kwargs)
+			finally:
+				profiler.finish(data, frame, parent, clock() - start)
+
+		wrapper.__name__ = function.__name__
+		wrapper.__doc__ = function.__doc__
+		wrapper.__wrapped__ = function
+		return wrapper
+
+	'''
+	Wrapper of a generator function: the generator only runs when the caller asks for its next item, so each resume
+	is timed as a frame of its own, on top of the caller's stack at that moment.
+	'''
+	def wrapGenerator(self, name, function):
+		profiler = self
+		clock = time.perf_counter
+
+		def wrapper(*args, **kwargs):
+			generator = function(*args, **kwargs)
+			calls = 1
+			while True:
+				data = profiler.threadData()
+				parent = data.frames[-1]
+				if parent[1] == name and parent[3] is not function: # resumed by an override -> its frame covers it
+					try:
+						item = next(generator)
+					except StopIteration:
+						return
+				else:
+					frame = [parent[0] + (name,), name, 0.0, function]
+					data.frames.append(frame)
+					start = clock()
+					try:
+						item = next(generator)
+					except StopIteration:
+						return
+					finally:
+						profiler.finish(data, frame, parent, clock() - start, calls)
+					calls = 0
+				yield item
+
+		wrapper.__name__ = function.__name__
+		wrapper.__doc__ = function.__doc__
+		wrapper.__wrapped__ = function
+		return wrapper
+
+	'''
+	Time a block of code that isn't a wrapped method (e.g. rendering) as if it were one: with profiler.section('render').
+	Does nothing while the profiler is off.
+	'''
+	@contextlib.contextmanager
+	def section(self, name):
+		if not self.active:
+			yield
+			return
+		data = self.threadData()
+		parent = data.frames[-1]
+		frame = [parent[0] + (name,), name, 0.0, None]
+		data.frames.append(frame)
+		start = time.perf_counter()
+		try:
+			yield
+		finally:
+			self.finish(data, frame, parent, time.perf_counter() - start)
+
+	'''
+	Pop a frame that took seconds and add them to its counters, its stack and the callee time of its parent.
+	calls is 0 for the later resumes of a generator. The total time of a recursive call is already part of the
+	outer call of the same function on the stack, so it is only added there.
+	'''
+	def finish(self, data, frame, parent, seconds, calls=1):
+		data.frames.pop()
+		parent[2] += seconds
+		selfSeconds = seconds - frame[2]
+		counters = data.functions.get(frame[1])
+		if counters is None:
+			counters = data.functions[frame[1]] = [0, 0.0, 0.0]
+		counters[0] += calls
+		if frame[1] not in parent[0]:
+			counters[1] += seconds
+		counters[2] += selfSeconds
+		data.stacks[frame[0]] = data.stacks.get(frame[0], 0.0) + selfSeconds
+
+	'''
+	{function: {calls, seconds, selfSeconds, microsecondsPerCall}} summed over all threads, most self time first.
+	'''
+	def report(self):
+		totals = {}
+		with self.lock:
+			for data in self.threads:
+				for name, (calls, seconds, selfSeconds) in list(data.functions.items()):
+					counters = totals.setdefault(name, [0, 0.0, 0.0])
+					counters[0] += calls
+					counters[1] += seconds
+					counters[2] += selfSeconds
+		ordered = sorted(totals.items(), key=lambda item: -item[1][2])
+		return {name: {'calls': calls, 'seconds': seconds, 'selfSeconds': selfSeconds,
+					   'microsecondsPerCall': seconds / calls * 1e6 if calls else 0.0}
+				for name, (calls, seconds, selfSeconds) in ordered}
+
+	def stacks(self):
+		merged = {}
+		with self.lock:
+			for data in self.threads:
+				for path, seconds in list(data.stacks.items()):
+					merged[path] = merged.get(path, 0.0) + seconds
+		return merged
+
+	def profiledSeconds(self):
+		return self.elapsed + (time.perf_counter() - self.started if self.active else 0.0)
+
+	def writeJson(self, path):
+		with open(path, 'w') as f:
+			json.dump({'seconds': self.profiledSeconds(), 'functions': self.report(),
+					   'stacks': {';'.join(stack): seconds for stack, seconds in self.stacks().items()}},
+					  f, indent=2)
+
+	'''
+	Collapsed stack format: one line per stack with its self time in microseconds as the sample count.
+	'''
+	def writeCollapsed(self, path):
+		with open(path, 'w') as f:
+			for stack, seconds in sorted(self.stacks().items()):
+				microseconds = int(seconds * 1e6)
+				if microseconds > 0:
+					f.write('%s %d\n' % (';'.join(stack), microseconds))
+
+	'''
+	Text lines of the `top` functions with the most self time, for an overlay or a terminal.
+	'''
+	def summary(self, top=5):
+		report = self.report()
+		seconds = self.profiledSeconds() or 1.0
+		return ['%-22s %5.1f%% %9d calls %8.2f us' % (name, 100 * result['selfSeconds'] / seconds, result['calls'],
+													 result['microsecondsPerCall'])
+				for name, result in list(report.items())[:top]]
+
+
+def refreshMoveFunctions(states):
+	for gs in states:
+		gs.moveFunctions = {'P': gs.getPawnMoves, 'R': gs.getRookMoves, 'N': gs.getKnightMoves,
+							'B': gs.getBishopMoves, 'Q': gs.getQueenMoves, 'K': gs.getKingMoves}
+
+
+'''
+Profile a search of gs while plain counters installed below the profiler's wrappers count the real calls of the
+recursive Searcher methods. Returns a line for every method whose profiled call count is different.
+'''
+def checkRecursiveCalls(gs, depth):
+	import ChessAI
+	methods = ('negamax', 'quiescenceSearch')
+	originals = {name: ChessAI.Searcher.__dict__[name] for name in methods}
+	counts = dict.fromkeys(methods, 0)
+
+	def counting(name, function):
+		def counter(*args, **kwargs):
+			counts[name] += 1
+			return function(*args, **kwargs)
+		return counter
+
+	for name in methods:
+		setattr(ChessAI.Searcher, name, counting(name, originals[name]))
+	profiler = Profiler()
+	profiler.start(gs)
+	try:
+		ChessAI.Searcher().search(gs, depth)
+	finally:
+		profiler.stop(gs)
+		for name, original in originals.items():
+			setattr(ChessAI.Searcher, name, original)
+	report = profiler.report()
+	failures = []
+	for name in methods:
+		profiled = report[name]['calls'] if name in report else 0
+		print('%-22s %9d calls profiled, %9d counted' % (name, profiled, counts[name]))
+		if profiled != counts[name]:
+			failures.append('%s: %d calls profiled, %d counted' % (name, profiled, counts[name]))
+	deepest = max(stack.count('quiescenceSearch') for stack in profiler.stacks())
+	print('deepest stack holds %d quiescenceSearch frames' % deepest)
+	return failures
+
+
+def main(argv=None):
+	import ChessAI
+	import ChessEngine
+	parser = argparse.ArgumentParser(description='Profile a perft or a search of the engine')
+	parser.add_argument('--fen', default=ChessEngine.START_FEN)
+	parser.add_argument('--backend', default='list', choices=('list', 'bitboard'))
+	work = parser.add_mutually_exclusive_group()
+	work.add_argument('--perft', type=int, default=None, metavar='DEPTH')
+	work.add_argument('--search', type=int, default=None, metavar='DEPTH')
+	work.add_argument('--check', type=int, default=None, metavar='DEPTH',
+					  help='check the call counts of a profiled search against plain counters, exit 1 if they differ')
+	parser.add_argument('--top', type=int, default=20, help='functions to list')
+	parser.add_argument('--json', help='write the report to this JSON file')
+	parser.add_argument('--collapsed', help='write collapsed stacks (flame graph input) to this file')
+	args = parser.parse_args(argv)
+
+	gs = ChessEngine.GameState.fromFen(args.fen, args.backend)
+	if args.check is not None:
+		failures = checkRecursiveCalls(gs, args.check)
+		for failure in failures:
+			print('FAIL: ' + failure)
+		return 1 if failures else 0
+	profiler = Profiler()
+	profiler.start(gs)
+	try:
+		if args.search is not None:
+			print(ChessAI.Searcher().search(gs, args.search))
+		else:
+			print('%d nodes' % gs.perft(args.perft if args.perft is not None else 3))
+	finally:
+		profiler.stop(gs)
+	print('%.3fs profiled' % profiler.profiledSeconds())
+	for line in profiler.summary(args.top):
+		print(line)
+	if args.json:
+		profiler.writeJson(args.json)
+	if args.collapsed:
+		profiler.writeCollapsed(args.collapsed)
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,195 @@
+"""
+Asyncio analysis server: clients send one JSON request per line over TCP (or a Unix socket) and get one JSON
+response per line, in the order the answers are ready (match them up with "id").
+	{"id": 1, "op": "moves", "fen": "..."}                       -> legal moves (UCI notation), checkmate, stalemate
+	{"id": 2, "op": "eval", "fen": "..."}                        -> static evaluation from the side to move
+	{"id": 3, "op": "bestmove", "fen": "...", "depth": 4, "movetime": 500}  -> search result
+	{"id": 4, "op": "stats"}                                     -> cache and request counters
+A missing "fen" means the start position. The event loop only parses and routes; the engine work runs in a
+process pool. Results are kept in an LRU cache keyed by (op, Zobrist key, options), and a request that is
+identical to one still being computed waits for that computation instead of starting another.
+	python ChessServer.py --port 8765 --workers 4
+"""
+
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+
+import ChessAI
+import ChessEngine
+import ChessEvaluation
+import ChessUCI
+
+OPS = ('moves', 'eval', 'bestmove')
+DEFAULT_DEPTH = 4
+MAX_DEPTH = 8
+MAX_MOVETIME = 10000 # ms
+
+_searcher = None # one per worker process, so its transposition table is reused between requests
+
+
+'''
+Runs in a worker process: the result dict of one request.
+'''
+def analyze(op, fen, depth, movetime):
+	global _searcher
+	gs = ChessEngine.GameState.fromFen(fen, 'bitboard')
+	if op == 'moves':
+		moves = gs.getValidMoves()
+		return {'moves': [move.getChessNotation() for move in moves], 'checkmate': gs.checkMate,
+				'stalemate': gs.staleMate}
+	if op == 'eval':
+		return {'score': ChessEvaluation.evaluate(gs)}
+	if _searcher is None:
+		_searcher = ChessAI.Searcher()
+	result = _searcher.search(gs, depth, movetime / 1000 if movetime else None)
+	if result is None:
+		return {'bestmove': None, 'checkmate': gs.checkMate, 'stalemate': gs.staleMate}
+	return {'bestmove': result.bestMove.getChessNotation(), 'score': ChessUCI.uciScore(result.score),
+			'depth': result.depth, 'nodes': result.nodes, 'pv': [move.getChessNotation() for move in result.pv]}
+
+
+class AnalysisServer():
+	def __init__(self, workers=None, cacheSize=4096, executor=None):
+		self.executor = executor or concurrent.futures.ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+		self.ownExecutor = executor is None
+		self.cache = collections.OrderedDict() # key -> result, least recently used first
+		self.cacheSize = cacheSize
+		self.pending = {} # key -> future of the computation in progress
+		self.stats = {'requests': 0, 'hits': 0, 'coalesced': 0, 'computed': 0, 'errors': 0}
+
+	'''
+	Response dict of one request dict. Never raises: a bad request, or a computation that failed in the worker
+	process (including a broken pool), gets {"error": ...}, so every request is answered exactly once.
+	'''
+	async def handleRequest(self, request):
+		self.stats['requests'] += 1
+		response = {'id': request.get('id')} if isinstance(request, dict) else {'id': None}
+		try:
+			response.update(await self.answer(request))
+		except (ValueError, TypeError, KeyError) as e:
+			self.stats['errors'] += 1
+			response['error'] = str(e)
+		except Exception as e: # raised by the engine in the worker or by the executor itself
+			self.stats['errors'] += 1
+			response['error'] = '%s: %s' % (type(e).__name__, e)
+		return response
+
+	async def answer(self, request):
+		if not isinstance(request, dict):
+			raise ValueError('a request has to be a JSON object')
+		op = request.get('op')
+		if op == 'stats':
+			return {'result': dict(self.stats, cached=len(self.cache), pending=len(self.pending))}
+		if op not in OPS:
+			raise ValueError('unknown op %r (expected one of %s)' % (op, ', '.join(OPS + ('stats',))))
+		fen = request.get('fen') or ChessEngine.START_FEN
+		depth = movetime = 0
+		if op == 'bestmove':
+			depth = min(max(int(request.get('depth', DEFAULT_DEPTH)), 1), MAX_DEPTH)
+			movetime = min(max(int(request.get('movetime', 0)), 0), MAX_MOVETIME)
+		gs = ChessEngine.GameState.fromFen(fen, 'bitboard') # validates the FEN and gives the hash key
+		key = (op, gs.zobristKey, depth, movetime)
+		result = self.cache.get(key)
+		if result is not None:
+			self.cache.move_to_end(key)
+			self.stats['hits'] += 1
+			return {'result': result, 'cached': True}
+		future = self.pending.get(key)
+		if future is not None:
+			self.stats['coalesced'] += 1
+			return {'result': await asyncio.shield(future), 'cached': True}
+		future = asyncio.get_running_loop().run_in_executor(self.executor, analyze, op, fen, depth, movetime)
+		self.pending[key] = future
+		try:
+			result = await asyncio.shield(future) # a client hanging up must not cancel the others' answer
+		finally:
+			del self.pending[key]
+		self.stats['computed'] += 1
+		self.cache[key] = result
+		if len(self.cache) > self.cacheSize:
+			self.cache.popitem(last=False)
+		return {'result': result, 'cached': False}
+
+	async def handleClient(self, reader, writer):
+		writeLock = asyncio.Lock()
+		tasks = set()
+
+		async def respond(line):
+			try:
+				request = json.loads(line)
+			except ValueError:
+				self.stats['requests'] += 1
+				self.stats['errors'] += 1
+				response = {'id': None, 'error': 'invalid JSON'}
+			else:
+				response = await self.handleRequest(request)
+			async with writeLock:
+				writer.write((json.dumps(response) + '\n').encode())
+				await writer.drain()
+
+		try:
+			while True:
+				line = await reader.readline()
+				if not line:
+					break
+				if line.strip():
+					task = asyncio.ensure_future(respond(line)) # requests of one connection can overlap
+					tasks.add(task)
+					task.add_done_callback(tasks.discard)
+			if tasks:
+				await asyncio.gather(*tasks, return_exceptions=True)
+		except (ValueError, ConnectionError): # line over the stream limit or connection reset
+			pass
+		finally:
+			for task in tasks:
+				task.cancel()
+			writer.close()
+
+	'''
+	Start listening on a Unix socket if path is given, on host:port otherwise (port 0 picks a free port).
+	Returns the asyncio Server.
+	'''
+	async def start(self, host='127.0.0.1', port=8765, path=None):
+		if path is not None:
+			return await asyncio.start_unix_server(self.handleClient, path)
+		return await asyncio.start_server(self.handleClient, host, port)
+
+	def close(self):
+		if self.ownExecutor:
+			self.executor.shutdown()
+
+
+async def serve(args):
+	server = AnalysisServer(args.workers, args.cache)
+	try:
+		listener = await server.start(args.host, args.port, args.unix)
+		where = args.unix or '%s:%d' % listener.sockets[0].getsockname()[:2]
+		print('serving on %s with %d workers' % (where, args.workers or os.cpu_count()), flush=True)
+		async with listener:
+			await listener.serve_forever()
+	finally:
+		server.close()
+
+
+def main(argv=None):
+	parser = argparse.ArgumentParser(description='JSON lines analysis server')
+	parser.add_argument('--host', default='127.0.0.1')
+	parser.add_argument('--port', type=int, default=8765)
+	parser.add_argument('--unix', help='listen on this Unix socket path instead of TCP')
+	parser.add_argument('--workers', type=int, default=None, help='worker processes (default: one per CPU)')
+	parser.add_argument('--cache', type=int, default=4096, help='results kept in the LRU cache')
+	args = parser.parse_args(argv)
+	try:
+		asyncio.run(serve(args))
+	except KeyboardInterrupt:
+		pass
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,113 @@
+"""
+Batched conversion of positions into NumPy arrays for training pipelines (needs numpy).
+	- planes: uint8 array (N, 13, 8, 8): one plane per piece in PLANE_PIECES order (1 where that piece stands)
+	  and a last plane of ones when white is to move
+	- legal move masks: uint8 array (N, 4096), entry moveIndex(move) = from_square * 64 + to_square is 1 for
+	  every move returned by getValidMoves (row*8 + col square numbering, same as the rest of the engine);
+	  the four promotions of a pawn share one entry
+The boards of a whole batch are turned into one byte string and converted in a single vectorized pass.
+"""
+
+import itertools
+
+import numpy as np
+
+import ChessPositions
+
+PLANE_PIECES = ('wP', 'wN', 'wB', 'wR', 'wQ', 'wK', 'bP', 'bN', 'bB', 'bR', 'bQ', 'bK')
+PLANES = len(PLANE_PIECES) + 1
+MOVE_INDICES = 64 * 64
+
+#piece code (index into PLANE_PIECES, 12 for an empty square) from the two bytes of a square string
+_COLOR_OFFSETS = np.zeros(256, dtype=np.int16)
+_COLOR_OFFSETS[ord('b')] = 6
+_COLOR_OFFSETS[ord('-')] = 12
+_PIECE_OFFSETS = np.zeros(256, dtype=np.int16)
+for _i, _name in enumerate('PNBRQK'):
+	_PIECE_OFFSETS[ord(_name)] = _i
+#same for the 4 bit codes of ChessPositions records (0 = empty)
+_RECORD_CODES = np.full(16, 12, dtype=np.int16)
+for _piece, _code in ChessPositions.PIECE_CODES.items():
+	_RECORD_CODES[_code] = PLANE_PIECES.index(_piece)
+
+
+def moveIndex(move):
+	return (move.startRow * 8 + move.startCol) * 64 + move.endRow * 8 + move.endCol
+
+
+'''
+(N, 64) array of piece codes (0-11 as in PLANE_PIECES, 12 empty) -> (N, 13, 8, 8) planes
+'''
+def planesFromCodes(codes, whiteToMove):
+	n = codes.shape[0]
+	planes = np.zeros((n, PLANES, 64), dtype=np.uint8)
+	planes[:, :12, :] = codes[:, None, :] == np.arange(12, dtype=np.int16)[None, :, None]
+	planes[:, 12, :] = np.asarray(whiteToMove, dtype=np.uint8)[:, None]
+	return planes.reshape(n, PLANES, 8, 8)
+
+
+'''
+Piece planes of a list of GameStates.
+'''
+def encodeBoards(states):
+	if not states:
+		return np.zeros((0, PLANES, 8, 8), dtype=np.uint8)
+	squares = ''.join(''.join(''.join(row) for row in gs.board) for gs in states).encode('ascii')
+	raw = np.frombuffer(squares, dtype=np.uint8).reshape(len(states), 64, 2)
+	codes = _COLOR_OFFSETS[raw[:, :, 0]] + _PIECE_OFFSETS[raw[:, :, 1]]
+	codes[codes > 12] = 12 # '--' -> empty
+	return planesFromCodes(codes, [gs.whiteToMove for gs in states])
+
+
+'''
+Legal move masks of a list of GameStates (getValidMoves is called once per position).
+'''
+def encodeLegalMoves(states):
+	rows, columns = [], []
+	for i, gs in enumerate(states):
+		checkMate, staleMate = gs.checkMate, gs.staleMate
+		for move in gs.getValidMoves():
+			rows.append(i)
+			columns.append(moveIndex(move))
+		gs.checkMate, gs.staleMate = checkMate, staleMate
+	masks = np.zeros((len(states), MOVE_INDICES), dtype=np.uint8)
+	masks[rows, columns] = 1
+	return masks
+
+
+'''
+(planes, masks) of a batch of GameStates. masks is None when legalMoves is False.
+'''
+def encodePositions(states, legalMoves=True):
+	states = list(states)
+	return encodeBoards(states), (encodeLegalMoves(states) if legalMoves else None)
+
+
+'''
+Split any iterable (e.g. a generator reading a file) of GameStates into batches and encode them one at a time.
+'''
+def encodeStream(states, batchSize=1024, legalMoves=True):
+	states = iter(states)
+	while True:
+		batch = list(itertools.islice(states, batchSize))
+		if not batch:
+			return
+		yield encodePositions(batch, legalMoves)
+
+
+'''
+Piece planes straight from ChessPositions records (e.g. PositionFile.data) without making any GameState:
+the occupancy bits and 4 bit piece codes of every record are unpacked with array operations.
+'''
+def encodeRecords(data, start=0, count=None):
+	records = np.frombuffer(data, dtype=np.uint8).reshape(-1, ChessPositions.RECORD_SIZE)
+	records = records[start:] if count is None else records[start:start + count]
+	n = records.shape[0]
+	occupancy = np.unpackbits(records[:, :8], axis=1)[:, ::-1].astype(bool) # column i <-> square i (big endian)
+	nibbles = np.empty((n, 32), dtype=np.uint8)
+	nibbles[:, 0::2] = records[:, 8:24] >> 4
+	nibbles[:, 1::2] = records[:, 8:24] & 15
+	rank = np.cumsum(occupancy, axis=1) - 1 # k-th occupied square gets the k-th piece code
+	pieceCodes = np.take_along_axis(nibbles, np.clip(rank, 0, 31), axis=1)
+	codes = np.where(occupancy, _RECORD_CODES[pieceCodes], 12)
+	return planesFromCodes(codes, (records[:, 24] & 1) == 0)
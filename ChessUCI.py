@@ -0,0 +1,313 @@
+"""
+Headless UCI (Universal Chess Interface) front end: reads commands on stdin and answers on stdout, so the engine
+runs under tournament managers (cutechess-cli, Arena, ...) and scripts without a display.
+	- uci, isready, ucinewgame, setoption, position [startpos | fen <fen>] [moves ...], go, stop, ponderhit, quit
+	- go wtime/btime/winc/binc/movestogo/movetime/depth/infinite, the clock is turned into one time limit per move
+	- go perft <depth> (or perft <depth>) prints the node count of every root move and the total
+	- the Book File and Endgame Tables options (see ChessBook.py) answer go without searching when they know a move
+Only ChessEngine and ChessAI are imported (no pygame), so the process is ready in a few tens of milliseconds
+(python ChessBenchmark.py uci measures it); ChessBook is only imported once one of its options is set. The search runs on one thread per process and nothing is shared
+between processes; lower the Hash option to fit many engines on one host.
+	python ChessUCI.py
+"""
+
+import sys
+import threading
+import time
+
+import ChessAI
+import ChessEngine
+
+ENGINE_NAME = 'Chess'
+ENGINE_AUTHOR = 'itsnotHan'
+
+#approximate bytes per transposition table entry once it is filled (one slot in each list plus the int objects)
+TT_ENTRY_BYTES = 96
+#name -> (UCI type, default, min/choices, max)
+OPTIONS = {
+	'Hash': ('spin', 8, 1, 1024), # MB
+	'Move Overhead': ('spin', 50, 0, 5000), # ms kept back for the GUI and the pipes
+	'Backend': ('combo', 'bitboard', ('list', 'bitboard'), None),
+	'Book File': ('string', '', None, None),
+	'Endgame Tables': ('string', '', None, None), # directory of the table files
+}
+
+DEFAULT_MOVES_TO_GO = 30 # sudden death: assume the game lasts this many more moves
+MAX_TIME_FRACTION = 0.5 # never spend more than this part of the remaining clock on one move
+MIN_TIME = 0.01
+GO_KEYWORDS = ('searchmoves', 'ponder', 'wtime', 'btime', 'winc', 'binc', 'movestogo', 'depth', 'nodes', 'mate',
+			   'movetime', 'infinite')
+
+
+'''
+Seconds to think for one move with remaining seconds on the clock, the increment per move and movesToGo moves
+until the next time control (None for sudden death). overhead seconds are kept back for the communication.
+'''
+def allocateTime(remaining, increment=0.0, movesToGo=None, overhead=0.05):
+	budget = remaining / (movesToGo or DEFAULT_MOVES_TO_GO) + increment * 0.75
+	budget = min(budget, remaining * MAX_TIME_FRACTION)
+	return max(MIN_TIME, budget - overhead)
+
+
+'''
+UCI score of a search score: 'cp <centipawns>' or 'mate <moves>' (negative when the side to move gets mated).
+'''
+def uciScore(score):
+	if score > ChessAI.MATE_BOUND:
+		return 'mate %d' % ((ChessAI.CHECKMATE - score + 1) // 2)
+	if score < -ChessAI.MATE_BOUND:
+		return 'mate %d' % -((ChessAI.CHECKMATE + score) // 2)
+	return 'cp %d' % score
+
+
+class UciEngine():
+	def __init__(self, output=None):
+		self.output = output or sys.stdout
+		self.outputLock = threading.Lock() # the search thread writes info lines while the main thread answers
+		self.options = {name: option[1] for name, option in OPTIONS.items()}
+		self.searcher = None # made on the first search, after the GUI had a chance to set the Hash size
+		self.lookup = None # ChessBook.Lookup of the Book File and Endgame Tables options
+		self.moveCache = ChessEngine.MoveCache(1 << 12) # every position command replays the game from the start
+		self.gs = ChessEngine.GameState(backend=self.options['Backend'])
+		self.thread = None
+		self.stopEvent = threading.Event()
+		self.infinite = False
+
+	def send(self, line):
+		with self.outputLock:
+			self.output.write(line + '\n')
+			self.output.flush()
+
+	'''
+	Handle one command line. Returns False after quit.
+	'''
+	def handle(self, line):
+		tokens = line.split()
+		if not tokens:
+			return True
+		command, args = tokens[0], tokens[1:]
+		if command == 'uci':
+			self.send('id name %s' % ENGINE_NAME)
+			self.send('id author %s' % ENGINE_AUTHOR)
+			for name, (kind, default, low, high) in OPTIONS.items():
+				if kind == 'spin':
+					self.send('option name %s type spin default %d min %d max %d' % (name, default, low, high))
+				elif kind == 'string':
+					self.send('option name %s type string default %s' % (name, default or '<empty>'))
+				else:
+					self.send('option name %s type combo default %s %s' % (
+						name, default, ' '.join('var ' + choice for choice in low)))
+			self.send('uciok')
+		elif command == 'isready':
+			self.send('readyok')
+		elif command == 'setoption':
+			self.stopSearch()
+			self.setOption(args)
+		elif command == 'ucinewgame':
+			self.stopSearch()
+			if self.searcher is not None:
+				self.searcher.tt.clear()
+			self.moveCache.clear()
+			self.gs = ChessEngine.GameState(backend=self.options['Backend'])
+		elif command == 'position':
+			self.stopSearch()
+			self.setPosition(args)
+		elif command == 'go':
+			self.stopSearch()
+			if args[:1] == ['perft']:
+				self.perft(args[1:])
+			else:
+				self.go(args)
+		elif command == 'perft':
+			self.stopSearch()
+			self.perft(args)
+		elif command in ('stop', 'ponderhit'): # pondering isn't offered -> a ponder search ends like an infinite one
+			self.stopSearch()
+		elif command == 'quit':
+			self.stopSearch()
+			return False
+		elif command != 'debug' and command != 'register':
+			self.send('info string unknown command %s' % command)
+		return True
+
+	'''
+	setoption name <name with spaces> [value <value>]
+	'''
+	def setOption(self, args):
+		if 'name' not in args:
+			return
+		valueAt = args.index('value') if 'value' in args else len(args)
+		name = ' '.join(args[args.index('name') + 1:valueAt])
+		value = ' '.join(args[valueAt + 1:])
+		match = [key for key in OPTIONS if key.lower() == name.lower()]
+		if not match:
+			self.send('info string unknown option %s' % name)
+			return
+		name = match[0]
+		kind, _, low, high = OPTIONS[name]
+		if kind == 'spin':
+			try:
+				self.options[name] = min(max(int(value), low), high)
+			except ValueError:
+				self.send('info string bad value %s for %s' % (value, name))
+				return
+		elif kind == 'string':
+			self.options[name] = '' if value == '<empty>' else value
+		elif value in low:
+			self.options[name] = value
+		else:
+			self.send('info string bad value %s for %s' % (value, name))
+			return
+		if name == 'Hash':
+			self.searcher = None # reallocated with the new size by the next search
+		elif name == 'Backend':
+			self.gs = ChessEngine.GameState.fromFen(self.gs.toFen(), value)
+		elif kind == 'string':
+			self.openLookup()
+
+	def openLookup(self):
+		import ChessBook
+		if self.lookup is not None:
+			self.lookup.close()
+		bookPath, tablesPath = self.options['Book File'] or None, self.options['Endgame Tables'] or None
+		try:
+			self.lookup = ChessBook.openLookup(bookPath, tablesPath)
+		except (OSError, ValueError) as e:
+			self.lookup = None
+			self.send('info string %s' % e)
+			return
+		if bookPath and (self.lookup is None or self.lookup.book is None):
+			self.send('info string no book file %s' % bookPath)
+		if tablesPath and (self.lookup is None or self.lookup.tables is None):
+			self.send('info string no endgame tables in %s' % tablesPath)
+
+	'''
+	position startpos [moves ...] | position fen <6 fields> [moves ...]
+	'''
+	def setPosition(self, args):
+		movesAt = args.index('moves') if 'moves' in args else len(args)
+		backend = self.options['Backend']
+		try:
+			if args[:1] == ['fen']:
+				gs = ChessEngine.GameState.fromFen(' '.join(args[1:movesAt]), backend)
+			else:
+				gs = ChessEngine.GameState(backend=backend)
+		except ValueError as e:
+			self.send('info string bad fen: %s' % e)
+			return
+		gs.moveCache = self.moveCache
+		for notation in args[movesAt + 1:]:
+			move = next((move for move in gs.getValidMoves() if move.getChessNotation() == notation), None)
+			if move is None:
+				self.send('info string illegal move %s' % notation)
+				break
+			gs.pushMove(move)
+		gs.moveCache = None # the search visits far too many positions to cache them
+		self.gs = gs
+
+	def go(self, args):
+		limits = {}
+		i = 0
+		while i < len(args):
+			if args[i] in ('infinite', 'ponder'):
+				limits[args[i]] = True
+				i += 1
+			elif args[i] == 'searchmoves': # not supported, the moves up to the next keyword are skipped
+				i += 1
+				while i < len(args) and args[i] not in GO_KEYWORDS:
+					i += 1
+			else:
+				try:
+					limits[args[i]] = int(args[i + 1])
+				except (IndexError, ValueError):
+					pass
+				i += 2
+		maxDepth = min(limits.get('depth', ChessAI.MAX_DEPTH), ChessAI.MAX_DEPTH)
+		self.infinite = 'infinite' in limits or 'ponder' in limits
+		timeLimit = None
+		if not self.infinite:
+			overhead = self.options['Move Overhead'] / 1000
+			if 'movetime' in limits:
+				timeLimit = max(MIN_TIME, limits['movetime'] / 1000 - overhead)
+			else:
+				clock, increment = ('wtime', 'winc') if self.gs.whiteToMove else ('btime', 'binc')
+				if clock in limits:
+					timeLimit = allocateTime(limits[clock] / 1000, limits.get(increment, 0) / 1000,
+											 limits.get('movestogo'), overhead)
+		found = self.lookup.probe(self.gs) if self.lookup is not None and not self.infinite else None
+		if found is not None: # book or endgame table move -> answered right away
+			move, score = found
+			self.send('info depth 0 score %s pv %s' % (uciScore(score), move.getChessNotation()))
+			self.send('bestmove %s' % move.getChessNotation())
+			return
+		if self.searcher is None:
+			self.searcher = ChessAI.Searcher(self.options['Hash'] * (1 << 20) // TT_ENTRY_BYTES)
+		self.stopEvent.clear()
+		self.thread = threading.Thread(target=self.search, args=(maxDepth, timeLimit), name='UciSearch', daemon=True)
+		self.thread.start()
+
+	def search(self, maxDepth, timeLimit):
+		def onIteration(result):
+			self.send('info depth %d score %s nodes %d nps %d time %d pv %s' % (
+				result.depth, uciScore(result.score), result.nodes, result.nps, result.seconds * 1000,
+				' '.join(move.getChessNotation() for move in result.pv)))
+		result = self.searcher.search(self.gs, maxDepth, timeLimit, onIteration)
+		if self.infinite: # the GUI expects bestmove only after stop, even if the search ended on its own
+			self.stopEvent.wait()
+		self.send('bestmove %s' % (result.bestMove.getChessNotation() if result is not None else '0000'))
+
+	'''
+	Stop a running search and wait for its bestmove, so commands are always handled against an idle engine.
+	'''
+	def stopSearch(self):
+		if self.thread is None:
+			return
+		self.searcher.stop()
+		self.stopEvent.set()
+		self.thread.join()
+		self.thread = None
+
+	def perft(self, args):
+		try:
+			depth = int(args[0])
+		except (IndexError, ValueError):
+			self.send('info string perft needs a depth')
+			return
+		start = time.perf_counter()
+		if depth < 1:
+			counts = {}
+			total = 1
+		else:
+			counts = self.gs.divide(depth)
+			total = sum(counts.values())
+		seconds = time.perf_counter() - start
+		for notation, nodes in counts.items():
+			self.send('%s: %d' % (notation, nodes))
+		self.send('')
+		self.send('Nodes searched: %d' % total)
+		self.send('info string perft %d nodes in %.3fs, %.0f nodes/sec' % (
+			total, seconds, total / seconds if seconds > 0 else 0))
+
+	'''
+	Read commands until quit or the end of the input.
+	'''
+	def loop(self, lines=None):
+		lines = lines or sys.stdin
+		while True:
+			line = lines.readline()
+			if not line:
+				break
+			if not self.handle(line):
+				return
+		if self.thread is not None and not self.infinite: # input ended (e.g. a script) -> let the search finish
+			self.thread.join()
+		self.stopSearch()
+
+
+def main():
+	UciEngine().loop()
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main())
@@ -0,0 +1,121 @@
+"""
+Engine work off the UI thread. EngineWorker runs jobs on a daemon thread against a copy of the position
+(GameState.snapshot) and posts the results on a queue that the event loop polls without ever blocking.
+	- 'moves': the valid moves of the position (and its checkMate/staleMate flags)
+	- 'search': AI move selection, the SearchResult of Searcher.search (or of the book/endgame table lookup, if any)
+	- 'analysis': a search that also posts every completed depth as a non-final result
+cancel() (e.g. on undo) drops the queued jobs, stops a running search and makes sure nothing computed for the
+cancelled jobs is delivered. The thread shares the GIL with the UI, but a frame needs only a few milliseconds
+of it, so the window keeps its frame rate while the engine searches.
+"""
+
+import queue
+import threading
+
+import ChessAI
+import ChessEngine
+
+
+class EngineResult():
+	def __init__(self, jobId, generation, kind, key, value, final=True):
+		self.jobId = jobId
+		self.generation = generation
+		self.kind = kind # 'moves', 'search' or 'analysis'
+		self.key = key # Zobrist key of the position the job was submitted for
+		self.value = value # (moves, checkMate, staleMate) for 'moves', a SearchResult (or None) otherwise
+		self.final = final # False for the intermediate depths of an analysis
+
+	def __repr__(self):
+		return 'EngineResult(job %d, %s%s)' % (self.jobId, self.kind, '' if self.final else ', partial')
+
+
+class EngineWorker():
+	def __init__(self, searcher=None, lookup=None):
+		self.searcher = searcher or ChessAI.Searcher()
+		self.lookup = lookup # ChessBook.Lookup asked before every 'search' job
+		self.moveCache = ChessEngine.MoveCache(1 << 10) # undo and redo ask for the moves of recent positions again
+		self.jobs = queue.Queue()
+		self.results = queue.Queue()
+		self.lock = threading.Lock()
+		self.generation = 0 # bumped by cancel() -> older jobs and their results are dropped
+		self.nextJobId = 0
+		self.thread = threading.Thread(target=self.run, name='EngineWorker', daemon=True)
+		self.thread.start()
+
+	'''
+	Queue a job for the current position of gs and return its id. Only the snapshot is sent, so gs can be
+	changed right away.
+	'''
+	def submit(self, kind, gs, **options):
+		with self.lock:
+			self.nextJobId += 1
+			job = (self.nextJobId, self.generation, kind, gs.snapshot(), gs.zobristKey, options)
+		self.jobs.put(job)
+		return job[0]
+
+	def requestMoves(self, gs):
+		return self.submit('moves', gs)
+
+	def requestSearch(self, gs, timeLimit=None, maxDepth=ChessAI.MAX_DEPTH):
+		return self.submit('search', gs, timeLimit=timeLimit, maxDepth=maxDepth)
+
+	'''
+	Search without a time limit until cancel() (or maxDepth), posting a result after every depth.
+	'''
+	def requestAnalysis(self, gs, maxDepth=ChessAI.MAX_DEPTH):
+		return self.submit('analysis', gs, timeLimit=None, maxDepth=maxDepth)
+
+	def cancel(self):
+		with self.lock:
+			self.generation += 1
+		self.searcher.stop()
+
+	'''
+	Results posted since the last call, oldest first (never blocks). Results of cancelled jobs are left out.
+	'''
+	def poll(self):
+		results = []
+		while True:
+			try:
+				result = self.results.get_nowait()
+			except queue.Empty:
+				return results
+			if result.generation == self.generation:
+				results.append(result)
+
+	def isCancelled(self, generation):
+		return generation != self.generation
+
+	def close(self, timeout=1.0):
+		self.cancel()
+		self.jobs.put(None)
+		self.thread.join(timeout)
+		if self.lookup is not None and not self.thread.is_alive():
+			self.lookup.close()
+
+	def run(self):
+		while True:
+			job = self.jobs.get()
+			if job is None:
+				return
+			jobId, generation, kind, snapshot, key, options = job
+			if self.isCancelled(generation):
+				continue
+			gs = ChessEngine.GameState.fromSnapshot(snapshot)
+			if kind == 'moves':
+				gs.moveCache = self.moveCache
+				moves = gs.getValidMoves()
+				value = (moves, gs.checkMate, gs.staleMate)
+			else:
+				found = self.lookup.probe(gs) if kind == 'search' and self.lookup is not None else None
+				if found is not None: # book move or endgame table move, nothing to search
+					value = ChessAI.SearchResult(found[0], found[1], 0, 0, 0.0, [found[0]])
+				else:
+					def onIteration(result):
+						if self.isCancelled(generation): # cancelled before the search had started -> stop() was missed
+							self.searcher.stop()
+						elif kind == 'analysis':
+							self.results.put(EngineResult(jobId, generation, kind, key, result, final=False))
+					value = self.searcher.search(gs, options['maxDepth'], options['timeLimit'], onIteration)
+			if not self.isCancelled(generation):
+				self.results.put(EngineResult(jobId, generation, kind, key, value))